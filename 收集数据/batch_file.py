@@ -0,0 +1,78 @@
+import json
+
+# 批量任务中每个请求调用的接口
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+def batch_custom_id(table_name, seed):
+    """批量任务的 custom_id：数据表名 + 用例种子（同一表内唯一，可据此复现用例）"""
+    return f"{table_name}-seed-{seed}"
+
+
+def write_batch_requests(path, requests):
+    """
+    写出 OpenAI 格式的批量请求文件（JSONL，每行一个请求）
+
+    参数:
+        path: 输出文件路径
+        requests: [(custom_id, 预编码的请求体bytes), ...]
+
+    返回: 写出的请求数
+    """
+    count = 0
+    with open(path, 'wb') as f:
+        for custom_id, body in requests:
+            head = json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT}, ensure_ascii=False)
+            # 请求体已是JSON字节，直接拼接为 body 字段，不再重新序列化
+            f.write(head[:-1].encode('utf-8') + b', "body": ' + body + b'}\n')
+            count += 1
+    return count
+
+
+def read_batch_results(path):
+    """
+    逐行读取 OpenAI 格式的批量结果文件
+
+    每行格式: {"custom_id": ..., "response": {"status_code": 200, "body": {...}}, "error": null}
+
+    返回: 生成器，每项为 dict
+        line: 行号
+        custom_id: 请求ID（无法解析时为None）
+        content: 回答文本（失败时为None）
+        usage: 原始 usage 字典（可能为None）
+        error: 失败原因（成功时为None）
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = {'line': line_number, 'custom_id': None, 'content': None, 'usage': None, 'error': None}
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                item['error'] = "无法解析的行"
+                yield item
+                continue
+            if not isinstance(record, dict):
+                item['error'] = "无法解析的行"
+                yield item
+                continue
+
+            item['custom_id'] = record.get('custom_id')
+            response = record.get('response') or {}
+            body = response.get('body') or {}
+            if record.get('error'):
+                error = record['error']
+                item['error'] = error.get('message', str(error)) if isinstance(error, dict) else str(error)
+            elif response.get('status_code') != 200:
+                message = (body.get('error') or {}).get('message', '') if isinstance(body, dict) else ''
+                item['error'] = f"HTTP {response.get('status_code')}: {message[:100]}"
+            else:
+                item['usage'] = body.get('usage')
+                choices = body.get('choices') or []
+                if choices:
+                    item['content'] = (choices[0].get('message') or {}).get('content')
+                if not item['content']:
+                    item['error'] = "空内容"
+            yield item
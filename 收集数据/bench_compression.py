@@ -0,0 +1,134 @@
+import asyncio
+import statistics
+import sys
+import time
+
+import aiohttp
+
+from request_compression import SUPPORTED_ENCODINGS, RequestCompressor, compress_body, zstandard
+from run_batch_test import (
+    COMPRESSION_LEVELS, DEFAULT_BASE_PATTERN, DEFAULT_NEEDLE_RANGE, DEFAULT_RANDOM_OFFSET_RATIO, REQUEST_FIELDS,
+    get_body_template, plan_test_case,
+)
+from standin_server import STANDIN_PROFILES, StandInServer
+
+DEFAULT_LENGTHS = [230000, 1000000, 2000000]  # 默认测试的基础文本长度
+DEFAULT_UPLINK_MBPS = 100   # 默认上行带宽（Mbps），用于估算上传耗时
+DEFAULT_INSERTIONS = 150    # 插针数量
+REPEAT = 5                  # 每种配置重复压缩次数（取平均）
+STANDIN_REPEAT = 5          # --standin 时每种配置发送的请求数
+
+
+def build_body(length, seed=0):
+    plan = plan_test_case(length, DEFAULT_INSERTIONS, DEFAULT_BASE_PATTERN, DEFAULT_NEEDLE_RANGE, None,
+                          DEFAULT_RANDOM_OFFSET_RATIO, seed=seed)
+    return get_body_template(length, DEFAULT_BASE_PATTERN, None, REQUEST_FIELDS).build(plan['insertions'])
+
+
+def measure(body, encoding, level):
+    """返回 (压缩后字节数, 平均压缩耗时秒)"""
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        data = compress_body(body, encoding, level)
+    return len(data), (time.perf_counter() - start) / REPEAT
+
+
+async def send_timed(session, url, body, encoding):
+    """
+    压缩（encoding 为None时不压缩）并发送一次请求，读完整个响应
+
+    返回: (端到端耗时秒, 发送字节数)
+    """
+    start = time.perf_counter()
+    headers = {'Content-Type': 'application/json'}
+    data = body
+    if encoding is not None:
+        level = RequestCompressor(encoding, COMPRESSION_LEVELS[encoding]).level_for(len(body))
+        data = compress_body(body, encoding, level)
+        headers['Content-Encoding'] = encoding
+    async with session.post(url, data=data, headers=headers) as response:
+        await response.read()
+        if response.status != 200:
+            raise RuntimeError(f"替身服务返回 HTTP {response.status}")
+    return time.perf_counter() - start, len(data)
+
+
+async def run_standin(lengths, uplink_mbps, encodings):
+    """
+    对本地替身服务（按上行带宽限速读取请求体、服务端解压）实际发送压缩和不压缩的请求体，
+    测量端到端耗时（压缩 + 上传 + 服务端解压 + 读完响应），压缩级别为当前配置
+    """
+    server = StandInServer(dict(STANDIN_PROFILES['perfect'], upload_mbps=uplink_mbps), seed=0)
+    url = await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            for length in lengths:
+                body = build_body(length)
+                print(f"\n基础文本长度 {length}（请求体 {len(body)} 字节，每种配置 {STANDIN_REPEAT} 个请求）:")
+                baseline = None
+                for encoding in [None] + encodings:
+                    latencies = []
+                    for _ in range(STANDIN_REPEAT):
+                        elapsed, size = await send_timed(session, url, body, encoding)
+                        latencies.append(elapsed)
+                    median = statistics.median(latencies)
+                    if baseline is None:
+                        baseline = median
+                    name = encoding or '不压缩'
+                    print(f"  {name:<8} 发送 {size:>9} 字节, 端到端耗时 平均 {statistics.mean(latencies) * 1000:8.1f}毫秒 / "
+                          f"P50 {median * 1000:8.1f}毫秒 ({median / baseline:.2f}x)")
+    finally:
+        await server.stop()
+    server.print_report()
+
+
+def main():
+    """
+    使用方法: python bench_compression.py [长度1,长度2,...] [上行带宽Mbps] [--standin]
+    对比不同请求体大小下各压缩编码/级别的发送字节数、压缩耗时，以及按上行带宽估算的上传耗时
+    （上传耗时 = 压缩耗时 + 发送字节数 / 带宽；并发请求共享带宽时差距更大）
+    --standin: 改为对本地替身服务实际发送请求，测量压缩与不压缩的端到端耗时（替身服务按上行带宽限速读取请求体）
+    """
+    args = [arg for arg in sys.argv[1:] if arg != '--standin']
+    try:
+        lengths = [int(x) for x in args[0].split(',')] if args else DEFAULT_LENGTHS
+        uplink_mbps = float(args[1]) if len(args) > 1 else DEFAULT_UPLINK_MBPS
+        if not lengths or min(lengths) <= 0 or uplink_mbps <= 0:
+            raise ValueError
+    except ValueError:
+        print("错误: 长度必须是逗号分隔的正整数，带宽必须大于0")
+        sys.exit(1)
+
+    bytes_per_second = uplink_mbps * 1000000 / 8
+    encodings = [encoding for encoding in SUPPORTED_ENCODINGS if encoding != 'zstd' or zstandard is not None]
+
+    print("=" * 70)
+    print("请求体压缩基准测试" + ("（本地替身服务，实测端到端耗时）" if '--standin' in sys.argv else ""))
+    print("=" * 70)
+    print(f"上行带宽: {uplink_mbps:g} Mbps")
+    if zstandard is None:
+        print("未安装 zstandard，跳过 zstd")
+
+    if '--standin' in sys.argv:
+        asyncio.run(run_standin(lengths, uplink_mbps, encodings))
+        print("=" * 70)
+        return
+
+    for length in lengths:
+        body = build_body(length)
+        print(f"\n基础文本长度 {length}（请求体 {len(body)} 字节）:")
+        print(f"  {'不压缩':<12} 发送 {len(body):>9} 字节, 上传约 {len(body) / bytes_per_second * 1000:8.1f}毫秒")
+        for encoding in encodings:
+            levels = sorted({level for _, level in COMPRESSION_LEVELS[encoding]})
+            chosen = RequestCompressor(encoding, COMPRESSION_LEVELS[encoding]).level_for(len(body))
+            for level in levels:
+                size, elapsed = measure(body, encoding, level)
+                upload = elapsed + size / bytes_per_second
+                mark = " ←当前配置" if level == chosen else ""
+                print(f"  {encoding + ' 级别' + str(level):<12} 发送 {size:>9} 字节 ({size / len(body):6.2%}), "
+                      f"压缩 {elapsed * 1000:6.2f}毫秒, 上传约 {upload * 1000:8.1f}毫秒{mark}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+from connection_pool import ConnectionStats, build_connector
+from run_batch_test import CONNECTOR_DNS_TTL, CONNECTOR_KEEPALIVE_SECONDS, CONNECTOR_LIMIT_PER_HOST
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+DEFAULT_CONCURRENCY = [50, 200]  # 默认测试的并发数
+DEFAULT_SERVER_DELAY_MS = 20     # 本地服务端每个请求的模拟延迟（毫秒）
+REQUESTS_PER_WORKER = 10         # 每个并发槽位发送的请求数
+BODY_BYTES = 16 * 1024           # 请求体大小
+SSE_CHUNKS = 20                  # 每个响应的SSE块数
+
+
+async def start_local_server(delay):
+    """
+    启动本地SSE服务（只用于测量客户端连接开销）：按对端地址统计服务端看到的TCP连接数
+
+    返回: (runner, url, 连接集合)
+    """
+    peers = set()
+
+    async def handle(request):
+        await request.read()
+        peers.add(request.transport.get_extra_info('peername'))
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await asyncio.sleep(delay)
+        for _ in range(SSE_CHUNKS):
+            chunk = {"choices": [{"delta": {"content": "1234"}}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/chat/completions", peers
+
+
+async def run_case(url, concurrency, connector, peers):
+    """以 concurrency 个工作协程发送请求，返回 (总耗时, 每请求平均耗时, 连接统计, 服务端连接数)"""
+    stats = ConnectionStats()
+    peers.clear()
+    body = b'{"messages": "' + b'a' * BODY_BYTES + b'"}'
+    latencies = []
+    total = concurrency * REQUESTS_PER_WORKER
+    next_request = iter(range(total))
+
+    async def worker(session):
+        for _ in next_request:
+            start = time.perf_counter()
+            async with session.post(url, data=body) as response:
+                async for _ in response.content.iter_any():
+                    pass
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector, trace_configs=[stats.trace_config]) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(latencies) / len(latencies), stats, len(peers)
+
+
+async def run_benchmark(levels, delay):
+    runner, url, peers = await start_local_server(delay)
+    try:
+        for concurrency in levels:
+            print(f"\n并发 {concurrency}（{concurrency * REQUESTS_PER_WORKER} 个请求）:")
+            cases = [
+                ("aiohttp默认(上限100)", lambda: aiohttp.TCPConnector()),
+                ("不复用连接", lambda: aiohttp.TCPConnector(limit=concurrency, force_close=True)),
+                ("调优连接池", lambda: build_connector(concurrency, CONNECTOR_LIMIT_PER_HOST,
+                                                   CONNECTOR_KEEPALIVE_SECONDS, CONNECTOR_DNS_TTL)),
+            ]
+            for name, make_connector in cases:
+                elapsed, mean_latency, stats, server_connections = await run_case(
+                    url, concurrency, make_connector(), peers
+                )
+                total = concurrency * REQUESTS_PER_WORKER
+                print(f"  {name:<14} 吞吐 {total / elapsed:8.1f} 请求/秒, 平均耗时 {mean_latency * 1000:7.2f}毫秒 "
+                      f"(额外开销 {(mean_latency - delay) * 1000:6.2f}毫秒), 新建连接 {stats.created:>5}, "
+                      f"复用 {stats.reused:>5}, 排队 {stats.queued:>5}, 服务端连接 {server_connections}")
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    """
+    使用方法: python bench_connection_pool.py [并发1,并发2,...] [服务端延迟毫秒] [--uvloop]
+    对本地SSE服务对比 aiohttp 默认连接池、不复用连接、调优连接池 三种配置的吞吐、每请求额外开销和连接复用情况
+    （并发超过100时，默认连接池的请求在池中排队，实际并发被限制在100）
+    """
+    args = [arg for arg in sys.argv[1:] if arg != '--uvloop']
+    try:
+        levels = [int(x) for x in args[0].split(',')] if args else DEFAULT_CONCURRENCY
+        delay_ms = float(args[1]) if len(args) > 1 else DEFAULT_SERVER_DELAY_MS
+        if not levels or min(levels) <= 0 or delay_ms < 0:
+            raise ValueError
+    except ValueError:
+        print("错误: 并发数必须是逗号分隔的正整数，延迟必须大于等于0")
+        sys.exit(1)
+
+    use_uvloop = '--uvloop' in sys.argv
+    if use_uvloop:
+        if uvloop is None:
+            print("错误: 使用 --uvloop 需要安装 uvloop（pip install uvloop）")
+            sys.exit(1)
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    print("=" * 70)
+    print("连接池基准测试（本地SSE服务）")
+    print("=" * 70)
+    print(f"事件循环: {'uvloop' if use_uvloop else 'asyncio'}, 服务端延迟: {delay_ms:g}毫秒, "
+          f"请求体: {BODY_BYTES} 字节, 每响应 {SSE_CHUNKS} 个SSE块")
+    asyncio.run(run_benchmark(levels, delay_ms / 1000))
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import json
+import sys
+import time
+
+from run_batch_test import (
+    DEFAULT_BASE_PATTERN, DEFAULT_NEEDLE_RANGE, DEFAULT_RANDOM_OFFSET_RATIO, REQUEST_FIELDS,
+    assemble_prompt, get_body_template, plan_test_case,
+)
+
+DEFAULT_LENGTH = 230000    # 默认基础文本长度
+DEFAULT_INSERTIONS = 150   # 默认插针数量
+DEFAULT_REPEAT = 50        # 默认重复次数
+
+
+def legacy_body(plan):
+    """旧版做法：拼接完整提示词，再像 session.post(json=payload) 一样整体序列化"""
+    payload = dict(REQUEST_FIELDS)
+    payload["messages"] = [{"role": "user", "content": assemble_prompt(plan)}]
+    return json.dumps(payload).encode('utf-8')
+
+
+def template_body(template, plan):
+    """新版做法：按插针位置拼接预编码的字节片段"""
+    return template.build(plan['insertions'])
+
+
+def main():
+    """
+    使用方法: python bench_request_body.py [基础文本长度] [插针数量] [重复次数]
+    对比每次请求构造请求体的耗时（不含插针计划本身的生成）
+    """
+    try:
+        length = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LENGTH
+        insertions = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_INSERTIONS
+        repeat = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_REPEAT
+        if length <= 0 or insertions <= 0 or repeat <= 0:
+            raise ValueError
+    except ValueError:
+        print("错误: 参数必须是大于0的整数")
+        sys.exit(1)
+
+    plans = [
+        plan_test_case(length, insertions, DEFAULT_BASE_PATTERN, DEFAULT_NEEDLE_RANGE, None,
+                       DEFAULT_RANDOM_OFFSET_RATIO, seed=seed)
+        for seed in range(repeat)
+    ]
+    template = get_body_template(length, DEFAULT_BASE_PATTERN, None, REQUEST_FIELDS)
+
+    for plan in plans:
+        if json.loads(legacy_body(plan)) != json.loads(template_body(template, plan)):
+            print("错误: 新旧请求体内容不一致")
+            sys.exit(1)
+
+    print("=" * 70)
+    print("请求体构造基准测试")
+    print("=" * 70)
+    print(f"基础文本长度: {length}, 插针数量: {insertions}, 请求数: {repeat}")
+    print(f"请求体大小: 旧版 {len(legacy_body(plans[0]))} 字节, 新版 {len(template_body(template, plans[0]))} 字节")
+
+    results = {}
+    for name, build in (("逐次序列化", legacy_body), ("预编码模板", lambda plan: template_body(template, plan))):
+        start = time.perf_counter()
+        for plan in plans:
+            build(plan)
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed
+        print(f"  {name}: 总计 {elapsed:.3f}秒, 每次 {elapsed / repeat * 1000:.2f}毫秒")
+
+    print(f"  加速比: {results['逐次序列化'] / results['预编码模板']:.2f}x")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import json
+import os
+import random
+import sys
+import time
+
+from cassette import CassetteStore, META_FILENAME
+from sse_parser import SSEParser
+
+DEFAULT_REPEAT = 20  # 默认重复次数
+
+
+def legacy_parse(chunks):
+    """
+    旧版解析逻辑（逐行解码+strip、每行json.loads、字符串拼接），作为基准
+    注意：这里一次性切分行，不包含 aiohttp 按行读取的缓冲开销，结果偏向旧版
+    """
+    content = ""
+    usage = None
+    lines = b"".join(chunks).splitlines(keepends=True)
+    for line in lines:
+        line_text = line.decode('utf-8').strip()
+        if not line_text:
+            continue
+        if line_text == "data: [DONE]":
+            break
+        if line_text.startswith("data: "):
+            json_str = line_text[6:]
+            try:
+                chunk_data = json.loads(json_str)
+                if chunk_data.get('usage'):
+                    usage = chunk_data['usage']
+                if 'choices' in chunk_data and len(chunk_data['choices']) > 0:
+                    delta = chunk_data['choices'][0].get('delta', {})
+                    chunk_content = delta.get('content', '')
+                    if chunk_content:
+                        content += chunk_content
+            except json.JSONDecodeError:
+                continue
+    return content, usage
+
+
+def fast_parse(chunks):
+    """新版增量解析器"""
+    parser = SSEParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    parser.finish()
+    return parser.text(), parser.usage
+
+
+def load_recorded_streams(directory):
+    """读取录制目录中所有状态为200的SSE字节流"""
+    store = CassetteStore(directory)
+    streams = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json') or filename == META_FILENAME:
+            continue
+        record = store.load(filename[:-len('.json')])
+        if record and record['status'] == 200:
+            streams.append([chunk for _, chunk in record['chunks']])
+    return streams
+
+
+def synthesize_stream(reasoning_events=20000, content_events=1500, seed=0):
+    """生成一个带长推理过程的模拟流（按随机字节边界切块，模拟网络分块）"""
+    rng = random.Random(seed)
+    events = []
+    for _ in range(reasoning_events):
+        delta = {"reasoning_content": "第" + str(rng.randint(1000, 9999)) + "个数字，"}
+        events.append({"id": "chatcmpl-x", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta}]})
+    answer = json.dumps({str(i): rng.randint(1000, 9999) for i in range(1, 151)}, indent=1)
+    step = max(1, len(answer) // content_events)
+    for i in range(0, len(answer), step):
+        delta = {"content": answer[i:i + step]}
+        events.append({"id": "chatcmpl-x", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta}]})
+    events.append({"id": "chatcmpl-x", "choices": [], "usage": {"prompt_tokens": 60000, "completion_tokens": 30000}})
+    raw = b"".join(b"data: " + json.dumps(e, ensure_ascii=False).encode('utf-8') + b"\n\n" for e in events)
+    raw += b"data: [DONE]\n\n"
+    chunks = []
+    pos = 0
+    while pos < len(raw):
+        size = rng.randint(512, 8192)
+        chunks.append(raw[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def benchmark(streams, repeat):
+    total_bytes = sum(len(chunk) for chunks in streams for chunk in chunks)
+
+    for chunks in streams:
+        if legacy_parse(chunks)[0] != fast_parse(chunks)[0]:
+            print("错误: 新旧解析器输出不一致")
+            sys.exit(1)
+
+    results = {}
+    for name, func in (("旧版逐行解析", legacy_parse), ("增量SSE解析", fast_parse)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for chunks in streams:
+                func(chunks)
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed
+        throughput = total_bytes * repeat / elapsed / 1024 / 1024
+        print(f"  {name}: {elapsed:.3f}秒, {throughput:.1f} MB/s")
+
+    speedup = results["旧版逐行解析"] / results["增量SSE解析"]
+    print(f"  加速比: {speedup:.2f}x")
+
+
+def main():
+    """
+    使用方法: python bench_sse_parser.py [录制目录] [重复次数]
+    - 指定录制目录（run_batch_test.py --record 生成）时，使用录制的真实SSE流
+    - 未指定时使用模拟的长推理流
+    """
+    repeat = DEFAULT_REPEAT
+    if len(sys.argv) > 2:
+        try:
+            repeat = int(sys.argv[2])
+            if repeat <= 0:
+                raise ValueError
+        except ValueError:
+            print("错误: 重复次数必须是大于0的整数")
+            sys.exit(1)
+
+    if len(sys.argv) > 1 and sys.argv[1] != '-':
+        directory = sys.argv[1]
+        if not os.path.isdir(directory):
+            print(f"错误: 录制目录不存在: {directory}")
+            sys.exit(1)
+        streams = load_recorded_streams(directory)
+        if not streams:
+            print(f"错误: 录制目录中没有可用的流: {directory}")
+            sys.exit(1)
+        source = f"录制目录 {directory}"
+    else:
+        streams = [synthesize_stream()]
+        source = "模拟长推理流"
+
+    total_bytes = sum(len(chunk) for chunks in streams for chunk in chunks)
+    print("=" * 70)
+    print("SSE解析吞吐量基准测试")
+    print("=" * 70)
+    print(f"数据来源: {source}")
+    print(f"流数量: {len(streams)}, 总字节数: {total_bytes}, 重复次数: {repeat}")
+    benchmark(streams, repeat)
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+
+from multidict import CIMultiDict
+
+# 录制文件中的元数据文件名（记录录制时使用的基础种子等信息）
+META_FILENAME = "meta.json"
+
+
+def compute_case_hash(model, prompt_content):
+    """用例哈希：由模型名称和完整提示词决定（同一种子重新生成的用例哈希一致）"""
+    digest = hashlib.sha256()
+    digest.update(model.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(prompt_content.encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+class CassetteStore:
+    """录制文件目录：每个用例一个 <case_hash>.json 文件"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, case_hash):
+        return os.path.join(self.directory, f"{case_hash}.json")
+
+    def save(self, case_hash, status, headers, ttfb, chunks):
+        """
+        保存一次请求的完整响应
+
+        参数:
+            case_hash: 用例哈希
+            status: HTTP状态码
+            headers: 响应头（dict）
+            ttfb: 从发出请求到收到响应头的时间（秒）
+            chunks: [(相对响应头的时间偏移秒数, bytes), ...]
+        """
+        data = {
+            'case_hash': case_hash,
+            'status': status,
+            'headers': headers,
+            'ttfb': ttfb,
+            'chunks': [[round(t, 6), base64.b64encode(chunk).decode('ascii')] for t, chunk in chunks],
+        }
+        tmp_path = self.path_for(case_hash) + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path_for(case_hash))
+
+    def load(self, case_hash):
+        """读取录制内容，不存在返回None"""
+        path = self.path_for(case_hash)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data['chunks'] = [(t, base64.b64decode(chunk)) for t, chunk in data['chunks']]
+        return data
+
+    def save_meta(self, meta):
+        with open(os.path.join(self.directory, META_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    def load_meta(self):
+        path = os.path.join(self.directory, META_FILENAME)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+class CassetteSession(ABC):
+    """录制/回放会话基类：post() 额外接收 case_hash 作为录制文件的键"""
+
+    @abstractmethod
+    def post(self, url, case_hash=None, **kwargs):
+        """返回异步上下文管理器，进入时得到与 aiohttp 响应接口相同的响应对象"""
+
+    async def close(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# 录制
+# ---------------------------------------------------------------------------
+
+class _RecordingContent:
+    """包装真实响应的 content，读取的同时记录每个数据块及其时间"""
+
+    def __init__(self, content, chunks, started):
+        self._content = content
+        self._chunks = chunks
+        self._started = started
+
+    def _record(self, chunk):
+        self._chunks.append((time.monotonic() - self._started, bytes(chunk)))
+        return chunk
+
+    async def _iterate(self, source):
+        async for chunk in source:
+            yield self._record(chunk)
+
+    def __aiter__(self):
+        return self._iterate(self._content).__aiter__()
+
+    def iter_chunked(self, n):
+        return self._iterate(self._content.iter_chunked(n))
+
+    def iter_any(self):
+        return self._iterate(self._content.iter_any())
+
+
+class _RecordingResponse:
+    def __init__(self, response, chunks, started):
+        self._response = response
+        self._chunks = chunks
+        self.status = response.status
+        self.headers = response.headers
+        self.content = _RecordingContent(response.content, chunks, started)
+
+    async def read(self):
+        body = await self._response.read()
+        self.content._record(body)
+        return body
+
+    async def text(self, encoding='utf-8'):
+        return (await self.read()).decode(encoding, errors='replace')
+
+    async def json(self):
+        return json.loads(await self.read())
+
+
+class _RecordingRequest:
+    def __init__(self, session, url, case_hash, kwargs):
+        self._session = session
+        self._url = url
+        self._case_hash = case_hash
+        self._kwargs = kwargs
+        self._context = None
+        self._response = None
+        self._chunks = []
+        self._ttfb = 0.0
+
+    async def __aenter__(self):
+        sent = time.monotonic()
+        self._context = self._session.http_session.post(self._url, **self._kwargs)
+        response = await self._context.__aenter__()
+        started = time.monotonic()
+        self._ttfb = started - sent
+        self._response = _RecordingResponse(response, self._chunks, started)
+        return self._response
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # 只保存完整读完的响应（异常中断的流不写入录制文件）
+        if exc_type is None and self._case_hash:
+            self._session.store.save(
+                self._case_hash, self._response.status, dict(self._response.headers),
+                self._ttfb, self._chunks
+            )
+        return await self._context.__aexit__(exc_type, exc, tb)
+
+
+class RecordingSession(CassetteSession):
+    """录制会话：请求照常发往真实API，同时把SSE字节流和时间保存到录制目录"""
+
+    def __init__(self, http_session, store):
+        self.http_session = http_session
+        self.store = store
+
+    def post(self, url, case_hash=None, **kwargs):
+        return _RecordingRequest(self, url, case_hash, kwargs)
+
+
+# ---------------------------------------------------------------------------
+# 回放
+# ---------------------------------------------------------------------------
+
+class _ReplayContent:
+    """按录制内容回放的 content，支持按行迭代、iter_chunked 和 iter_any"""
+
+    def __init__(self, chunks, started, realtime):
+        self._chunks = chunks
+        self._started = started
+        self._realtime = realtime
+
+    async def _timed_chunks(self):
+        for offset, chunk in self._chunks:
+            if self._realtime:
+                delay = self._started + offset - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
+
+    async def _lines(self):
+        buffer = b""
+        async for chunk in self._timed_chunks():
+            buffer += chunk
+            while True:
+                idx = buffer.find(b"\n")
+                if idx < 0:
+                    break
+                yield buffer[:idx + 1]
+                buffer = buffer[idx + 1:]
+        if buffer:
+            yield buffer
+
+    def __aiter__(self):
+        return self._lines().__aiter__()
+
+    async def iter_chunked(self, n):
+        async for chunk in self._timed_chunks():
+            for i in range(0, len(chunk), n):
+                yield chunk[i:i + n]
+
+    def iter_any(self):
+        return self._timed_chunks()
+
+    async def read(self):
+        return b"".join([chunk async for chunk in self._timed_chunks()])
+
+
+class _ReplayResponse:
+    def __init__(self, status, headers, chunks, realtime):
+        self.status = status
+        # 与 aiohttp 相同，响应头按名称查找时不区分大小写（如 Retry-After）
+        self.headers = CIMultiDict(headers)
+        self.content = _ReplayContent(chunks, time.monotonic(), realtime)
+
+    async def read(self):
+        return await self.content.read()
+
+    async def text(self, encoding='utf-8'):
+        return (await self.read()).decode(encoding, errors='replace')
+
+    async def json(self):
+        return json.loads(await self.read())
+
+
+class _ReplayRequest:
+    def __init__(self, session, case_hash):
+        self._session = session
+        self._case_hash = case_hash
+
+    async def __aenter__(self):
+        record = self._session.store.load(self._case_hash) if self._case_hash else None
+        if record is None:
+            self._session.missing += 1
+            message = f"cassette not found: {self._case_hash}".encode('utf-8')
+            return _ReplayResponse(404, {}, [(0.0, message)], realtime=False)
+        if self._session.realtime and record.get('ttfb'):
+            await asyncio.sleep(record['ttfb'])
+        self._session.replayed += 1
+        return _ReplayResponse(record['status'], record.get('headers', {}), record['chunks'], self._session.realtime)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class ReplaySession(CassetteSession):
+    """
+    回放会话：不访问网络，按用例哈希从录制目录读取响应并回放
+
+    参数:
+        store: CassetteStore
+        realtime: True=按录制时的速度回放（含首字节时间），False=尽可能快
+    """
+
+    def __init__(self, store, realtime=True):
+        self.store = store
+        self.realtime = realtime
+        self.replayed = 0
+        self.missing = 0
+
+    def post(self, url, case_hash=None, **kwargs):
+        return _ReplayRequest(self, case_hash)
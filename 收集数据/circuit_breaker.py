@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from request_log import log_event
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_STATE_NAMES = {CLOSED: "关闭（正常）", OPEN: "打开（暂停发送）", HALF_OPEN: "半开（探测中）"}
+
+
+def is_server_failure(status):
+    """是否计为服务端故障：没有拿到响应（超时/连接错误）或 5xx；429 和其他 4xx 不计入"""
+    return status is None or status >= 500
+
+
+class CircuitBreaker:
+    """
+    单个接口的熔断器：
+    - 关闭：正常发送，记录最近 window 个请求的结果；样本不少于 min_requests 且错误率达到 error_rate 时打开
+    - 打开：暂停发送（acquire 等待）open_seconds 秒后进入半开
+    - 半开：只放行一个探测请求；成功则关闭，失败则重新打开且等待时间加倍（不超过 max_open_seconds）
+
+    参数:
+        name: 接口名称（用于输出）
+        window: 滚动窗口大小（请求数）
+        min_requests: 窗口内至少多少个结果才判断错误率
+        error_rate: 打开阈值（0-1）
+        open_seconds: 首次打开后的等待时间（秒）
+        max_open_seconds: 连续探测失败时等待时间的上限（秒）
+    """
+
+    def __init__(self, name, window=20, min_requests=5, error_rate=0.5, open_seconds=30, max_open_seconds=300):
+        if not 0 < error_rate <= 1:
+            raise ValueError("熔断错误率阈值必须在0-1之间")
+        self.name = name
+        self.window = deque(maxlen=window)
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = CLOSED
+        self._current_open_seconds = open_seconds
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._changed = asyncio.Event()
+        self._opened_at = None
+        self.trips = 0
+        self.probes = 0
+        self.time_open = 0.0  # 已结束的打开区间累计时长（秒）
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def acquire(self):
+        """
+        发送前调用：熔断器打开时等待
+
+        返回: 本次请求是否为半开状态下的探测请求（需要在 record / cancel 时传回）
+        """
+        while True:
+            if self.state == CLOSED:
+                return False
+            changed = self._changed
+            if self.state == OPEN:
+                remaining = self._open_until - time.monotonic()
+                if remaining > 0:
+                    try:
+                        await asyncio.wait_for(changed.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                self.state = HALF_OPEN
+                log_event(logging.INFO, 'breaker_half_open', "熔断器 {name}: 半开，发送探测请求", name=self.name)
+                self._notify()
+            if not self._probe_in_flight:
+                self._probe_in_flight = True
+                self.probes += 1
+                return True
+            await changed.wait()
+
+    def ready(self):
+        """acquire 是否会立即返回（关闭，或可以发出探测请求）"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() >= self._open_until
+        return not self._probe_in_flight
+
+    def reopen_in(self):
+        """打开状态下距离进入半开的秒数（其他状态返回None）"""
+        if self.state != OPEN:
+            return None
+        return max(0.0, self._open_until - time.monotonic())
+
+    def record(self, is_probe, failed):
+        """记录一次请求结果"""
+        if is_probe:
+            self._probe_in_flight = False
+            if failed:
+                self._current_open_seconds = min(self._current_open_seconds * 2, self.max_open_seconds)
+                self._open("探测请求失败")
+            else:
+                self._close()
+            return
+        if self.state != CLOSED:
+            # 打开前已发出的请求陆续返回，不影响当前状态
+            return
+        self.window.append(failed)
+        errors = sum(self.window)
+        if len(self.window) >= self.min_requests and errors >= self.error_rate * len(self.window):
+            self.trips += 1
+            self._opened_at = time.monotonic()
+            self._current_open_seconds = self.open_seconds
+            self._open(f"最近 {len(self.window)} 个请求中 {errors} 个服务端错误")
+
+    def cancel(self, is_probe):
+        """请求被取消（如对冲落败、退出）时调用：释放探测名额，不计入结果"""
+        if is_probe:
+            self._probe_in_flight = False
+            self._notify()
+
+    def _open(self, reason):
+        self.state = OPEN
+        self._open_until = time.monotonic() + self._current_open_seconds
+        log_event(logging.WARNING, 'breaker_open', "⚡ 熔断器 {name}: 打开（{reason}），暂停发送 {open_seconds:g} 秒",
+                  name=self.name, reason=reason, open_seconds=self._current_open_seconds)
+        self._notify()
+
+    def _close(self):
+        self.state = CLOSED
+        self.window.clear()
+        if self._opened_at is not None:
+            self.time_open += time.monotonic() - self._opened_at
+            self._opened_at = None
+        log_event(logging.INFO, 'breaker_closed', "熔断器 {name}: 探测成功，恢复发送", name=self.name)
+        self._notify()
+
+    def total_time_open(self):
+        """累计打开时长（含当前仍未恢复的区间）"""
+        if self._opened_at is None:
+            return self.time_open
+        return self.time_open + time.monotonic() - self._opened_at
+
+    def print_report(self):
+        print(f"熔断器 {self.name}:")
+        print(f"  当前状态: {_STATE_NAMES[self.state]}")
+        print(f"  打开次数: {self.trips}, 探测请求: {self.probes}, 累计打开时长: {self.total_time_open():.1f}秒")
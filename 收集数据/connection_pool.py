@@ -0,0 +1,70 @@
+import ssl
+
+import aiohttp
+
+
+def build_connector(limit, limit_per_host=None, keepalive_timeout=75, dns_ttl=300, ssl_context=None):
+    """
+    构建显式配置的 TCPConnector（aiohttp 默认上限100个连接，超过100并发时请求会在连接池中排队）
+
+    参数:
+        limit: 连接总数上限（0=不限制）
+        limit_per_host: 每个主机的连接上限（None=与 limit 相同）
+        keepalive_timeout: 空闲连接保持时间（秒）；长请求之间保持连接，避免重复的TCP/TLS握手
+        dns_ttl: DNS缓存时间（秒）
+        ssl_context: 共享的 SSLContext（None=新建默认上下文；所有连接共用，避免重复加载CA证书）
+    """
+    if ssl_context is None:
+        ssl_context = ssl.create_default_context()
+    return aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit if limit_per_host is None else limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        use_dns_cache=True,
+        ttl_dns_cache=dns_ttl,
+        ssl=ssl_context,
+    )
+
+
+class ConnectionStats:
+    """
+    通过 aiohttp TraceConfig 统计连接的新建与复用、DNS缓存命中，以及在连接池中排队等待的次数
+
+    用法: aiohttp.ClientSession(connector=..., trace_configs=[stats.trace_config])
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.reused = 0
+        self.queued = 0
+        self.dns_lookups = 0
+        self.dns_cache_hits = 0
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_connection_create_end.append(self._on_create)
+        self.trace_config.on_connection_reuseconn.append(self._on_reuse)
+        self.trace_config.on_connection_queued_start.append(self._on_queued)
+        self.trace_config.on_dns_resolvehost_end.append(self._on_dns_lookup)
+        self.trace_config.on_dns_cache_hit.append(self._on_dns_cache_hit)
+
+    async def _on_create(self, session, context, params):
+        self.created += 1
+
+    async def _on_reuse(self, session, context, params):
+        self.reused += 1
+
+    async def _on_queued(self, session, context, params):
+        self.queued += 1
+
+    async def _on_dns_lookup(self, session, context, params):
+        self.dns_lookups += 1
+
+    async def _on_dns_cache_hit(self, session, context, params):
+        self.dns_cache_hits += 1
+
+    def print_report(self):
+        total = self.created + self.reused
+        if total == 0:
+            return
+        print("连接池:")
+        print(f"  新建连接: {self.created}, 复用连接: {self.reused} (复用率 {self.reused / total:.1%})")
+        print(f"  等待空闲连接: {self.queued} 次, DNS查询: {self.dns_lookups}, DNS缓存命中: {self.dns_cache_hits}")
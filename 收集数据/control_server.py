@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import time
+
+from aiohttp import web
+
+from request_log import log_event
+
+DEFAULT_CONTROL_HOST = '127.0.0.1'  # --control 只给端口时监听的地址（仅本机）
+
+
+def parse_control_address(text, shard_index=None):
+    """
+    解析 --control 的地址
+
+    参数:
+        text: 端口（如 9000）、主机:端口（如 127.0.0.1:9000）或 Unix 套接字路径（如 /tmp/run.sock）
+        shard_index: 分片序号（多进程模式下各分片监听 端口+I 或 路径.shardI）
+
+    返回: ('tcp', 主机, 端口) 或 ('unix', 路径)
+    """
+    host, sep, port = text.rpartition(':')
+    if port.isdigit() and '/' not in text:
+        port = int(port) + (shard_index or 0)
+        return ('tcp', host if sep else DEFAULT_CONTROL_HOST, port)
+    if shard_index is not None:
+        text = f"{text}.shard{shard_index}"
+    return ('unix', text)
+
+
+class ControlServer:
+    """
+    运行中的控制接口（本机 HTTP 或 Unix 套接字），不重启即可调整正在运行的批量测试：
+        GET  /status                       运行状态、工作池、在途请求、各密钥限额与用量、费用、各接口的负载/耗时/熔断器
+        POST /pause                        暂停派发（在途请求继续完成）
+        POST /resume                       恢复派发
+        POST /concurrency?n=N              调整并发数（调小时多出的工作协程完成手头请求后退出）
+        POST /rate?rpm=R&tpm=T[&key=NAME]  调整密钥的 RPM/TPM 限额（0=不限制；未指定 key 时调整所有密钥）
+        POST /budget?usd=X                 调整费用上限（0=不限制）
+        POST /endpoint?name=NAME&weight=W  调整接口权重（0=摘除该接口，在途请求继续完成）
+        POST /drain                        停止派发并等待在途请求完成后退出（与第一次 Ctrl-C 相同）
+
+    所有接口返回 JSON；调整类接口返回调整后的状态
+
+    参数:
+        pool: WorkerPool
+        key_pool: KeyPool
+        shutdown: ShutdownController
+        stats: 运行统计字典（'concurrency' 不为None时随并发数调整，用于估算剩余时间）
+        cost_tracker: CostTracker（可选）
+        endpoints: EndpointPool（可选）
+        extra_status: 函数 extra_status() -> dict，合并到 /status 的返回中（可选）
+    """
+
+    def __init__(self, pool, key_pool, shutdown, stats, cost_tracker=None, endpoints=None, extra_status=None):
+        self.pool = pool
+        self.key_pool = key_pool
+        self.shutdown = shutdown
+        self.stats = stats
+        self.cost_tracker = cost_tracker
+        self.endpoints = endpoints
+        self.extra_status = extra_status
+        self.commands = 0
+        self.address = None
+        self._socket_path = None
+        self._runner = None
+        self._started = time.monotonic()
+
+    async def start(self, address):
+        """
+        参数:
+            address: parse_control_address 的返回值
+
+        返回: 可显示的监听地址
+        """
+        app = web.Application()
+        app.router.add_get('/status', self._status)
+        app.router.add_post('/pause', self._pause)
+        app.router.add_post('/resume', self._resume)
+        app.router.add_post('/concurrency', self._concurrency)
+        app.router.add_post('/rate', self._rate)
+        app.router.add_post('/budget', self._budget)
+        app.router.add_post('/endpoint', self._endpoint)
+        app.router.add_post('/drain', self._drain)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        if address[0] == 'unix':
+            site = web.UnixSite(self._runner, address[1])
+            self._socket_path = address[1]
+            self.address = f"unix:{address[1]}"
+        else:
+            site = web.TCPSite(self._runner, address[1], address[2])
+            self.address = f"http://{address[1]}:{address[2]}"
+        await site.start()
+        return self.address
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._socket_path is not None and os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+    @property
+    def state(self):
+        if self.shutdown.stopping:
+            return 'draining'
+        return 'paused' if self.pool.paused else 'running'
+
+    def status(self):
+        result = {
+            'state': self.state,
+            'elapsed_seconds': round(time.monotonic() - self._started, 1),
+            'concurrency': self.pool.worker_count,
+            'busy': self.pool.busy,
+            'queued': self.pool.queued,
+            'running': sorted(self.pool.running.values()),
+            'stats': dict(self.stats),
+            'keys': self.key_pool.status(),
+        }
+        if self.cost_tracker is not None:
+            result['cost'] = {'spent': round(self.cost_tracker.spent, 6),
+                              'reserved': round(self.cost_tracker.reserved, 6),
+                              'budget': self.cost_tracker.budget}
+        if self.endpoints is not None:
+            result['endpoints'] = self.endpoints.status()
+        if self.extra_status is not None:
+            result.update(self.extra_status())
+        return result
+
+    def _reply(self, status=200):
+        return web.json_response(self.status(), status=status, dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
+
+    def _error(self, message, status=400):
+        return web.json_response({'error': message}, status=status,
+                                 dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
+
+    def _log(self, message):
+        self.commands += 1
+        log_event(logging.INFO, 'control_command', "\n[控制] {message}", message=message)
+
+    async def _status(self, request):
+        return self._reply()
+
+    async def _pause(self, request):
+        if self.shutdown.stopping:
+            return self._error("正在停止，无法暂停", 409)
+        if not self.pool.paused:
+            self.pool.pause()
+            self._log(f"暂停派发（在途请求 {self.pool.busy} 个继续完成）")
+        return self._reply()
+
+    async def _resume(self, request):
+        if self.shutdown.stopping:
+            return self._error("正在停止，无法恢复", 409)
+        if self.pool.paused:
+            self.pool.resume()
+            self._log("恢复派发")
+        return self._reply()
+
+    async def _concurrency(self, request):
+        if self.shutdown.stopping:
+            return self._error("正在停止，无法调整并发数", 409)
+        try:
+            count = int(request.query['n'])
+            if count < 1:
+                raise ValueError
+        except (KeyError, ValueError):
+            return self._error("参数 n 必须是大于0的整数")
+        previous = self.pool.worker_count
+        self.pool.resize(count)
+        if self.stats.get('concurrency') is not None:
+            self.stats['concurrency'] = count
+        self._log(f"并发数 {previous} → {count}")
+        return self._reply()
+
+    async def _rate(self, request):
+        limits = {}
+        try:
+            for field in ('rpm', 'tpm'):
+                if field in request.query:
+                    value = float(request.query[field])
+                    if value < 0:
+                        raise ValueError
+                    limits[field] = value or None
+        except ValueError:
+            return self._error("参数 rpm / tpm 必须是非负数（0=不限制）")
+        if not limits:
+            return self._error("至少需要参数 rpm 或 tpm")
+        name = request.query.get('key')
+        try:
+            keys = await self.key_pool.set_limits(name, **limits)
+        except ValueError as e:
+            return self._error(str(e), 404)
+        detail = ", ".join(f"{field.upper()} {value:g}" if value else f"{field.upper()} 不限"
+                           for field, value in limits.items())
+        self._log(f"密钥 {', '.join(k.name for k in keys)}: {detail}")
+        return self._reply()
+
+    async def _budget(self, request):
+        if self.cost_tracker is None:
+            return self._error("未启用费用统计", 404)
+        try:
+            budget = float(request.query['usd'])
+            if budget < 0:
+                raise ValueError
+        except (KeyError, ValueError):
+            return self._error("参数 usd 必须是非负数（0=不限制）")
+        if budget and not self.cost_tracker.price:
+            return self._error("未配置模型价格，无法设置费用上限")
+        self.cost_tracker.budget = budget or None
+        self._log(f"费用上限: {'$%g' % budget if budget else '不限'}")
+        return self._reply()
+
+    async def _endpoint(self, request):
+        if self.endpoints is None:
+            return self._error("未启用接口池", 404)
+        try:
+            weight = float(request.query['weight'])
+            if weight < 0:
+                raise ValueError
+        except (KeyError, ValueError):
+            return self._error("参数 weight 必须是非负数（0=摘除）")
+        try:
+            endpoint = self.endpoints.set_weight(request.query.get('name'), weight)
+        except ValueError as e:
+            return self._error(str(e), 404)
+        self._log(f"接口 {endpoint.name}: 权重 {weight:g}" + ("（已摘除）" if not weight else ""))
+        return self._reply()
+
+    async def _drain(self, request):
+        if not self.shutdown.stopping:
+            self._log(f"停止派发，等待在途请求 {self.pool.busy} 个完成后退出")
+            self.shutdown.request_stop()
+        return self._reply()
+
+    def print_report(self):
+        print(f"控制接口: {self.address}，收到 {self.commands} 条调整命令")
@@ -0,0 +1,160 @@
+def parse_usage(usage):
+    """
+    规范化服务端返回的 usage 块
+
+    兼容 OpenAI 风格（completion_tokens_details.reasoning_tokens、prompt_tokens_details.cached_tokens）
+    以及直接在 usage 顶层给出 reasoning_tokens / cached_tokens / prompt_cache_hit_tokens 的服务商
+
+    返回: {'prompt_tokens', 'completion_tokens', 'reasoning_tokens', 'cached_tokens'}，usage 为空时返回None
+    """
+    if not usage:
+        return None
+    details = usage.get('completion_tokens_details') or {}
+    reasoning_tokens = details.get('reasoning_tokens')
+    if reasoning_tokens is None:
+        reasoning_tokens = usage.get('reasoning_tokens')
+    prompt_details = usage.get('prompt_tokens_details') or {}
+    cached_tokens = prompt_details.get('cached_tokens')
+    if cached_tokens is None:
+        cached_tokens = usage.get('cached_tokens')
+    if cached_tokens is None:
+        cached_tokens = usage.get('prompt_cache_hit_tokens')
+    return {
+        'prompt_tokens': usage.get('prompt_tokens') or 0,
+        'completion_tokens': usage.get('completion_tokens') or 0,
+        'reasoning_tokens': reasoning_tokens or 0,
+        'cached_tokens': cached_tokens or 0,
+    }
+
+
+class CostTracker:
+    """
+    费用统计与预算控制：
+    - 按价格表把每次请求的 usage 折算为费用并累计
+    - 发送前按预估费用预留预算，超出预算时拒绝发送新请求
+    - 请求结束后用实际费用结算预留；已发出但被取消或超时（拿不到 usage）的请求按预估输入token计费
+    - 对冲请求的费用另外累计，便于核对对冲比例上限
+
+    参数:
+        price: 价格表项 {'input': 美元/百万输入token, 'output': 美元/百万输出token,
+                        'cached_input': 美元/百万缓存命中的输入token（可选，默认同 input）}，None=未知价格（费用记为0）
+        budget: 费用上限（美元，None=不限制）
+        bytes_per_token: 未获得实际 usage 前，用于由提示词字节数预估输入token数
+        estimated_completion_tokens: 未获得实际 usage 前预估的输出token数
+    """
+
+    def __init__(self, price=None, budget=None, bytes_per_token=4, estimated_completion_tokens=2000):
+        self.price = price
+        self.budget = budget
+        self.bytes_per_token = bytes_per_token
+        self.estimated_completion_tokens = estimated_completion_tokens
+        self.spent = 0.0
+        self.reserved = 0.0
+        self.estimated_spent = 0.0  # 其中按预估计费的部分（已发出但被取消或超时的请求）
+        self.hedge_spent = 0.0  # 其中对冲请求的费用
+        self.requests_with_usage = 0
+        self.totals = {'prompt_tokens': 0, 'completion_tokens': 0, 'reasoning_tokens': 0, 'cached_tokens': 0}
+        # 用实际 usage 校准的 字节/token 比例和平均输出token数
+        self._observed_bytes = 0
+        self._observed_prompt_tokens = 0
+
+    def cost_of(self, usage):
+        """按价格表计算一次请求的费用（美元）"""
+        if not self.price or not usage:
+            return 0.0
+        input_price = self.price.get('input', 0.0)
+        cached_price = self.price.get('cached_input', input_price)
+        cached_tokens = usage.get('cached_tokens', 0)
+        return ((usage['prompt_tokens'] - cached_tokens) * input_price
+                + cached_tokens * cached_price
+                + usage['completion_tokens'] * self.price.get('output', 0.0)) / 1_000_000
+
+    def estimate_usage(self, byte_count):
+        """由提示词字节数预估 usage（优先使用已观测到的比例）"""
+        if self._observed_prompt_tokens:
+            prompt_tokens = byte_count * self._observed_prompt_tokens / self._observed_bytes
+        else:
+            prompt_tokens = byte_count / self.bytes_per_token
+        if self.requests_with_usage:
+            completion_tokens = self.totals['completion_tokens'] / self.requests_with_usage
+        else:
+            completion_tokens = self.estimated_completion_tokens
+        return {
+            'prompt_tokens': int(prompt_tokens),
+            'completion_tokens': int(completion_tokens),
+            'reasoning_tokens': 0,
+            'cached_tokens': 0,
+        }
+
+    def estimate_cost(self, byte_count):
+        return self.cost_of(self.estimate_usage(byte_count))
+
+    def reserve(self, byte_count):
+        """
+        为即将发送的请求预留预算
+
+        返回: 预留金额；预计会超出预算时返回None（不应再发送）
+        """
+        estimate = self.estimate_cost(byte_count)
+        if self.budget is not None and self.spent + self.reserved + estimate > self.budget:
+            return None
+        self.reserved += estimate
+        return estimate
+
+    def settle(self, reservation, byte_count, usage, prompt_billed=False, hedge=False):
+        """
+        请求结束后结算：释放预留，并按实际 usage 计费
+
+        参数:
+            reservation: reserve 返回的预留金额
+            byte_count: 提示词字节数（用于校准预估）
+            usage: parse_usage 的结果（没有 usage 时为None）
+            prompt_billed: 没有 usage 时，请求是否已发出（被取消或超时）：服务商已收到的提示词仍会计费，
+                           按预估的输入token计费；否则不计费
+            hedge: 是否为对冲请求（费用同时计入 hedge_spent）
+
+        返回: 本次费用
+        """
+        self.reserved = max(0.0, self.reserved - reservation)
+        if usage:
+            cost = self.cost_of(usage)
+            self.requests_with_usage += 1
+            for name in self.totals:
+                self.totals[name] += usage[name]
+            if usage['prompt_tokens']:
+                self._observed_bytes += byte_count
+                self._observed_prompt_tokens += usage['prompt_tokens']
+        elif prompt_billed:
+            cost = self.cost_of({**self.estimate_usage(byte_count), 'completion_tokens': 0})
+            self.estimated_spent += cost
+        else:
+            return 0.0
+        self.spent += cost
+        if hedge:
+            self.hedge_spent += cost
+        return cost
+
+    def describe(self):
+        """返回当前累计费用的简短描述"""
+        text = f"累计费用 ${self.spent:.4f}"
+        if self.budget is not None:
+            text += f" / 预算 ${self.budget:g}"
+        return text
+
+    def print_report(self):
+        """打印token用量与费用汇总"""
+        print("Token用量与费用:")
+        print(f"  有usage的请求数: {self.requests_with_usage}")
+        print(f"  输入token: {self.totals['prompt_tokens']}")
+        if self.totals['cached_tokens']:
+            ratio = self.totals['cached_tokens'] / max(self.totals['prompt_tokens'], 1)
+            print(f"  其中缓存命中: {self.totals['cached_tokens']} ({ratio:.1%})")
+        print(f"  输出token: {self.totals['completion_tokens']} (其中推理 {self.totals['reasoning_tokens']})")
+        if self.price:
+            print(f"  {self.describe()}")
+            if self.estimated_spent:
+                print(f"  其中按预估输入token计费（已发出但被取消或超时）: ${self.estimated_spent:.4f}")
+            if self.hedge_spent:
+                print(f"  其中对冲请求: ${self.hedge_spent:.4f}")
+        else:
+            print("  未配置价格，费用未计算")
@@ -0,0 +1,183 @@
+import asyncio
+
+from circuit_breaker import is_server_failure
+
+DEFAULT_LATENCY_ALPHA = 0.2  # 接口耗时指数滑动平均的权重（越大越快反映最近的耗时变化）
+
+
+class Endpoint:
+    """单个接口（网关/区域）的状态：权重、并发、熔断器、耗时和用量"""
+
+    def __init__(self, name, url, weight=1.0, max_concurrent=None, breaker=None):
+        """
+        参数:
+            name: 接口名称（仅用于显示）
+            url: chat/completions 地址
+            weight: 权重（负载相同时按权重分配；0=不再分配新请求）
+            max_concurrent: 该接口的最大并发数（None=不限制）
+            breaker: 该接口的 CircuitBreaker（None=不熔断）
+        """
+        self.name = name
+        self.url = url
+        self.weight = float(weight)
+        self.max_concurrent = max_concurrent
+        self.breaker = breaker
+        self.in_flight = 0
+        self.latency = None  # 成功请求耗时的指数滑动平均（秒）
+        self.usage = {'requests': 0, 'success': 0, 'failed': 0}
+
+    def is_ready(self):
+        if self.weight <= 0:
+            return False
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            return False
+        return self.breaker is None or self.breaker.ready()
+
+    def observe(self, elapsed, alpha):
+        self.latency = elapsed if self.latency is None else self.latency + alpha * (elapsed - self.latency)
+
+
+class EndpointPool:
+    """
+    多接口负载均衡（同一模型的多个网关或区域）：
+    - 每个请求路由到得分最低的可用接口：得分 = (在途请求数 + 1) × 耗时 / 权重，
+      即按耗时加权的最少在途请求（least outstanding requests）
+    - 耗时为该接口成功请求（及更慢的超时）耗时的指数滑动平均；各接口收到的用例分布相同，可直接比较；
+      还没有样本的接口按已有接口的平均耗时计，保证新接口也能分到请求
+    - 变慢的区域在途请求堆积、得分升高，新请求自动转向其他接口；权重设为0可手动摘除
+    - 每个接口有独立的熔断器，打开时不参与路由；所有接口都不可用时等待最早恢复的一个
+
+    参数:
+        endpoints: [Endpoint, ...]
+        latency_alpha: 耗时指数滑动平均的权重
+    """
+
+    def __init__(self, endpoints, latency_alpha=DEFAULT_LATENCY_ALPHA):
+        if not endpoints:
+            raise ValueError("至少需要一个接口")
+        self.endpoints = endpoints
+        self.latency_alpha = latency_alpha
+        self._changed = asyncio.Event()
+
+    @classmethod
+    def from_config(cls, endpoint_configs, breaker_factory=None, latency_alpha=DEFAULT_LATENCY_ALPHA):
+        """
+        从配置列表构建接口池
+
+        参数:
+            endpoint_configs: 列表，每项为 dict，字段同 Endpoint 的构造参数（不含 breaker；name 可省略，默认为 url）
+            breaker_factory: 函数 breaker_factory(名称) -> CircuitBreaker（None=不熔断）
+        """
+        endpoints = []
+        for cfg in endpoint_configs:
+            cfg = dict(cfg)
+            cfg.setdefault('name', cfg['url'])
+            breaker = breaker_factory(cfg['name']) if breaker_factory is not None else None
+            endpoints.append(Endpoint(breaker=breaker, **cfg))
+        return cls(endpoints, latency_alpha)
+
+    @property
+    def total_concurrency(self):
+        """所有接口并发上限之和（存在不限并发的接口时返回None）"""
+        limits = [e.max_concurrent for e in self.endpoints]
+        if any(limit is None for limit in limits):
+            return None
+        return sum(limits)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _score(self, endpoint, default_latency):
+        latency = endpoint.latency if endpoint.latency is not None else default_latency
+        return (endpoint.in_flight + 1) * latency / endpoint.weight
+
+    async def acquire(self):
+        """
+        选择一个接口（暂无可用接口时等待）
+
+        返回: (Endpoint, 是否为熔断器半开时的探测请求)，需在请求结束时传给 release
+        """
+        while True:
+            ready = [e for e in self.endpoints if e.is_ready()]
+            if ready:
+                known = [e.latency for e in self.endpoints if e.latency is not None]
+                default_latency = sum(known) / len(known) if known else 1.0
+                endpoint = min(ready, key=lambda e: self._score(e, default_latency))
+                # 熔断器已就绪，acquire 立即返回
+                is_probe = await endpoint.breaker.acquire() if endpoint.breaker is not None else False
+                endpoint.in_flight += 1
+                endpoint.usage['requests'] += 1
+                return endpoint, is_probe
+
+            # 没有可用接口：等待请求结束、权重调整，或最早的熔断器进入半开
+            hints = [e.breaker.reopen_in() for e in self.endpoints if e.breaker is not None and e.weight > 0]
+            hints = [h for h in hints if h is not None]
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), min(hints) if hints else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, endpoint, is_probe, status=None, elapsed=None, ok=False, cancelled=False):
+        """
+        请求结束后归还接口并记录结果
+
+        参数:
+            endpoint / is_probe: acquire 的返回值
+            status: HTTP状态码（None=没有拿到响应，如超时或连接失败）
+            elapsed: 耗时（秒）
+            ok: 是否拿到非空回答
+            cancelled: 请求被取消（如对冲落败、退出），不计入结果
+        """
+        endpoint.in_flight -= 1
+        if cancelled:
+            if endpoint.breaker is not None:
+                endpoint.breaker.cancel(is_probe)
+        else:
+            failed = is_server_failure(status)
+            if endpoint.breaker is not None:
+                endpoint.breaker.record(is_probe, failed)
+            endpoint.usage['success' if ok else 'failed'] += 1
+            # 成功请求计入耗时；没有响应的请求（超时等）只在比近期耗时更慢时计入，
+            # 快速失败（连接被拒、错误响应）不代表接口的处理速度，不能让故障接口显得更快
+            if elapsed is not None and (ok or (status is None and endpoint.latency is not None
+                                               and elapsed > endpoint.latency)):
+                endpoint.observe(elapsed, self.latency_alpha)
+        self._notify()
+
+    def set_weight(self, name, weight):
+        """运行中调整接口权重（0=不再分配新请求，在途请求不受影响）"""
+        for endpoint in self.endpoints:
+            if endpoint.name == name:
+                endpoint.weight = float(weight)
+                self._notify()
+                return endpoint
+        raise ValueError(f"没有名为 {name} 的接口")
+
+    def status(self):
+        """返回每个接口的当前状态和用量"""
+        return [{
+            'name': e.name,
+            'url': e.url,
+            'weight': e.weight,
+            'max_concurrent': e.max_concurrent,
+            'in_flight': e.in_flight,
+            'latency': round(e.latency, 3) if e.latency is not None else None,
+            'breaker': e.breaker.state if e.breaker is not None else None,
+            **e.usage,
+        } for e in self.endpoints]
+
+    def print_report(self):
+        """打印每个接口的请求分布、成功率、耗时和熔断器统计"""
+        total = sum(e.usage['requests'] for e in self.endpoints)
+        if len(self.endpoints) > 1:
+            print("接口用量:")
+            for e in self.endpoints:
+                share = e.usage['requests'] / total * 100 if total else 0.0
+                latency = f"{e.latency:.2f}秒" if e.latency is not None else "-"
+                print(f"  {e.name}: 请求 {e.usage['requests']} ({share:.1f}%), 成功 {e.usage['success']}, "
+                      f"失败 {e.usage['failed']}, 权重 {e.weight:g}, 近期耗时 {latency}")
+        for e in self.endpoints:
+            if e.breaker is not None:
+                e.breaker.print_report()
@@ -0,0 +1,149 @@
+import asyncio
+import signal
+
+
+def join_id_runs(first, second):
+    """两段请求ID（range）能连成一段等差序列时返回合并后的 range，否则返回None"""
+    if len(first) > 1:
+        step = first.step
+    elif len(second) > 1:
+        step = second.step
+    else:
+        step = second[0] - first[-1]
+    if step <= 0 or second[0] - first[-1] != step or (len(second) > 1 and second.step != step):
+        return None
+    return range(first[0], second[-1] + 1, step)
+
+
+class ShutdownController:
+    """
+    优雅退出控制：
+    - 第一次 Ctrl-C：停止派发新请求，已在途的请求在宽限期内继续完成并入库
+    - 宽限期结束或第二次 Ctrl-C：取消剩余请求
+    - 记录未完成的请求（未派发 / 未开始 / 被中断），便于之后补跑；
+      连续（等差）的请求ID合并为一段 range，停止时剩余请求再多也只占几段
+    """
+
+    def __init__(self):
+        self._stop = asyncio.Event()
+        self._force = asyncio.Event()
+        self._loop = None
+        self._installed_with_loop = False
+        self._previous_handler = None
+        self.left_jobs = []  # [(请求ID的 range, reason), ...]
+
+    @property
+    def stopping(self):
+        return self._stop.is_set()
+
+    def install(self):
+        """安装 SIGINT 处理（Windows 下 add_signal_handler 不可用时退回 signal.signal）"""
+        self._loop = asyncio.get_running_loop()
+        try:
+            self._loop.add_signal_handler(signal.SIGINT, self._on_signal)
+            self._installed_with_loop = True
+        except (NotImplementedError, RuntimeError):
+            self._previous_handler = signal.signal(
+                signal.SIGINT, lambda signum, frame: self._loop.call_soon_threadsafe(self._on_signal)
+            )
+
+    def uninstall(self):
+        if self._loop is None:
+            return
+        if self._installed_with_loop:
+            self._loop.remove_signal_handler(signal.SIGINT)
+        elif self._previous_handler is not None:
+            signal.signal(signal.SIGINT, self._previous_handler)
+        self._loop = None
+
+    def _on_signal(self):
+        if not self._stop.is_set():
+            print("\n收到中断信号：停止派发新请求，等待在途请求完成（再次按 Ctrl-C 立即取消）...")
+            self._stop.set()
+        else:
+            print("\n再次收到中断信号：立即取消剩余请求...")
+            self._force.set()
+
+    def request_stop(self):
+        """以代码方式触发停止（与第一次 Ctrl-C 相同）"""
+        self._stop.set()
+
+    def mark_left(self, request_ids, reason):
+        """
+        记录未完成的请求
+
+        参数:
+            request_ids: 单个请求ID，或请求ID序列（range 不逐个展开）
+            reason: not_dispatched=未派发, not_started=已派发未开始, cancelled=宽限期后被取消
+        """
+        if isinstance(request_ids, int):
+            request_ids = range(request_ids, request_ids + 1)
+        if isinstance(request_ids, range):
+            self._append_run(request_ids, reason)
+            return
+        for request_id in request_ids:
+            self._append_run(range(request_id, request_id + 1), reason)
+
+    def _append_run(self, run, reason):
+        if not run:
+            return
+        if self.left_jobs:
+            last, last_reason = self.left_jobs[-1]
+            merged = join_id_runs(last, run) if last_reason == reason else None
+            if merged is not None:
+                self.left_jobs[-1] = (merged, reason)
+                return
+        self.left_jobs.append((run, reason))
+
+    @property
+    def left_count(self):
+        """未完成的请求数"""
+        return sum(len(run) for run, _ in self.left_jobs)
+
+    def left_counts(self):
+        """返回: {reason: 未完成的请求数}"""
+        counts = {}
+        for run, reason in self.left_jobs:
+            counts[reason] = counts.get(reason, 0) + len(run)
+        return counts
+
+    async def drain(self, pool, grace_period):
+        """
+        等待工作池完成；收到停止信号后停止派发，最多再等待 grace_period 秒，之后取消仍在执行的请求
+
+        参数:
+            pool: WorkerPool（任务为请求ID）
+            grace_period: 宽限期（秒）
+
+        返回: 被取消的请求ID列表
+        """
+        finished = asyncio.ensure_future(pool.wait())
+        stop_waiter = asyncio.ensure_future(self._stop.wait())
+        try:
+            # 正常运行：等待全部完成或收到停止信号
+            await asyncio.wait({finished, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop_waiter.cancel()
+
+        if not finished.done():
+            # 宽限期：不再派发新请求，等待在途请求完成，或再次收到中断信号
+            pool.stop()
+            force_waiter = asyncio.ensure_future(self._force.wait())
+            try:
+                await asyncio.wait({finished, force_waiter}, timeout=grace_period, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                force_waiter.cancel()
+
+        cancelled = []
+        if not finished.done():
+            cancelled = await pool.cancel()
+            finished.cancel()
+
+        queued, not_dispatched = pool.left_jobs()
+        for request_id in queued:
+            # 已进入队列但还没有工作协程取走的请求并未真正发送
+            self.mark_left(request_id, 'not_started')
+        self.mark_left(not_dispatched, 'not_dispatched')
+        for request_id in sorted(cancelled):
+            self.mark_left(request_id, 'cancelled')
+        return cancelled
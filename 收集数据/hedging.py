@@ -0,0 +1,114 @@
+import asyncio
+import bisect
+import math
+
+
+class HedgePolicy:
+    """
+    对冲请求策略：
+    - 按提示词字节数分别维护历史耗时（来自数据库已有记录和本次运行的成功请求）
+    - 请求耗时超过该长度的耗时分位数时，再发送一个相同的请求，先成功返回者胜出
+    - 对冲请求数不超过主请求数的 max_fraction（同一用例的两次请求费用基本相同，落败请求被取消后
+      仍按预估输入token计费，见 CostTracker.settle，因此按次数限制即近似按费用限制；可用 describe_cost 核对）
+
+    参数:
+        percentile: 触发对冲的耗时分位数（0-100，例如 95）
+        max_fraction: 对冲请求数占主请求数的上限比例
+        min_samples: 某长度至少有多少条历史耗时才启用对冲
+    """
+
+    def __init__(self, percentile=95, max_fraction=0.1, min_samples=10):
+        if not 0 < percentile < 100:
+            raise ValueError("对冲分位数必须在0-100之间")
+        if not 0 < max_fraction <= 1:
+            raise ValueError("对冲比例上限必须在0-1之间")
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self.latencies = {}  # byte_count -> 已排序的耗时列表
+        self.primaries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def load(self, byte_count, elapsed_times):
+        """载入某长度的历史耗时"""
+        values = self.latencies.setdefault(byte_count, [])
+        for elapsed in elapsed_times:
+            if elapsed is not None:
+                bisect.insort(values, elapsed)
+
+    def observe(self, byte_count, elapsed):
+        """记录一次成功请求的耗时"""
+        bisect.insort(self.latencies.setdefault(byte_count, []), elapsed)
+
+    def delay_for(self, byte_count):
+        """返回该长度触发对冲的等待时间（历史样本不足时返回None）"""
+        values = self.latencies.get(byte_count, [])
+        if len(values) < self.min_samples:
+            return None
+        rank = math.ceil(self.percentile / 100 * len(values))
+        return values[max(0, rank - 1)]
+
+    def allow_hedge(self):
+        return self.hedges + 1 <= self.max_fraction * self.primaries
+
+    def describe(self):
+        return f"对冲 {self.hedges} 次（主请求 {self.primaries} 次），对冲胜出 {self.hedge_wins} 次"
+
+    def describe_cost(self, hedge_spent, spent):
+        """对冲请求费用占主请求费用的比例，与次数上限 max_fraction 对照"""
+        primary_spent = spent - hedge_spent
+        ratio = f"{hedge_spent / primary_spent * 100:.1f}%" if primary_spent > 0 else "-"
+        return (f"对冲费用 ${hedge_spent:.4f}，为主请求费用的 {ratio}"
+                f"（上限 {self.max_fraction * 100:.0f}%，按次数限制）")
+
+
+async def run_hedged(policy, byte_count, start_attempt):
+    """
+    执行一次（可能被对冲的）请求
+
+    参数:
+        policy: HedgePolicy
+        byte_count: 提示词字节数（用于查找该长度的耗时分位数）
+        start_attempt: 可调用对象 start_attempt(is_hedge) -> 协程或None；
+                       协程返回结果字典（需包含 'ok' 字段），返回None表示不能发起该次尝试（如预算不足）
+
+    返回: (结果字典, 是否由对冲请求胜出)
+    """
+    policy.primaries += 1
+    primary = asyncio.ensure_future(start_attempt(False))
+    tasks = [primary]
+    try:
+        delay = policy.delay_for(byte_count)
+        if delay is None:
+            return await primary, False
+
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not policy.allow_hedge():
+            return await primary, False
+
+        hedge_coro = start_attempt(True)
+        if hedge_coro is None:
+            return await primary, False
+        policy.hedges += 1
+        hedge = asyncio.ensure_future(hedge_coro)
+        tasks.append(hedge)
+
+        # 先成功返回者胜出；先返回的是失败结果时继续等待另一个
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if result['ok']:
+                    if task is hedge:
+                        policy.hedge_wins += 1
+                    return result, task is hedge
+        return primary.result(), False
+    finally:
+        # 取消仍未完成的一方（落败请求），并等待其清理（释放密钥、结算费用）
+        losers = [task for task in tasks if not task.done()]
+        for task in losers:
+            task.cancel()
+        if losers:
+            await asyncio.gather(*losers, return_exceptions=True)
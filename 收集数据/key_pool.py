@@ -0,0 +1,290 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """按分钟补充的令牌桶（用于 RPM / TPM 限制）"""
+
+    def __init__(self, per_minute):
+        """
+        参数:
+            per_minute: 每分钟允许的数量（请求数或token数）
+        """
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = float(per_minute) / 60.0  # 每秒补充量
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def _clamp(self, amount):
+        # 单次需求超过桶容量时，按"桶满即可放行"处理，避免永远无法满足
+        return min(float(amount), self.capacity)
+
+    def can_consume(self, amount, now):
+        self._refill(now)
+        return self.level >= self._clamp(amount)
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.level -= self._clamp(amount)
+
+    def correct(self, charged, actual, now):
+        """按实际用量修正此前的扣减（charged 为当时传给 consume 的数量；余量可以为负，之后按速率恢复）"""
+        self._refill(now)
+        self.level = min(self.capacity, self.level - (actual - self._clamp(charged)))
+
+    def time_until(self, amount, now):
+        """距离可以消耗 amount 还需等待的秒数"""
+        self._refill(now)
+        missing = self._clamp(amount) - self.level
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float('inf')
+
+    def set_rate(self, per_minute, now):
+        """运行中调整每分钟配额（当前余量保留，但不超过新容量）"""
+        self._refill(now)
+        self.capacity = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.level = min(self.level, self.capacity)
+
+
+class ApiKey:
+    """单个API密钥的状态（并发、配额桶、冷却、用量）"""
+
+    def __init__(self, name, key, max_concurrent=None, rpm=None, tpm=None, cooldown=60):
+        """
+        参数:
+            name: 密钥名称（仅用于显示）
+            key: 密钥本体（Bearer token）
+            max_concurrent: 该密钥的最大并发数（None=不限制）
+            rpm: 每分钟请求数上限（None=不限制）
+            tpm: 每分钟token数上限（None=不限制）
+            cooldown: 收到429后的默认冷却时间（秒）
+        """
+        self.name = name
+        self.key = key
+        self.max_concurrent = max_concurrent
+        self.rpm_bucket = TokenBucket(rpm) if rpm else None
+        self.tpm_bucket = TokenBucket(tpm) if tpm else None
+        self.cooldown = cooldown
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        # 用量统计
+        self.usage = {
+            'requests': 0,
+            'success': 0,
+            'failed': 0,
+            'rate_limited': 0,
+            'estimated_tokens': 0,
+            'actual_tokens': 0,  # 服务端 usage 报告的输入+输出token数
+        }
+
+    @property
+    def load(self):
+        """负载：占用比例（不限并发时按在途请求数计）"""
+        if self.max_concurrent:
+            return self.in_flight / self.max_concurrent
+        return float(self.in_flight)
+
+    def is_eligible(self, estimated_tokens, now):
+        if now < self.cooldown_until:
+            return False
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            return False
+        if self.rpm_bucket and not self.rpm_bucket.can_consume(1, now):
+            return False
+        if self.tpm_bucket and not self.tpm_bucket.can_consume(estimated_tokens, now):
+            return False
+        return True
+
+    def wait_hint(self, estimated_tokens, now):
+        """估算该密钥最早可用的等待时间（并发占满时返回None，需等待释放）"""
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            return None
+        waits = [max(0.0, self.cooldown_until - now)]
+        if self.rpm_bucket:
+            waits.append(self.rpm_bucket.time_until(1, now))
+        if self.tpm_bucket:
+            waits.append(self.tpm_bucket.time_until(estimated_tokens, now))
+        return max(waits)
+
+
+class KeyPool:
+    """
+    API密钥池：
+    - 每个密钥有独立的并发上限、RPM/TPM令牌桶和429冷却
+    - 每次请求路由到"当前可用且负载最低"的密钥
+    - 按密钥统计用量
+    """
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError("密钥池至少需要一个密钥")
+        self.keys = keys
+        self._condition = asyncio.Condition()
+        self._notify_tasks = set()  # 归还密钥后唤醒等待者的任务（保留引用，避免被回收）
+
+    @classmethod
+    def from_config(cls, key_configs):
+        """
+        从配置列表构建密钥池
+
+        参数:
+            key_configs: 列表，每项为 dict，字段同 ApiKey 的构造参数
+                         （name 可省略，默认 key-1, key-2, ...）
+        """
+        keys = []
+        for idx, cfg in enumerate(key_configs, start=1):
+            cfg = dict(cfg)
+            cfg.setdefault('name', f"key-{idx}")
+            keys.append(ApiKey(**cfg))
+        return cls(keys)
+
+    @property
+    def total_concurrency(self):
+        """所有密钥并发上限之和（存在不限并发的密钥时返回None）"""
+        limits = [k.max_concurrent for k in self.keys]
+        if any(limit is None for limit in limits):
+            return None
+        return sum(limits)
+
+    async def acquire(self, estimated_tokens=0):
+        """
+        获取一个可用密钥（若暂无可用密钥则等待）
+
+        参数:
+            estimated_tokens: 本次请求预估token数（用于TPM限制）
+
+        返回: ApiKey
+        """
+        async with self._condition:
+            while True:
+                now = time.monotonic()
+                eligible = [k for k in self.keys if k.is_eligible(estimated_tokens, now)]
+                if eligible:
+                    key = min(eligible, key=lambda k: (k.load, k.in_flight))
+                    key.in_flight += 1
+                    if key.rpm_bucket:
+                        key.rpm_bucket.consume(1, now)
+                    if key.tpm_bucket:
+                        key.tpm_bucket.consume(estimated_tokens, now)
+                    key.usage['requests'] += 1
+                    key.usage['estimated_tokens'] += estimated_tokens
+                    return key
+
+                # 没有可用密钥：等待释放通知，或等待最早的冷却/配额恢复
+                hints = [k.wait_hint(estimated_tokens, now) for k in self.keys]
+                hints = [h for h in hints if h is not None]
+                timeout = min(hints) if hints else None
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def release(self, key, success=False, status=None, retry_after=None, estimated_tokens=0, usage=None):
+        """
+        归还密钥并记录结果
+        记账是同步完成的（不等待锁）：请求在 finally 中归还密钥时可能再次被取消（宽限期取消、对冲落败），
+        等待锁期间被取消会使在途计数永远不减，该密钥此后一直少一个并发；唤醒等待者的 notify_all 另行调度
+
+        参数:
+            key: acquire 返回的 ApiKey
+            success: 本次请求是否成功
+            status: HTTP状态码（429时触发冷却）
+            retry_after: 服务端返回的 Retry-After 秒数（可选）
+            estimated_tokens: acquire 时按预估扣减的token数
+            usage: parse_usage 的结果（有时按实际的输入+输出token数修正TPM令牌桶）
+        """
+        key.in_flight -= 1
+        if success:
+            key.usage['success'] += 1
+        else:
+            key.usage['failed'] += 1
+        if status == 429:
+            key.usage['rate_limited'] += 1
+            cooldown = retry_after if retry_after is not None else key.cooldown
+            key.cooldown_until = max(key.cooldown_until, time.monotonic() + cooldown)
+        if usage:
+            actual_tokens = usage['prompt_tokens'] + usage['completion_tokens']
+            key.usage['actual_tokens'] += actual_tokens
+            if key.tpm_bucket:
+                key.tpm_bucket.correct(estimated_tokens, actual_tokens, time.monotonic())
+        task = asyncio.get_running_loop().create_task(self._notify())
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def set_limits(self, name=None, **limits):
+        """
+        运行中调整密钥的限额（在途请求不受影响，等待中的请求按新限额重新判断）
+
+        参数:
+            name: 密钥名称（None=所有密钥）
+            limits: max_concurrent / rpm / tpm，值为 None 表示取消该限制；未给出的限额不变
+
+        返回: 被调整的密钥列表
+        """
+        keys = [k for k in self.keys if name is None or k.name == name]
+        if not keys:
+            raise ValueError(f"没有名为 {name} 的密钥")
+        async with self._condition:
+            now = time.monotonic()
+            for key in keys:
+                if 'max_concurrent' in limits:
+                    key.max_concurrent = limits['max_concurrent']
+                for field in ('rpm', 'tpm'):
+                    if field not in limits:
+                        continue
+                    per_minute = limits[field]
+                    bucket = getattr(key, f"{field}_bucket")
+                    if not per_minute:
+                        setattr(key, f"{field}_bucket", None)
+                    elif bucket is None:
+                        setattr(key, f"{field}_bucket", TokenBucket(per_minute))
+                    else:
+                        bucket.set_rate(per_minute, now)
+            self._condition.notify_all()
+        return keys
+
+    def status(self):
+        """返回每个密钥的当前状态（限额、在途请求数、剩余冷却时间）和用量"""
+        now = time.monotonic()
+        return [{
+            'name': k.name,
+            'max_concurrent': k.max_concurrent,
+            'rpm': k.rpm_bucket.capacity if k.rpm_bucket else None,
+            'tpm': k.tpm_bucket.capacity if k.tpm_bucket else None,
+            'in_flight': k.in_flight,
+            'cooldown_seconds': round(max(0.0, k.cooldown_until - now), 1),
+            **k.usage,
+        } for k in self.keys]
+
+    def report(self):
+        """返回每个密钥的用量统计列表"""
+        return [{'name': k.name, **k.usage} for k in self.keys]
+
+    def print_report(self):
+        """打印每个密钥的用量统计"""
+        print("密钥用量:")
+        for row in self.report():
+            print(f"  {row['name']}: 请求 {row['requests']}, 成功 {row['success']}, "
+                  f"失败 {row['failed']}, 429 {row['rate_limited']}, "
+                  f"预估token {row['estimated_tokens']}, 实际token {row['actual_tokens']}")
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头（仅支持秒数格式），失败返回None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
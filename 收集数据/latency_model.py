@@ -0,0 +1,124 @@
+import math
+from collections import deque
+
+from open_loop import percentile
+
+
+def _solve(matrix, vector):
+    """高斯消元求解小型线性方程组（矩阵为对称正定时稳定）"""
+    n = len(vector)
+    a = [row[:] + [vector[i]] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        for r in range(col + 1, n):
+            factor = a[r][col] / a[col][col]
+            for c in range(col, n + 1):
+                a[r][c] -= factor * a[col][c]
+    solution = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        solution[r] = (a[r][n] - sum(a[r][c] * solution[c] for c in range(r + 1, n))) / a[r][r]
+    return solution
+
+
+class LatencyModel:
+    """
+    请求耗时模型：ln(耗时) = a + b·ln(提示词字节数) + c·针数 + 残差
+    - 系数用（带微小岭正则的）最小二乘拟合，充分统计量随样本增量累加，refit 只需解 3x3 方程
+    - 分位数 = 指数(预测均值 + 最近残差的经验分位数)，耗时分布的右偏由残差直接体现
+    - 只有一种长度时 ln(字节数) 项由正则压为0，模型退化为该长度的耗时分布
+    - 超时的请求按超时时间计入（右删失：真实耗时至少这么长），否则只拟合成功请求会低估 P99，
+      超时随之缩短又会截掉更多慢但有效的请求
+
+    参数:
+        min_samples: 至少多少条样本才给出预测
+        refit_every: 每新增多少条样本重新求解系数
+        residual_window: 用于分位数的最近残差条数
+        ridge: 岭正则系数（避免只有一种长度或针数时方程奇异）
+    """
+
+    def __init__(self, min_samples=20, refit_every=10, residual_window=2000, ridge=1e-6):
+        self.min_samples = min_samples
+        self.refit_every = refit_every
+        self.ridge = ridge
+        self._xtx = [[0.0] * 3 for _ in range(3)]
+        self._xty = [0.0] * 3
+        self._samples = deque(maxlen=residual_window)  # (特征, ln耗时)
+        self.count = 0
+        self._pending = 0
+        self.coefficients = None
+        self._residuals = []  # 已排序
+        self.longest = None  # 最近样本中的最长耗时（秒）
+
+    @staticmethod
+    def _features(byte_count, needles):
+        return (1.0, math.log(max(byte_count, 1)), float(needles))
+
+    def observe(self, byte_count, needles, elapsed, refit=True):
+        """加入一条耗时（成功请求的耗时，或超时请求的超时时间）；每 refit_every 条自动重新拟合"""
+        if elapsed is None or elapsed <= 0:
+            return
+        x = self._features(byte_count, needles)
+        y = math.log(elapsed)
+        for i in range(3):
+            self._xty[i] += x[i] * y
+            for j in range(3):
+                self._xtx[i][j] += x[i] * x[j]
+        self._samples.append((x, y))
+        self.longest = max(self.longest or 0.0, elapsed)
+        self.count += 1
+        self._pending += 1
+        if refit and (self.coefficients is None or self._pending >= self.refit_every):
+            self.refit()
+
+    def refit(self):
+        """求解系数并重算残差分布"""
+        self._pending = 0
+        if self.count < self.min_samples:
+            return
+        scale = max(self._xtx[0][0], 1.0)
+        # 正则只作用于斜率项；按样本数缩放，使其相对数据始终可以忽略
+        matrix = [[self._xtx[i][j] + (self.ridge * scale if i == j and i > 0 else 0.0) for j in range(3)]
+                  for i in range(3)]
+        self.coefficients = _solve(matrix, self._xty)
+        self._residuals = sorted(y - self._mean(x) for x, y in self._samples)
+        self.longest = math.exp(max(y for _, y in self._samples))
+
+    def _mean(self, x):
+        return sum(c * v for c, v in zip(self.coefficients, x))
+
+    @property
+    def ready(self):
+        return self.coefficients is not None
+
+    def predict(self, byte_count, needles, p=50):
+        """预测耗时的 p 分位数（秒）；样本不足时返回None"""
+        if not self.ready:
+            return None
+        return math.exp(self._mean(self._features(byte_count, needles)) + percentile(self._residuals, p))
+
+    def timeout_for(self, byte_count, needles, default, factor=2.0, p=99, minimum=60):
+        """
+        单个请求的超时时间：预测 p 分位数耗时的 factor 倍，且不短于最近观测到的最长耗时，
+        限制在 [minimum, default] 之间；模型未就绪时为 default
+        """
+        predicted = self.predict(byte_count, needles, p)
+        if predicted is None:
+            return default
+        return min(default, max(minimum, predicted * factor, self.longest))
+
+    def eta(self, byte_count, needles, remaining, concurrency):
+        """剩余 remaining 个请求以 concurrency 并发完成的预计时间（秒）；模型未就绪时返回None"""
+        predicted = self.predict(byte_count, needles, 50)
+        if predicted is None:
+            return None
+        return predicted * math.ceil(remaining / max(concurrency, 1))
+
+    def describe(self, byte_count, needles):
+        if not self.ready:
+            return f"耗时模型: 样本不足（{self.count}/{self.min_samples}）"
+        p50 = self.predict(byte_count, needles, 50)
+        p90 = self.predict(byte_count, needles, 90)
+        p99 = self.predict(byte_count, needles, 99)
+        return (f"耗时模型（{self.count} 条样本）: {byte_count} 字节/{needles} 针 预计 "
+                f"P50 {p50:.1f}秒, P90 {p90:.1f}秒, P99 {p99:.1f}秒")
@@ -0,0 +1,205 @@
+import asyncio
+import itertools
+import math
+
+from worker_pool import remaining_jobs
+
+ARRIVAL_PROCESSES = ('poisson', 'constant')
+
+
+def percentile(sorted_values, p):
+    """返回已排序列表的p分位数（0-100，最近秩法）；列表为空时返回None"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(p / 100 * len(sorted_values))
+    return sorted_values[max(0, rank - 1)]
+
+
+class OpenLoopRunner:
+    """
+    开环负载：按目标到达率发送请求，与在途请求是否完成无关
+    - poisson: 到达间隔服从指数分布（泊松到达）
+    - constant: 固定间隔
+    按绝对时间表发送（不因事件循环延迟而累积漂移）
+
+    与 WorkerPool 提供相同的 wait / stop / cancel / left_jobs 接口，可直接交给 ShutdownController.drain
+
+    参数:
+        handler: 异步函数 handler(job)，返回是否成功
+        jobs: 任务迭代器（请求ID）
+        rate: 目标到达率（请求/秒）
+        process: 'poisson' 或 'constant'
+        rng: random.Random（生成泊松到达间隔）
+    """
+
+    def __init__(self, handler, jobs, rate, process, rng):
+        if rate <= 0:
+            raise ValueError("到达率必须大于0")
+        if process not in ARRIVAL_PROCESSES:
+            raise ValueError(f"到达过程必须是 {' / '.join(ARRIVAL_PROCESSES)} 之一")
+        self._handler = handler
+        self._source = jobs
+        self._jobs = iter(jobs)
+        self.rate = rate
+        self.process = process
+        self._rng = rng
+        self._stopped = False
+        self._producer = None
+        self._producer_done = False
+        self._scheduled = None  # 已从迭代器取出、等待到达时刻的任务
+        self._idle = asyncio.Event()
+        self.running = {}  # Task -> 请求ID
+        self.sent = 0
+        self.first_send = None
+        self.last_send = None
+        self.last_done = None
+        self.latencies = []  # 成功请求从发送到完成的耗时
+        self.succeeded = 0
+        self.finished = 0
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def _interval(self):
+        if self.process == 'poisson':
+            return self._rng.expovariate(self.rate)
+        return 1 / self.rate
+
+    def start(self):
+        self._producer = asyncio.ensure_future(self._produce())
+
+    async def _produce(self):
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        try:
+            for job in self._jobs:
+                self._scheduled = job
+                delay = next_time - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._scheduled = None
+                task = asyncio.ensure_future(self._run(job))
+                self.running[task] = job
+                self.sent += 1
+                now = loop.time()
+                if self.first_send is None:
+                    self.first_send = now
+                self.last_send = now
+                next_time += self._interval()
+        finally:
+            self._producer_done = True
+            self._check_idle()
+
+    async def _run(self, job):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            ok = await self._handler(job)
+        except Exception as e:
+            print(f"任务 {job} 执行出错: {e}")
+            ok = False
+        finally:
+            self.running.pop(asyncio.current_task(), None)
+            self._check_idle()
+        now = loop.time()
+        self.finished += 1
+        self.last_done = now
+        if ok:
+            self.succeeded += 1
+            self.latencies.append(now - start)
+
+    def _check_idle(self):
+        if self._producer_done and not self.running:
+            self._idle.set()
+
+    async def wait(self, timeout=None):
+        """等待发送结束且所有在途请求完成；超时返回False"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stop(self):
+        """停止发送新请求（在途请求继续）"""
+        self._stopped = True
+        if self._producer is not None:
+            self._producer.cancel()
+
+    async def cancel(self):
+        """取消所有在途请求，返回被中断的请求ID列表"""
+        self.stop()
+        interrupted = list(self.running.values())
+        tasks = list(self.running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(self._producer, *tasks, return_exceptions=True)
+        return interrupted
+
+    def left_jobs(self):
+        """返回: ([], 尚未发送的请求ID（见 remaining_jobs）)（开环模式没有排队等待的请求）"""
+        jobs = self._jobs
+        if self._scheduled is not None:
+            jobs = itertools.chain([self._scheduled], jobs)
+            self._scheduled = None
+        return [], remaining_jobs(self._source, jobs, self.sent)
+
+    def summary(self):
+        """
+        返回本档负载的统计
+
+        offered_rate: 目标到达率
+        send_rate: 实际发送速率
+        throughput: 成功完成速率（成功数 / 从首次发送到最后完成的时间）
+        success_rate: 成功率
+        p50 / p90 / p99 / mean: 成功请求耗时（秒）
+        """
+        latencies = sorted(self.latencies)
+        send_window = (self.last_send - self.first_send) if self.sent > 1 else 0.0
+        total_window = (self.last_done - self.first_send) if self.last_done is not None else 0.0
+        return {
+            'offered_rate': self.rate,
+            'sent': self.sent,
+            'succeeded': self.succeeded,
+            'send_rate': (self.sent - 1) / send_window if send_window > 0 else None,
+            'throughput': self.succeeded / total_window if total_window > 0 else None,
+            'success_rate': self.succeeded / self.finished if self.finished else None,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+        }
+
+
+def _format_seconds(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def print_load_curve(steps, latency_factor=1.5, min_success_rate=0.9):
+    """
+    打印延迟-负载曲线，并标出拐点：首个P50耗时超过最低负载档 latency_factor 倍、
+    或成功率低于 min_success_rate 的档位（每档请求数较少时，成功吞吐会因收尾阶段而偏低，因此按耗时判断）
+
+    参数:
+        steps: OpenLoopRunner.summary() 的列表（按档位顺序）
+    """
+    print("延迟-负载曲线（到达率/吞吐单位: 请求/秒，耗时单位: 秒）:")
+    print("  目标到达率 | 实际发送 | 成功吞吐 | 成功率 | P50 | P90 | P99")
+    baseline = next((step['p50'] for step in sorted(steps, key=lambda s: s['offered_rate']) if step['p50']), None)
+    knee = None
+    for step in steps:
+        send_rate = f"{step['send_rate']:.2f}" if step['send_rate'] is not None else "-"
+        throughput = f"{step['throughput']:.2f}" if step['throughput'] is not None else "-"
+        success_rate = f"{step['success_rate']:.0%}" if step['success_rate'] is not None else "-"
+        print(f"  {step['offered_rate']:g} | {send_rate} | {throughput} | {success_rate} | "
+              f"{_format_seconds(step['p50'])} | {_format_seconds(step['p90'])} | {_format_seconds(step['p99'])}")
+        slow = baseline is not None and step['p50'] is not None and step['p50'] > latency_factor * baseline
+        failing = step['success_rate'] is not None and step['success_rate'] < min_success_rate
+        if knee is None and (slow or failing):
+            knee = step
+    if knee is not None:
+        print(f"  拐点: 约 {knee['offered_rate']:g} 请求/秒（P50耗时超过最低负载档的 {latency_factor:g} 倍"
+              f"或成功率低于 {min_success_rate:.0%}）")
+    else:
+        print("  各档均未出现明显的耗时上升或成功率下降")
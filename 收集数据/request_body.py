@@ -0,0 +1,96 @@
+import json
+from array import array
+
+# 提示词在请求体模板中的占位符（序列化后按它切分出前缀和后缀）
+_PROMPT_PLACEHOLDER = "__PROMPT_PLACEHOLDER__"
+
+
+def escape_json_string(text):
+    """把文本转义为JSON字符串内容（不含两侧引号），返回UTF-8字节"""
+    return json.dumps(text, ensure_ascii=False)[1:-1].encode('utf-8')
+
+
+# ASCII字符转义后的字节长度（引号、反斜杠和控制字符会变长）
+_ASCII_ESCAPED_LENGTHS = [len(escape_json_string(chr(code))) for code in range(128)]
+
+
+class RequestBodyTemplate:
+    """
+    预编码的请求体模板：
+    - 请求体 = 前缀（模型、消息结构和指令文本） + 插针后的基础文本 + 后缀（结尾文本和stream等字段）
+    - 前缀、后缀和基础文本只在创建模板时转义一次，每次请求只按插针位置拼接字节片段
+    - 四位数针值是纯数字，无需转义
+
+    参数:
+        payload_fields: 除 messages 外的请求字段（如 model、stream）
+        instruction: 基础文本之前的指令文本
+        base_string: 基础文本（插针前）
+        trailer: 基础文本之后的结尾文本（如放在末尾的指令）
+    """
+
+    def __init__(self, payload_fields, instruction, base_string, trailer=""):
+        payload = dict(payload_fields)
+        payload['messages'] = [{"role": "user", "content": _PROMPT_PLACEHOLDER}]
+        # 保持 model 在前、messages 紧随其后的常见字段顺序
+        ordered = {'model': payload.pop('model', None), 'messages': payload.pop('messages')}
+        if ordered['model'] is None:
+            del ordered['model']
+        ordered.update(payload)
+        encoded = json.dumps(ordered, ensure_ascii=False)
+        head, tail = encoded.split(f'"{_PROMPT_PLACEHOLDER}"')
+        self.prefix = (head + '"').encode('utf-8') + escape_json_string(instruction)
+        self.suffix = escape_json_string(trailer) + ('"' + tail).encode('utf-8')
+
+        self.base_string = base_string
+        self.escaped_base = escape_json_string(base_string)
+        self._escaped_view = memoryview(self.escaped_base)
+        # 提示词（未转义）的字节数 = 指令字节数 + 基础文本字节数 + 结尾文本字节数 + 针值字节数
+        self.fixed_prompt_bytes = (len(instruction.encode('utf-8')) + len(base_string.encode('utf-8'))
+                                   + len(trailer.encode('utf-8')))
+
+        # 字符位置 -> 转义后字节偏移；纯ASCII且无需转义时二者相同，不建表
+        if len(self.escaped_base) == len(base_string):
+            self._offsets = None
+        else:
+            offsets = array('Q', [0])
+            total = 0
+            for char in base_string:
+                code = ord(char)
+                if code < 0x80:
+                    total += _ASCII_ESCAPED_LENGTHS[code]
+                elif code < 0x800:
+                    total += 2
+                elif code < 0x10000:
+                    total += 3
+                else:
+                    total += 4
+                offsets.append(total)
+            self._offsets = offsets
+
+    def _offset(self, position):
+        return position if self._offsets is None else self._offsets[position]
+
+    def build(self, insertions):
+        """
+        拼接一次请求的请求体
+
+        参数:
+            insertions: [(字符位置, 针值字符串), ...]，按位置升序
+
+        返回: bytes
+        """
+        view = self._escaped_view
+        parts = [self.prefix]
+        previous = 0
+        for position, needle in insertions:
+            offset = self._offset(position)
+            parts.append(view[previous:offset])
+            parts.append(needle.encode('ascii'))
+            previous = offset
+        parts.append(view[previous:])
+        parts.append(self.suffix)
+        return b"".join(parts)
+
+    def prompt_byte_count(self, insertions):
+        """返回提示词（未转义）的UTF-8字节数，与 get_byte_count(prompt_content) 相同"""
+        return self.fixed_prompt_bytes + sum(len(needle) for _, needle in insertions)
@@ -0,0 +1,84 @@
+import gzip
+import logging
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from request_log import log_event
+
+SUPPORTED_ENCODINGS = ('gzip', 'zstd')
+
+
+def compress_body(body, encoding, level):
+    """按指定编码和级别压缩请求体"""
+    if encoding == 'gzip':
+        # mtime=0：相同请求体压缩结果相同
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    raise ValueError(f"不支持的压缩编码: {encoding}")
+
+
+class RequestCompressor:
+    """
+    请求体压缩（Content-Encoding）：
+    - 按请求体大小选择压缩级别（大请求体用较低级别，避免压缩本身拖慢请求）
+    - 服务器返回 415 时视为不支持该编码，之后的请求不再压缩
+
+    参数:
+        encoding: 'gzip' 或 'zstd'
+        levels: [(请求体字节数上限, 压缩级别), ...]，按上限升序，最后一项上限为None
+    """
+
+    def __init__(self, encoding, levels):
+        if encoding not in SUPPORTED_ENCODINGS:
+            raise ValueError(f"压缩编码必须是 {' / '.join(SUPPORTED_ENCODINGS)} 之一")
+        if encoding == 'zstd' and zstandard is None:
+            raise ValueError("使用 zstd 压缩需要安装 zstandard 包 (pip install zstandard)")
+        self.encoding = encoding
+        self.levels = levels
+        self.enabled = True
+        self.requests = 0
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.compress_time = 0.0
+
+    def level_for(self, size):
+        for limit, level in self.levels:
+            if limit is None or size <= limit:
+                return level
+        return self.levels[-1][1]
+
+    def encode(self, body):
+        """
+        返回: (实际发送的字节, 需要附加的请求头)；已停用压缩时原样返回
+        """
+        if not self.enabled:
+            return body, {}
+        start = time.perf_counter()
+        data = compress_body(body, self.encoding, self.level_for(len(body)))
+        self.compress_time += time.perf_counter() - start
+        self.requests += 1
+        self.raw_bytes += len(body)
+        self.wire_bytes += len(data)
+        return data, {'content-encoding': self.encoding}
+
+    def reject(self):
+        """服务器不接受该编码：停用压缩"""
+        if self.enabled:
+            self.enabled = False
+            log_event(logging.WARNING, 'compression_rejected',
+                      "服务器不支持 {encoding} 压缩的请求体 (HTTP 415)，之后的请求不再压缩", encoding=self.encoding)
+
+    def print_report(self):
+        """打印压缩汇总"""
+        print("请求体压缩:")
+        state = "" if self.enabled else "（已因服务器不支持而停用）"
+        print(f"  编码: {self.encoding}{state}")
+        if self.requests:
+            ratio = self.wire_bytes / self.raw_bytes
+            print(f"  压缩请求数: {self.requests}, 原始 {self.raw_bytes} 字节 -> 发送 {self.wire_bytes} 字节 ({ratio:.1%})")
+            print(f"  压缩耗时: 合计 {self.compress_time:.2f}秒, 平均 {self.compress_time / self.requests * 1000:.1f}毫秒/请求")
@@ -0,0 +1,152 @@
+import json
+import logging
+import logging.handlers
+import math
+import queue
+import sys
+import time
+
+LOGGER_NAME = 'run_batch_test'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+_logger = logging.getLogger(LOGGER_NAME)
+_logger.propagate = False
+
+
+def log_event(level, event, template, **fields):
+    """
+    记录一条结构化日志（在调用线程中只做级别判断和入队，格式化与输出在后台线程完成）
+
+    参数:
+        level: logging 级别（如 logging.INFO）
+        event: 事件名（如 request_success，用于采样和检索）
+        template: 控制台消息模板（str.format 格式，字段取自 fields）
+        fields: 结构化字段（写入 JSON 行）
+    """
+    if _logger.isEnabledFor(level):
+        _logger.log(level, template, extra={'event': event, 'fields': fields})
+
+
+def render_message(record):
+    """按模板和字段生成可读消息"""
+    fields = getattr(record, 'fields', None)
+    if fields is None:
+        return record.getMessage()
+    return record.msg.format(**fields)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """控制台输出：只输出可读消息（与原先的 print 输出相同）"""
+
+    def format(self, record):
+        return render_message(record)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """JSON 行格式：时间、级别、事件名、结构化字段和可读消息"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'event': getattr(record, 'event', None),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        entry['message'] = render_message(record)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class EventSampler(logging.Filter):
+    """
+    按事件采样：rates 为 {事件名: 保留比例(0-1)}，未列出的事件和 WARNING 及以上的记录全部保留
+    按计数确定性采样（第 n 条记录在 floor(n×比例) 增加时保留），保留条数与总条数严格成比例
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.seen = {}
+        self.dropped = {}
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        rate = self.rates.get(event)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        count = self.seen.get(event, 0) + 1
+        self.seen[event] = count
+        if math.floor(count * rate) > math.floor((count - 1) * rate):
+            return True
+        self.dropped[event] = self.dropped.get(event, 0) + 1
+        return False
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """入队时不格式化记录（默认的 QueueHandler 会在调用线程中格式化），格式化留给后台线程"""
+
+    def prepare(self, record):
+        return record
+
+
+class RequestLogging:
+    """
+    请求日志：记录经 QueueHandler 放入队列，由后台线程（QueueListener）写到控制台和可选的轮转文件
+    高并发时事件循环不再被同步的 stdout / 文件写入阻塞
+
+    参数:
+        level: 日志级别（LOG_LEVELS 之一）
+        sample_rates: {事件名: 保留比例}，None=不采样
+        log_file: JSON 行日志文件路径（None=不写文件）
+        max_bytes: 单个日志文件的最大字节数（超过后轮转）
+        backup_count: 保留的轮转文件数
+        console: 是否输出到控制台
+    """
+
+    def __init__(self, level='INFO', sample_rates=None, log_file=None, max_bytes=50 * 1024 * 1024,
+                 backup_count=5, console=True):
+        if level not in LOG_LEVELS:
+            raise ValueError(f"日志级别必须是 {' / '.join(LOG_LEVELS)} 之一")
+        for event, rate in (sample_rates or {}).items():
+            if not 0 <= rate <= 1:
+                raise ValueError(f"事件 {event} 的采样比例必须在0-1之间")
+        self.level = level
+        self.log_file = log_file
+        self.sampler = EventSampler(sample_rates or {})
+        self._handlers = []
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(ConsoleFormatter())
+            self._handlers.append(console_handler)
+        if log_file:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True
+            )
+            file_handler.setFormatter(JsonLinesFormatter())
+            self._handlers.append(file_handler)
+        self._queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+        self._queue_handler.addFilter(self.sampler)
+        self._listener = logging.handlers.QueueListener(self._queue_handler.queue, *self._handlers)
+
+    def start(self):
+        _logger.setLevel(self.level)
+        _logger.addHandler(self._queue_handler)
+        self._listener.start()
+
+    def stop(self):
+        """停止后台线程（会先写出队列中剩余的记录）"""
+        _logger.removeHandler(self._queue_handler)
+        self._listener.stop()
+        for handler in self._handlers:
+            handler.close()
+
+    def print_report(self):
+        if not self.sampler.rates and not self.log_file:
+            return
+        print("日志:")
+        print(f"  级别: {self.level}")
+        if self.log_file:
+            print(f"  JSON日志文件: {self.log_file}")
+        for event, rate in self.sampler.rates.items():
+            seen = self.sampler.seen.get(event, 0)
+            kept = seen - self.sampler.dropped.get(event, 0)
+            print(f"  {event}: 采样 {rate:g}，保留 {kept}/{seen}")
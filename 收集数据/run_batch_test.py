@@ -1,19 +1,55 @@
 import asyncio
 import aiohttp
+import glob
+import hashlib
 import json
+import logging
+import math
 import re
 import sqlite3
 import time
 import os
+import random
 import sys
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from cassette import CassetteSession, CassetteStore, RecordingSession, ReplaySession, compute_case_hash
+from batch_file import batch_custom_id, read_batch_results, write_batch_requests
+from circuit_breaker import CircuitBreaker
+from connection_pool import ConnectionStats, build_connector
+from control_server import ControlServer, parse_control_address
+from cost_tracker import CostTracker, parse_usage
+from endpoint_pool import EndpointPool
+from graceful_shutdown import ShutdownController
+from hedging import HedgePolicy, run_hedged
+from key_pool import KeyPool, parse_retry_after
+from latency_model import LatencyModel
+from request_body import RequestBodyTemplate
+from request_compression import RequestCompressor
+from request_log import RequestLogging, log_event
+from open_loop import ARRIVAL_PROCESSES, OpenLoopRunner, print_load_curve
+from sequential_stopping import SequentialStopper
+from shard_runner import parse_shard, run_shards, shard_request_ids, strip_option
+from sse_parser import SSEParser
+from trace_events import NULL_TRACE, TraceRecorder
+from worker_pool import WorkerPool
+
 # 获取脚本所在目录
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# 添加数据分析目录到路径，以便导入grading_utils（用于入库时增量评分）
+sys.path.insert(0, os.path.join(SCRIPT_DIR, '..', '数据分析'))
+from grading_utils import answers_from_sequence, grade_answers
+
 # 配置参数
 API_URL = "https://api.moonshot.ai/v1/chat/completions"
 MODEL_ID = "moonshotai/kimi-k2.5"      # 模型ID（用于数据库文件名）
 API_MODEL = "kimi-k2.5"     # 发送给API的模型名称
+REPLAY_DB_SUFFIX = "_replay"  # --replay 的结果写入单独的数据库（模型ID加此后缀），不混入真实请求的准确率和耗时历史
 
 # 默认生成参数
 DEFAULT_TARGET_LENGTH = 230000  # 目标文本长度（字节）- 仅在不使用文本文件时有效
@@ -44,6 +80,125 @@ DEFAULT_NEEDLE_RANGE = "0-1"
 
 DEFAULT_TOTAL_REQUESTS = 10  # 默认总请求数
 DEFAULT_MAX_CONCURRENT = 10  # 默认最大并发数
+DEFAULT_GRACE_PERIOD = 60    # Ctrl-C 后等待在途请求完成的默认宽限期（秒）
+
+# 命令行选项（--名称 值），可以出现在任意位置，其余参数仍按位置解析
+# 值为类型（int/float/str）表示需要参数值，值为 bool 表示开关
+#   --seed N             基础随机种子（第i个请求的用例种子为 N*1000000+i，用于复现用例）
+#   --record DIR         录制模式：把每个请求的SSE字节流和时间保存到 DIR（按用例哈希）
+#   --replay DIR         回放模式：不访问API，从 DIR 读取录制内容回放（未指定--seed时使用录制时的种子），结果写入单独的数据库（见 REPLAY_DB_SUFFIX）
+#   --replay-speed MODE  回放速度：real=按录制速度（默认），fast=尽可能快
+#   --ci-width W         序贯停止：平均准确率的置信区间宽度（百分点）小于 W 时停止发送新请求，
+#                        运行次数作为上限；表中已有记录也计入区间
+#   --ci-level P         序贯停止的置信水平（默认0.95）
+#   --min-samples N      序贯停止前至少需要的样本数（默认20）
+#   --budget USD         费用上限：预计累计费用（已花费+在途预估+本次预估）会超出时停止发送新请求
+#   --dry-run            只按生成的提示词大小预估本次运行的token数和费用，不发送请求
+#   --hedge-percentile P 对冲请求：耗时超过同长度历史耗时的P分位数（0-100）时再发一个相同请求，先成功者胜出
+#   --hedge-max-fraction F  对冲请求数占主请求数的上限比例（默认0.1）
+#   --grace-period S     Ctrl-C 后等待在途请求完成并入库的宽限期（秒，默认 DEFAULT_GRACE_PERIOD）
+#   --export-batch FILE  不发送请求，把计划的用例导出为 OpenAI 格式的批量请求文件（JSONL，custom_id 含用例种子）
+#   --import-batch FILE  导入批量结果文件（JSONL），按 custom_id 找回导出时的用例，经同样的提取和统计流程入库
+#   --arrival-rate R     开环负载模式：按 R 请求/秒的目标到达率发送，不等待在途请求完成（不受并发数和请求延迟限制）；
+#                        可用逗号给出多档（如 0.5,1,2,4），每档发送"运行次数"个请求，最后输出延迟-负载曲线
+#   --arrival MODE       开环到达过程：poisson=泊松到达（默认），constant=固定间隔
+#   --layout L           提示词布局：standard=说明在前（默认），cache=文本在前、说明在后（缓存友好：
+#                        插针范围之前的文本成为各请求相同的前缀，可命中服务端的前缀缓存），结果按 prompt_layout 列区分
+#   --answer-format F    回答格式：json=JSON对象（默认），array=JSON数组，csv=逗号分隔的数字（紧凑格式输出token更少、
+#                        生成更快；提示词字节数不变，结果写入同一数据表，按 answer_format 列区分，见 ANSWER_FORMATS）
+#   --processes N        多进程模式：把请求ID按取模分给 N 个子进程（各自的事件循环和连接池），并发数、请求延迟、
+#                        费用上限和各密钥的配额按进程数平分；各进程写入自己的分片数据库，结束后合并到模型数据库并核对统计
+#   --paired-with SRC    配对回放：不按种子生成新用例，而是按源模型数据库（模型ID或 .db 路径）同一数据表中记录的
+#                        插针位置和针值重建相同的用例发送给本模型（按 case_id 关联，用于配对比较），运行次数为本次回放的上限；
+#                        本模型已有结果的用例跳过，只能回放记录了 case_spec 的结果（文本、长度等参数须与源运行一致）
+#   --shard I/N          （由 --processes 自动传给子进程）只运行第 I 个分片（从0开始），写入分片数据库
+#   --log-level L        每个请求的日志级别：DEBUG / INFO（默认）/ WARNING（只输出失败）/ ERROR
+#   --log-file FILE      同时把每个请求的日志以 JSON 行写入 FILE（按 LOG_FILE_MAX_BYTES 轮转）
+#   --log-sample R       LOG_SAMPLED_EVENTS 中的事件（开始发送/成功等）只输出比例 R（0-1）的记录，失败总是输出
+#   --trace FILE         把每个请求各阶段（生成用例、熔断/密钥等待、连接、等待响应头、预填充、流式输出、提取、入库）
+#                        的耗时写成 Chrome trace-event JSON 文件，可用 Perfetto（https://ui.perfetto.dev）打开
+#   --uvloop             使用 uvloop 事件循环（需安装 uvloop）
+#   --api-url URL        覆盖 API_URL（如本地替身服务 standin_server.py 的地址 http://127.0.0.1:8000/v1/chat/completions）；
+#                        多个地址用逗号分隔时覆盖 API_ENDPOINTS（权重相同）
+#   --compress ENC       压缩请求体（gzip 或 zstd，zstd 需安装 zstandard），级别见 COMPRESSION_LEVELS；
+#                        服务器返回415时自动改回不压缩
+#   --control ADDR       运行中的控制接口：ADDR 为端口（监听 127.0.0.1）、主机:端口或 Unix 套接字路径，可查看状态、
+#                        暂停/恢复派发、调整并发数/RPM/TPM/费用上限、停止（接口见 control_server.py）；
+#                        多进程模式下各分片监听 端口+I 或 路径.shardI
+CLI_OPTIONS = {
+    '--seed': int,
+    '--record': str,
+    '--replay': str,
+    '--replay-speed': str,
+    '--ci-width': float,
+    '--ci-level': float,
+    '--min-samples': int,
+    '--budget': float,
+    '--dry-run': bool,
+    '--hedge-percentile': float,
+    '--hedge-max-fraction': float,
+    '--grace-period': float,
+    '--compress': str,
+    '--layout': str,
+    '--answer-format': str,
+    '--processes': int,
+    '--log-level': str,
+    '--log-file': str,
+    '--log-sample': float,
+    '--trace': str,
+    '--uvloop': bool,
+    '--api-url': str,
+    '--shard': str,
+    '--paired-with': str,
+    '--arrival-rate': str,
+    '--arrival': str,
+    '--export-batch': str,
+    '--import-batch': str,
+    '--control': str,
+}
+
+HEDGE_MIN_SAMPLES = 10  # 某长度至少有多少条历史耗时才启用对冲
+
+# 单个请求的超时时间：耗时模型（按提示词字节数和针数，由数据库中的历史耗时拟合，运行中增量更新）
+# 预测的P99耗时 x LATENCY_TIMEOUT_FACTOR，且不短于最近观测到的最长耗时，限制在 [LATENCY_TIMEOUT_MIN, DEFAULT_REQUEST_TIMEOUT] 秒之间；
+# 超时的请求按超时时间计入模型（右删失），避免模型只见到较快的请求而不断缩短超时；
+# 样本不足 LATENCY_MODEL_MIN_SAMPLES 条时使用 DEFAULT_REQUEST_TIMEOUT。LATENCY_TIMEOUT_FACTOR 设为 None 固定超时
+DEFAULT_REQUEST_TIMEOUT = 900
+LATENCY_TIMEOUT_FACTOR = 2.0
+LATENCY_TIMEOUT_MIN = 60
+LATENCY_MODEL_MIN_SAMPLES = 20
+LATENCY_HISTORY_ROWS = 500  # 每个数据表最多载入的最近记录数
+
+# 连接池：连接数上限按并发数设置（对冲时加倍，开环模式不限制），各主机上限默认同总上限
+CONNECTOR_LIMIT_PER_HOST = None    # 每个主机的连接上限（None=与总上限相同）
+CONNECTOR_KEEPALIVE_SECONDS = 75   # 空闲连接保持时间（秒），请求之间复用连接，避免重复TCP/TLS握手
+CONNECTOR_DNS_TTL = 300            # DNS缓存时间（秒）
+SSE_CHUNK_SIZE = 64 * 1024  # 读取流式响应时每次读取的最大字节数
+
+# 熔断器（按接口）：最近 CIRCUIT_WINDOW 个请求中服务端错误（5xx/超时/连接失败）比例达到 CIRCUIT_ERROR_RATE
+# （且至少 CIRCUIT_MIN_REQUESTS 个结果）时暂停发送 CIRCUIT_OPEN_SECONDS 秒，之后用单个探测请求决定是否恢复；
+# 探测失败时等待时间加倍，最长 CIRCUIT_MAX_OPEN_SECONDS 秒。CIRCUIT_ERROR_RATE 设为 None 关闭熔断
+CIRCUIT_WINDOW = 20
+CIRCUIT_MIN_REQUESTS = 5
+CIRCUIT_ERROR_RATE = 0.5
+CIRCUIT_OPEN_SECONDS = 30
+CIRCUIT_MAX_OPEN_SECONDS = 300
+
+# 每个请求的日志经队列由后台线程输出（控制台 + 可选的JSON行文件）
+LOG_FILE_MAX_BYTES = 50 * 1024 * 1024  # 单个JSON行日志文件的最大字节数，超过后轮转
+LOG_FILE_BACKUP_COUNT = 5              # 保留的轮转日志文件数
+LOG_SAMPLED_EVENTS = ('request_start', 'request_success', 'ci_update')  # --log-sample 作用的事件
+
+# 批量接口的价格相对 MODEL_PRICES 的折扣（导入批量结果时按此计算费用）
+BATCH_PRICE_FACTOR = 0.5
+
+# 请求体压缩级别：按请求体字节数选择 [(字节数上限, 级别), ...]，最后一项上限为None
+# 填充文本高度重复，大请求体用低级别即可获得很高的压缩率，且压缩耗时短
+COMPRESSION_LEVELS = {
+    'gzip': [(512 * 1024, 6), (None, 1)],
+    'zstd': [(512 * 1024, 6), (None, 3)],
+}
+
 
 # HTTP 请求头
 HEADERS = {
@@ -54,23 +209,78 @@ HEADERS = {
     'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) CherryStudio/1.5.11 Chrome/138.0.7204.243 Electron/37.4.0 Safari/537.36',
 }
 
+# API密钥池配置（留空则使用 HEADERS 中的 authorization 作为唯一密钥）
+# 每个密钥可单独设置：
+#   max_concurrent: 该密钥最大并发数（None=不限制）
+#   rpm / tpm:      每分钟请求数 / token数上限（None=不限制；发送前按预估的输入token扣减TPM，收到 usage 后按实际的输入+输出token修正）
+#   cooldown:       收到429后的冷却时间（秒，若响应带 Retry-After 则以其为准）
+# 请求会被路由到当前可用且负载最低的密钥；配置了密钥池且未在命令行指定并发数时，
+# 总并发数默认取各密钥并发上限之和（增加密钥即线性增加容量）
+# API_KEYS = [
+#     {"name": "key-a", "key": "sk-aaa", "max_concurrent": 10, "rpm": 60, "tpm": 2000000, "cooldown": 60},
+#     {"name": "key-b", "key": "sk-bbb", "max_concurrent": 10, "rpm": 60, "tpm": 2000000, "cooldown": 60},
+# ]
+API_KEYS = []
+
+# 多接口配置（同一模型的多个网关或区域；留空则只使用 API_URL）
+# 每个接口可单独设置：
+#   name:           接口名称（仅用于显示，默认为 url）
+#   weight:         权重（负载相同时按权重分配请求，默认1；0=不分配）
+#   max_concurrent: 该接口最大并发数（None=不限制）
+# 每个请求路由到"在途请求数 × 近期耗时 / 权重"最低的健康接口，各接口有独立的熔断器；变慢或故障的接口
+# 自动少分或不分请求。各接口都设置了并发上限且未在命令行指定并发数时，总并发数默认取其和
+# API_ENDPOINTS = [
+#     {"name": "us", "url": "https://gw-us.example.com/v1/chat/completions", "weight": 2, "max_concurrent": 20},
+#     {"name": "eu", "url": "https://gw-eu.example.com/v1/chat/completions", "weight": 1, "max_concurrent": 10},
+# ]
+API_ENDPOINTS = []
+ENDPOINT_LATENCY_ALPHA = 0.2  # 接口近期耗时（指数滑动平均）的权重
+ESTIMATED_BYTES_PER_TOKEN = 4  # 预估请求token数时每token对应的字节数（用于TPM限制和费用预估）
+ESTIMATED_COMPLETION_TOKENS = 2000  # 尚未收到实际usage时预估的每次输出token数（用于费用预估）
+
+# 模型价格表（美元/百万token），键为 API_MODEL；未配置的模型不计算费用
+MODEL_PRICES = {
+    "kimi-k2.5": {"input": 0.60, "output": 2.50},
+}
+
+# 结果表在最初的 standard_json/model_response_json/elapsed_time 之后新增的列
+RESULT_EXTRA_COLUMNS = [
+    ('prompt_tokens', 'INTEGER'),
+    ('completion_tokens', 'INTEGER'),
+    ('reasoning_tokens', 'INTEGER'),
+    ('cost', 'REAL'),
+    ('cached_tokens', 'INTEGER'),
+    ('prompt_layout', 'TEXT'),
+    ('case_id', 'TEXT'),
+    ('case_spec', 'TEXT'),
+    ('answer_format', 'TEXT'),
+]
+
 class DatabaseManager:
     """数据库管理类（包含按字节数的统计汇总）"""
 
-    def __init__(self, model_id, script_dir):
+    def __init__(self, model_id, script_dir, shard=None):
         """
         初始化数据库管理器
 
         参数:
             model_id: 模型ID，用于生成数据库文件名
             script_dir: 脚本所在目录
+            shard: 分片编号（多进程模式下子进程写入 数据库/分片/ 下各自的分片数据库，None=模型数据库）
         """
         safe_model_id = "".join(c if c.isalnum() else '_' for c in model_id)
         db_dir = os.path.join(script_dir, '数据库')
-        os.makedirs(db_dir, exist_ok=True)
-        self.db_filename = os.path.join(db_dir, f"{safe_model_id}.db")
+        self.shard_dir = os.path.join(db_dir, '分片')
+        self.shard_pattern = os.path.join(self.shard_dir, f"{safe_model_id}.shard*.db")
+        if shard is None:
+            os.makedirs(db_dir, exist_ok=True)
+            self.db_filename = os.path.join(db_dir, f"{safe_model_id}.db")
+        else:
+            os.makedirs(self.shard_dir, exist_ok=True)
+            self.db_filename = os.path.join(self.shard_dir, f"{safe_model_id}.shard{shard}.db")
         self.conn = None
         self.cursor = None
+        self.ready_tables = set()  # 已确认包含全部列的表（避免每次请求都检查表结构）
 
     def connect(self):
         """连接到数据库（如果不存在则创建）"""
@@ -107,12 +317,39 @@ class DatabaseManager:
                 test_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 standard_json TEXT NOT NULL,
                 model_response_json TEXT NOT NULL,
-                elapsed_time REAL
+                elapsed_time REAL,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                reasoning_tokens INTEGER,
+                cost REAL,
+                cached_tokens INTEGER,
+                prompt_layout TEXT,
+                case_id TEXT,
+                case_spec TEXT,
+                answer_format TEXT
             )
         """)
+        if table_name not in self.ready_tables:
+            # 旧数据库的表缺少后来新增的列时补齐
+            self.add_missing_columns(table_name, RESULT_EXTRA_COLUMNS)
+            self.ready_tables.add(table_name)
         self.conn.commit()
         return table_name
 
+    def add_missing_columns(self, table_name, columns):
+        """
+        给旧版本创建的表补上缺少的列（不提交）
+
+        参数:
+            table_name: 本数据库中的表名（合并分片时另有附加的 shard 数据库，因此显式使用 main）
+            columns: [(列名, 类型), ...]
+        """
+        self.cursor.execute(f"PRAGMA main.table_info({table_name})")
+        existing_columns = {row[1] for row in self.cursor.fetchall()}
+        for column, column_type in columns:
+            if column not in existing_columns:
+                self.cursor.execute(f"ALTER TABLE main.{table_name} ADD COLUMN {column} {column_type}")
+
     def create_stats_table(self, text_file=None):
         """
         创建（或确保存在）统计表：
@@ -187,7 +424,8 @@ class DatabaseManager:
             """, (answered_delta, parse_fail_delta, byte_count))
         self.conn.commit()
 
-    def insert_result(self, byte_count, standard_json, model_response_json, elapsed_time=None, text_file=None):
+    def insert_result(self, byte_count, standard_json, model_response_json, elapsed_time=None, text_file=None,
+                      usage=None, cost=None, layout=None, case=None, answer_format=None):
         """
         插入成功的测试结果
 
@@ -197,7 +435,14 @@ class DatabaseManager:
             model_response_json: 模型回答JSON字符串
             elapsed_time: 耗时（秒）
             text_file: 文本文件路径（如果提供，将使用文件名作为表名前缀）
+            usage: token用量（parse_usage 的结果，可为None）
+            cost: 本次请求费用（美元，可为None）
+            layout: 提示词布局（standard / cache）
+            case: (case_id, case_spec)，见 describe_case（None=不记录，如批量结果导入）
+            answer_format: 回答格式（json / array / csv）
         """
+        usage = usage or {}
+        case_id, spec = case or (None, None)
         if text_file:
             filename = os.path.basename(text_file)
             filename_without_ext = os.path.splitext(filename)[0]
@@ -208,9 +453,13 @@ class DatabaseManager:
         
         self.cursor.execute(f"""
             INSERT INTO {table_name}
-            (standard_json, model_response_json, elapsed_time)
-            VALUES (?, ?, ?)
-        """, (standard_json, model_response_json, elapsed_time))
+            (standard_json, model_response_json, elapsed_time,
+             prompt_tokens, completion_tokens, reasoning_tokens, cost, cached_tokens, prompt_layout, case_id, case_spec,
+             answer_format)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (standard_json, model_response_json, elapsed_time,
+              usage.get('prompt_tokens'), usage.get('completion_tokens'), usage.get('reasoning_tokens'), cost,
+              usage.get('cached_tokens'), layout, case_id, spec, answer_format))
         self.conn.commit()
 
     def get_table_stats(self, byte_count, text_file=None):
@@ -230,6 +479,106 @@ class DatabaseManager:
         except sqlite3.OperationalError:
             return {'total': 0}
 
+    def _variant_condition(self, table_name, layout=None, answer_format=None):
+        """
+        按提示词布局和回答格式筛选记录的 SQL 条件（同一数据表中不同布局/格式的准确率和耗时不可混用）
+
+        参数:
+            layout: 提示词布局（None=不筛选；NULL 和缺少该列的旧表记录按 standard 计）
+            answer_format: 回答格式（None=不筛选；NULL 和缺少该列的旧表记录按 json 计）
+
+        返回: (条件, 参数列表)
+        """
+        self.cursor.execute(f"PRAGMA table_info({table_name})")
+        columns = {row[1] for row in self.cursor.fetchall()}
+        conditions, params = [], []
+        for column, value, default in (('prompt_layout', layout, 'standard'),
+                                       ('answer_format', answer_format, 'json')):
+            if value is None:
+                continue
+            if column in columns:
+                conditions.append(f"COALESCE({column}, ?) = ?")
+                params += [default, value]
+            elif value != default:
+                conditions.append("0")
+        return " AND ".join(conditions) or "1", params
+
+    def get_accuracies(self, byte_count, text_file=None, layout=None, answer_format=None, needles=None):
+        """
+        对表中已有记录逐条评分，返回准确率列表（表不存在时返回空列表；layout / answer_format 见 _variant_condition）
+        needles: 只统计该针数（标准答案的条目数）的记录；不同针数的用例可能有相同的提示词字节数而写入同一数据表
+        """
+        if text_file:
+            filename = os.path.basename(text_file)
+            filename_without_ext = os.path.splitext(filename)[0]
+            safe_filename = "".join(c if c.isalnum() or c == '_' else '_' for c in filename_without_ext)
+            table_name = f"tokens_{safe_filename}"
+        else:
+            table_name = f"bytes_{byte_count}"
+
+        try:
+            condition, params = self._variant_condition(table_name, layout, answer_format)
+            self.cursor.execute(f"SELECT standard_json, model_response_json FROM {table_name} WHERE {condition}", params)
+            rows = self.cursor.fetchall()
+        except sqlite3.OperationalError:
+            return []
+
+        accuracies = []
+        for standard_json, model_response_json in rows:
+            try:
+                standard = json.loads(standard_json)
+                if needles is not None and len(standard) != needles:
+                    continue
+                result = grade_answers(json.loads(model_response_json), standard)
+            except (json.JSONDecodeError, AttributeError, TypeError):
+                continue
+            accuracies.append(result['accuracy'])
+        return accuracies
+
+    def get_elapsed_times(self, byte_count, text_file=None, layout=None, answer_format=None):
+        """返回表中已有记录的耗时列表（表不存在时返回空列表；layout / answer_format 见 _variant_condition）"""
+        if text_file:
+            filename = os.path.basename(text_file)
+            filename_without_ext = os.path.splitext(filename)[0]
+            safe_filename = "".join(c if c.isalnum() or c == '_' else '_' for c in filename_without_ext)
+            table_name = f"tokens_{safe_filename}"
+        else:
+            table_name = f"bytes_{byte_count}"
+
+        try:
+            condition, params = self._variant_condition(table_name, layout, answer_format)
+            self.cursor.execute(
+                f"SELECT elapsed_time FROM {table_name} WHERE elapsed_time IS NOT NULL AND {condition}", params
+            )
+            return [row[0] for row in self.cursor.fetchall()]
+        except sqlite3.OperationalError:
+            return []
+
+    def get_latency_samples(self, limit_per_table=500, layout=None, answer_format=None):
+        """
+        读取各 bytes_* 表最近的耗时样本（用于拟合耗时模型；tokens_* 表的提示词字节数不在表名中，不包含在内）
+        layout / answer_format: 只读取该提示词布局和回答格式的记录（见 _variant_condition）
+
+        返回: [(字节数, 针数, 耗时), ...]
+        """
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'bytes_%'")
+        table_names = [row[0] for row in self.cursor.fetchall() if row[0][len('bytes_'):].isdigit()]
+        samples = []
+        for table_name in table_names:
+            byte_count = int(table_name[len('bytes_'):])
+            condition, params = self._variant_condition(table_name, layout, answer_format)
+            self.cursor.execute(f"""
+                SELECT standard_json, elapsed_time FROM {table_name}
+                WHERE elapsed_time IS NOT NULL AND {condition} ORDER BY id DESC LIMIT ?
+            """, (*params, limit_per_table))
+            for standard_json, elapsed in self.cursor.fetchall():
+                try:
+                    needles = len(json.loads(standard_json))
+                except (json.JSONDecodeError, TypeError):
+                    continue
+                samples.append((byte_count, needles, elapsed))
+        return samples
+
     def get_stats(self, byte_count, text_file=None):
         """获取统计信息
         - 使用文本文件时：从 tokens_stats 查询
@@ -261,12 +610,277 @@ class DatabaseManager:
         except sqlite3.OperationalError:
             return {'answered_count': 0, 'parse_fail_count': 0}
 
+    def get_cases(self, table_name):
+        """
+        读取表中记录了 case_spec 的用例（按首次出现的顺序，同一 case_id 只取一次），用于配对回放
+
+        返回: (用例列表 [{'case_id', 'case_spec', 'standard_json'}, ...], 缺少 case_spec 的旧记录数)
+        """
+        try:
+            self.cursor.execute(f"SELECT case_id, case_spec, standard_json FROM {table_name} ORDER BY id")
+        except sqlite3.OperationalError:
+            # 表不存在，或是新增这两列之前的旧表
+            try:
+                self.cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+            except sqlite3.OperationalError:
+                return [], 0
+            return [], self.cursor.fetchone()[0]
+        cases = {}
+        legacy = 0
+        for case_id, spec, standard_json in self.cursor.fetchall():
+            if spec is None:
+                legacy += 1
+            elif case_id not in cases:
+                cases[case_id] = {'case_id': case_id, 'case_spec': spec, 'standard_json': standard_json}
+        return list(cases.values()), legacy
+
+    def get_case_ids(self, table_name):
+        """返回表中已有结果的 case_id 集合"""
+        try:
+            self.cursor.execute(f"SELECT DISTINCT case_id FROM {table_name} WHERE case_id IS NOT NULL")
+        except sqlite3.OperationalError:
+            return set()
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def record_unfinished_jobs(self, table_name, jobs):
+        """
+        记录未完成的请求（优雅退出时调用），便于之后按用例种子补跑
+        每行为一段等差的请求ID：request_id 到 last_request_id，步长 request_id_step（旧版本的行为单个请求，这两列为NULL）；
+        case_seed 为段内第一个请求的种子（种子随请求ID线性递增，见 case_seed）
+
+        参数:
+            table_name: 本次运行的数据表名
+            jobs: [(请求ID的 range, 第一个请求的 case_seed, reason), ...]
+                  reason: not_dispatched=未派发, not_started=已派发未开始, cancelled=宽限期后被取消
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS unfinished_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                table_name TEXT NOT NULL,
+                request_id INTEGER NOT NULL,
+                case_seed INTEGER,
+                reason TEXT NOT NULL,
+                last_request_id INTEGER,
+                request_id_step INTEGER
+            )
+        """)
+        # 旧版本创建的表每行只记录一个请求
+        self.add_missing_columns('unfinished_jobs', [('last_request_id', 'INTEGER'), ('request_id_step', 'INTEGER')])
+        self.cursor.executemany("""
+            INSERT INTO unfinished_jobs (table_name, request_id, last_request_id, request_id_step, case_seed, reason)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(table_name, ids[0], ids[-1], ids.step, seed, reason) for ids, seed, reason in jobs])
+        self.conn.commit()
+
+    def record_load_curve(self, table_name, arrival_process, steps):
+        """
+        记录开环负载模式各档的延迟-负载统计（同一数据表即同一上下文长度，可跨多次运行对比）
+
+        参数:
+            table_name: 数据表名
+            arrival_process: 到达过程（poisson / constant）
+            steps: OpenLoopRunner.summary() 的列表
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS load_curve (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                table_name TEXT NOT NULL,
+                arrival_process TEXT NOT NULL,
+                offered_rate REAL NOT NULL,
+                send_rate REAL,
+                throughput REAL,
+                sent INTEGER,
+                succeeded INTEGER,
+                success_rate REAL,
+                p50 REAL,
+                p90 REAL,
+                p99 REAL,
+                mean_latency REAL
+            )
+        """)
+        self.cursor.executemany("""
+            INSERT INTO load_curve
+            (table_name, arrival_process, offered_rate, send_rate, throughput, sent, succeeded, success_rate,
+             p50, p90, p99, mean_latency)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(table_name, arrival_process, step['offered_rate'], step['send_rate'], step['throughput'],
+               step['sent'], step['succeeded'], step['success_rate'],
+               step['p50'], step['p90'], step['p99'], step['mean']) for step in steps])
+        self.conn.commit()
+
+    def record_batch_export(self, jobs):
+        """
+        记录导出到批量请求文件的用例（导入结果时按 custom_id 找回标准答案和数据表）
+        已记录过的 custom_id 保持不变（重复导出同一用例不会重置其导入状态）
+
+        参数:
+            jobs: [(custom_id, table_name, byte_count, text_file, request_id, case_seed, standard_json,
+                    prompt_layout, answer_format), ...]
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                custom_id TEXT PRIMARY KEY,
+                exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                table_name TEXT NOT NULL,
+                byte_count INTEGER NOT NULL,
+                text_file TEXT,
+                request_id INTEGER NOT NULL,
+                case_seed INTEGER NOT NULL,
+                standard_json TEXT NOT NULL,
+                imported_at TIMESTAMP,
+                import_status TEXT,
+                prompt_layout TEXT,
+                answer_format TEXT
+            )
+        """)
+        # 旧版本创建的表缺少提示词布局、回答格式列
+        self.add_missing_columns('batch_jobs', [('prompt_layout', 'TEXT'), ('answer_format', 'TEXT')])
+        self.cursor.executemany("""
+            INSERT OR IGNORE INTO batch_jobs
+            (custom_id, table_name, byte_count, text_file, request_id, case_seed, standard_json, prompt_layout,
+             answer_format)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, jobs)
+        self.conn.commit()
+
+    def get_batch_job(self, custom_id):
+        """按 custom_id 查找导出的用例（不存在时返回None）"""
+        try:
+            self.cursor.execute("""
+                SELECT * FROM batch_jobs WHERE custom_id = ?
+            """, (custom_id,))
+        except sqlite3.OperationalError:
+            return None
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        job = dict(zip([column[0] for column in self.cursor.description], row))
+        return {'byte_count': job['byte_count'], 'text_file': job['text_file'], 'standard_json': job['standard_json'],
+                'import_status': job['import_status'], 'prompt_layout': job.get('prompt_layout') or 'standard',
+                'answer_format': job.get('answer_format') or 'json'}
+
+    def mark_batch_imported(self, custom_id, status):
+        """记录批量结果的导入状态（success / parse_fail / failed）"""
+        self.cursor.execute("""
+            UPDATE batch_jobs SET imported_at = CURRENT_TIMESTAMP, import_status = ? WHERE custom_id = ?
+        """, (status, custom_id))
+        self.conn.commit()
+
+    def shard_filenames(self):
+        """本模型待合并的分片数据库文件（含之前中断后遗留的）"""
+        return sorted(glob.glob(self.shard_pattern))
+
+    def merge_shard(self, shard_filename):
+        """
+        把分片数据库合并到本数据库：
+        - 结果表（bytes_* / tokens_*）逐行追加（不含自增id）
+        - 统计表（bytes_stats / tokens_stats）按主键累加已回答/解析失败计数
+        - 其他记录表（如 unfinished_jobs）逐行追加
+        分片中有而本数据库的表（旧版本创建）中没有的列先补到本数据库，避免合并时丢弃这些列的数据
+        合并与清空分片在同一事务中提交，中途失败时两边都不变，可以重新合并
+
+        返回: {结果表名: {'rows': 追加的记录数, 'answered': 已回答计数增量, 'parse_fail': 解析失败计数增量}}
+        """
+        self.cursor.execute("ATTACH DATABASE ? AS shard", (shard_filename,))
+        try:
+            self.cursor.execute("SELECT name FROM shard.sqlite_master WHERE type = 'table' AND name != 'sqlite_sequence'")
+            shard_tables = [row[0] for row in self.cursor.fetchall()]
+            stats_tables = [name for name in shard_tables if name in ('bytes_stats', 'tokens_stats')]
+            result_tables = [name for name in shard_tables
+                             if name.startswith(('bytes_', 'tokens_')) and name not in stats_tables]
+            other_tables = [name for name in shard_tables if name not in stats_tables and name not in result_tables]
+
+            # 先确保目标表存在且列齐全（建表语句会各自提交，因此放在合并事务之前）
+            for name in result_tables:
+                if name.startswith('bytes_'):
+                    self.create_table_if_not_exists(int(name[len('bytes_'):]))
+                else:
+                    self.create_table_if_not_exists(None, name[len('tokens_'):])
+            for name in stats_tables:
+                self.create_stats_table(name == 'tokens_stats')
+            for name in other_tables:
+                self.cursor.execute("SELECT sql FROM shard.sqlite_master WHERE name = ?", (name,))
+                create_sql = self.cursor.fetchone()[0]
+                self.cursor.execute("SELECT 1 FROM main.sqlite_master WHERE name = ?", (name,))
+                if self.cursor.fetchone() is None:
+                    self.cursor.execute(create_sql)
+            shard_columns = {}
+            for name in result_tables + other_tables:
+                self.cursor.execute(f"PRAGMA shard.table_info({name})")
+                shard_columns[name] = [(row[1], row[2]) for row in self.cursor.fetchall() if row[1] != 'id']
+                self.add_missing_columns(name, shard_columns[name])
+            self.conn.commit()
+
+            merged = {}
+            for name in result_tables + other_tables:
+                columns = ", ".join(column for column, _ in shard_columns[name])
+                # 按写入顺序追加（batch_jobs 等表没有 id 列，用 rowid）；已存在的主键（如重复导出的 custom_id）保持不变
+                self.cursor.execute(f"INSERT OR IGNORE INTO main.{name} ({columns}) "
+                                    f"SELECT {columns} FROM shard.{name} ORDER BY rowid")
+                if name in result_tables:
+                    merged[name] = {'rows': self.cursor.rowcount, 'answered': 0, 'parse_fail': 0}
+
+            for name in stats_tables:
+                key = 'byte_count' if name == 'bytes_stats' else 'file_name'
+                prefix = 'bytes_' if name == 'bytes_stats' else 'tokens_'
+                self.cursor.execute(f"SELECT {key}, answered_count, parse_fail_count FROM shard.{name}")
+                for value, answered, parse_fail in self.cursor.fetchall():
+                    counts = merged.setdefault(f"{prefix}{value}", {'rows': 0, 'answered': 0, 'parse_fail': 0})
+                    counts['answered'] += answered
+                    counts['parse_fail'] += parse_fail
+                # WHERE true: 避免 INSERT ... SELECT ... ON CONFLICT 的语法歧义
+                self.cursor.execute(f"""
+                    INSERT INTO main.{name} ({key}, answered_count, parse_fail_count, last_updated)
+                    SELECT {key}, answered_count, parse_fail_count, CURRENT_TIMESTAMP FROM shard.{name} WHERE true
+                    ON CONFLICT({key}) DO UPDATE SET
+                        answered_count = answered_count + excluded.answered_count,
+                        parse_fail_count = parse_fail_count + excluded.parse_fail_count,
+                        last_updated = CURRENT_TIMESTAMP
+                """)
+
+            for name in shard_tables:
+                self.cursor.execute(f"DELETE FROM shard.{name}")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.cursor.execute("DETACH DATABASE shard")
+        return merged
+
     def close(self):
-        """关闭数据库连接"""
+        """提交未提交的写入并关闭数据库连接"""
         if self.conn:
+            self.conn.commit()
             self.conn.close()
 
-def extract_and_clean_json(response_text):
+def extract_compact_answer(response_text, answer_format):
+    """
+    从紧凑格式的回答中提取数字列表（取最后一个符合格式的数组/行，跳过模型先写出的草稿）
+
+    参数:
+        answer_format: array=JSON数组 [1234, 5678]；csv=逗号分隔的一行 1234,5678
+
+    返回: [数字, ...]，没有找到时返回None
+    """
+    if answer_format == 'array':
+        for candidate in reversed(re.findall(r'\[[\d\s,]*\]', response_text)):
+            try:
+                numbers = json.loads(candidate)
+            except ValueError:
+                continue
+            if numbers:
+                return numbers
+    elif answer_format == 'csv':
+        for line in reversed(response_text.splitlines()):
+            line = line.strip().rstrip(',')
+            if re.fullmatch(r'\d+(?:\s*,\s*\d+)*', line):
+                return [int(value) for value in line.split(',')]
+    return None
+
+def extract_and_clean_json(response_text, answer_format='json'):
     """
     从响应文本中提取JSON并清理，只保留纯JSON内容
 
@@ -274,9 +888,15 @@ def extract_and_clean_json(response_text):
     1. ```json ... ```
     2. ``` ... ```
     3. 纯JSON文本（以{开头}结尾）
+    4. answer_format 为 array / csv 时，先按紧凑格式提取（见 extract_compact_answer），
+       转换为 {"1": 数字, ...} 的JSON对象；没有找到时再按以上JSON格式提取
 
     返回纯JSON字符串，失败返回None
     """
+    if answer_format != 'json':
+        numbers = extract_compact_answer(response_text, answer_format)
+        if numbers is not None:
+            return json.dumps(answers_from_sequence(numbers))
     try:
         json_pattern = r'```json\s*(\{[\s\S]*?\})\s*```'
         match = re.search(json_pattern, response_text, re.DOTALL)
@@ -304,31 +924,204 @@ def extract_and_clean_json(response_text):
     except Exception:
         return None
 
+def split_cli_options(argv, option_types=None):
+    """
+    从参数列表中分离 CLI_OPTIONS（或 option_types）中定义的 --选项
+
+    返回: (位置参数列表, 选项字典)；选项格式错误时打印错误并退出
+    """
+    option_types = CLI_OPTIONS if option_types is None else option_types
+    positional = []
+    options = {}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if not arg.startswith('--') or i == 0:
+            positional.append(arg)
+            i += 1
+            continue
+        name, _, inline_value = arg.partition('=')
+        if name not in option_types:
+            print(f"错误: 未知选项 {name}")
+            print(f"支持的选项: {', '.join(option_types)}")
+            sys.exit(1)
+        value_type = option_types[name]
+        if value_type is bool:
+            options[name] = True
+            i += 1
+            continue
+        if inline_value:
+            raw_value = inline_value
+            i += 1
+        elif i + 1 < len(argv):
+            raw_value = argv[i + 1]
+            i += 2
+        else:
+            print(f"错误: 选项 {name} 需要一个参数值")
+            sys.exit(1)
+        try:
+            options[name] = value_type(raw_value)
+        except ValueError:
+            print(f"错误: 选项 {name} 的值无效: {raw_value}")
+            sys.exit(1)
+    return positional, options
+
+def format_duration(seconds):
+    """把秒数格式化为 "X小时Y分" / "X分Y秒" / "X秒" """
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60}秒"
+    return f"{seconds}秒"
+
+def case_seed(base_seed, request_id):
+    """第 request_id 个请求的用例种子（同一基础种子下可复现）"""
+    return base_seed * 1000000 + request_id
+
+def build_key_pool(shard_count=1):
+    """
+    根据 API_KEYS 构建密钥池；未配置时使用 HEADERS 中的密钥（不限并发）
+
+    参数:
+        shard_count: 多进程模式的进程数（每个进程按 1/N 使用各密钥的并发上限和 RPM/TPM 配额）
+    """
+    if API_KEYS:
+        key_configs = []
+        for cfg in API_KEYS:
+            cfg = dict(cfg)
+            if shard_count > 1:
+                if cfg.get('max_concurrent'):
+                    cfg['max_concurrent'] = math.ceil(cfg['max_concurrent'] / shard_count)
+                for name in ('rpm', 'tpm'):
+                    if cfg.get(name):
+                        cfg[name] = cfg[name] / shard_count
+            key_configs.append(cfg)
+        return KeyPool.from_config(key_configs)
+    token = HEADERS.get('authorization', '')
+    if token.startswith('Bearer '):
+        token = token[len('Bearer '):]
+    return KeyPool.from_config([{'name': 'default', 'key': token}])
+
+def build_endpoint_pool(shard_count=1):
+    """
+    根据 API_ENDPOINTS 构建接口池（每个接口一个熔断器，CIRCUIT_ERROR_RATE 为None时不熔断）；未配置时只有 API_URL 一个接口
+
+    参数:
+        shard_count: 多进程模式的进程数（每个进程按 1/N 使用各接口的并发上限）
+    """
+    endpoint_configs = []
+    for cfg in API_ENDPOINTS or [{'url': API_URL}]:
+        cfg = dict(cfg)
+        if shard_count > 1 and cfg.get('max_concurrent'):
+            cfg['max_concurrent'] = math.ceil(cfg['max_concurrent'] / shard_count)
+        endpoint_configs.append(cfg)
+    breaker_factory = None
+    if CIRCUIT_ERROR_RATE is not None:
+        def breaker_factory(name):
+            return CircuitBreaker(
+                name, window=CIRCUIT_WINDOW, min_requests=CIRCUIT_MIN_REQUESTS, error_rate=CIRCUIT_ERROR_RATE,
+                open_seconds=CIRCUIT_OPEN_SECONDS, max_open_seconds=CIRCUIT_MAX_OPEN_SECONDS
+            )
+    return EndpointPool.from_config(endpoint_configs, breaker_factory, ENDPOINT_LATENCY_ALPHA)
+
+def apply_api_url_option(value):
+    """--api-url：一个地址时覆盖 API_URL（不使用 API_ENDPOINTS），逗号分隔的多个地址覆盖 API_ENDPOINTS（权重相同）"""
+    global API_URL, API_ENDPOINTS
+    urls = [url.strip() for url in value.split(',') if url.strip()]
+    if not urls:
+        raise ValueError("--api-url 至少需要一个地址")
+    API_URL = urls[0]
+    API_ENDPOINTS = [{'url': url} for url in urls] if len(urls) > 1 else []
+
+def describe_endpoints(endpoints):
+    """启动时显示的接口地址（多个接口时列出名称和权重）"""
+    if len(endpoints.endpoints) == 1:
+        return endpoints.endpoints[0].url
+    return f"{len(endpoints.endpoints)} 个接口（" + ", ".join(
+        f"{e.name} 权重{e.weight:g}" + (f" 并发{e.max_concurrent}" if e.max_concurrent else "")
+        for e in endpoints.endpoints
+    ) + "）"
+
+# 提示词指令部分（基础文本拼接在其后）
+PROMPT_TEXT = """Please give me an answer worth $200, think very carefully, and give me the best possible response.Extract all pure four-digit numbers (i.e., 1000–9999) interspersed within the text below, and output the numbers and their order of appearance in a JSON format following the example below:
+{
+"1": 123,
+"2": 234,
+"3": 345
+}
+---
+"""
+
+# 回答格式（--answer-format）：
+#   json:  JSON对象 {"序号": 数字, ...}（默认，即 PROMPT_TEXT）
+#   array: JSON数组 [数字, ...]，不输出序号和引号
+#   csv:   逗号分隔的数字，不输出任何括号和空格
+# 紧凑格式输出的token数约为 json 的一半到三分之一，可缩短生成耗时；各格式的指令用空格补齐到与 PROMPT_TEXT 相同的字节数，
+# 结果写入同一数据表，以 answer_format 列区分（回答统一转换为 {"序号": 数字} 的JSON对象入库，评分和分析脚本无需改动）
+ANSWER_FORMATS = ('json', 'array', 'csv')
+_COMPACT_PROMPT_HEAD = PROMPT_TEXT[:PROMPT_TEXT.index("and output the numbers")]
+
+def _pad_instruction(text):
+    """在分隔线前补空格，使指令与 PROMPT_TEXT 字节数相同（同一用例在各回答格式下的提示词字节数相同）"""
+    padding = len(PROMPT_TEXT.encode('utf-8')) - len(text.encode('utf-8')) - len("\n---\n")
+    if padding < 0:
+        raise ValueError("回答格式的指令比 PROMPT_TEXT 长")
+    return text + " " * padding + "\n---\n"
+
+ANSWER_FORMAT_PROMPTS = {
+    'json': PROMPT_TEXT,
+    'array': _pad_instruction(_COMPACT_PROMPT_HEAD + "and output only the numbers in their order of appearance "
+                              "as one JSON array like the example below:\n[123, 234, 345]"),
+    'csv': _pad_instruction(_COMPACT_PROMPT_HEAD + "and output only the numbers in their order of appearance "
+                            "as one comma-separated line like the example below:\n123,234,345"),
+}
+
+# 提示词布局：
+#   standard: 指令在前、基础文本在后（默认）
+#   cache:    基础文本在前、指令移到末尾；同一数据表中各请求在插针范围起点之前的填充文本完全相同，
+#             便于服务商的前缀缓存命中（插针范围从0开始时没有可共享的前缀）。提示词字节数与 standard 相同，结果写入同一数据表，以 prompt_layout 列区分
+PROMPT_LAYOUTS = ('standard', 'cache')
+# cache 布局放在基础文本之后的结尾部分，每种回答格式一个（分隔线移到指令之前，总字节数不变）
+CACHE_PROMPT_TRAILERS = {
+    answer_format: "\n---\n" + instruction[:-len("\n---\n")].replace("the text below", "the text above")
+    for answer_format, instruction in ANSWER_FORMAT_PROMPTS.items()
+}
+
+# 请求体中除 messages 外的字段
+REQUEST_FIELDS = {
+    "model": API_MODEL,
+    "stream": True,
+    # 要求在流结束时返回 usage 块（用于token统计和计费）
+    "stream_options": {"include_usage": True}
+}
+
+# 批量请求文件中的请求字段（批量接口不支持流式输出）
+BATCH_REQUEST_FIELDS = {
+    "model": API_MODEL,
+}
+
+_BASE_STRING_CACHE = {}    # 基础文本缓存
+_BODY_TEMPLATE_CACHE = {}  # 预编码请求体模板缓存
+
 def get_byte_count(text):
     """获取文本的字节数（UTF-8编码）"""
     return len(text.encode('utf-8'))
 
-def generate_test_case(target_length, num_insertions, base_pattern=DEFAULT_BASE_PATTERN, needle_range=DEFAULT_NEEDLE_RANGE, text_file=None, random_offset_ratio=DEFAULT_RANDOM_OFFSET_RATIO):
+def load_base_string(target_length, base_pattern=DEFAULT_BASE_PATTERN, text_file=None):
     """
-    生成一次测试用例（不落盘）
+    获取插针前的基础文本（按参数缓存，文本文件只读取一次）
 
     参数:
         target_length: 目标文本长度（仅在text_file为None时使用）
-        num_insertions: 插入数量（当区间指定了数量时会被覆盖）
         base_pattern: 基础填充模式（仅在text_file为None时使用）
-        needle_range: 插针插入范围
-                     支持两种格式：
-                     1. 相对比例："start-end" 如 "0-1"表示全文，"0.5-1"表示后半部分
-                     2. 绝对位置："start-end" 如 "200000-240000"表示字节位置200000到240000
-                     支持多区间："start1-end1,start2-end2,..."
-                     支持指定数量："start-end:count" 如 "0-0.1:1,0.9-1:20" 或 "0-20000:10,100000-200000:20"
         text_file: 文本文件路径（如果提供，将使用文件内容而不是生成文本）
-        random_offset_ratio: 插针位置随机偏移比例（None=不偏移，0.05=偏移间隔的5%）
-
-    返回: (prompt_content, standard_json_str, byte_count, actual_num_insertions)
     """
-    import random
-    
+    key = (text_file,) if text_file else (target_length, base_pattern)
+    base_string = _BASE_STRING_CACHE.get(key)
+    if base_string is not None:
+        return base_string
+
     # 根据是否提供文本文件来决定基础文本
     if text_file:
         # 从文件读取文本内容
@@ -341,6 +1134,35 @@ def generate_test_case(target_length, num_insertions, base_pattern=DEFAULT_BASE_
     else:
         # 使用base_pattern生成文本
         base_string = (base_pattern * (target_length // len(base_pattern) + 1))[:target_length]
+    _BASE_STRING_CACHE[key] = base_string
+    return base_string
+
+def plan_test_case(target_length, num_insertions, base_pattern=DEFAULT_BASE_PATTERN, needle_range=DEFAULT_NEEDLE_RANGE, text_file=None, random_offset_ratio=DEFAULT_RANDOM_OFFSET_RATIO, seed=None):
+    """
+    生成一次测试用例的插针计划（不拼接提示词，不落盘）
+
+    参数:
+        target_length: 目标文本长度（仅在text_file为None时使用）
+        num_insertions: 插入数量（当区间指定了数量时会被覆盖）
+        base_pattern: 基础填充模式（仅在text_file为None时使用）
+        needle_range: 插针插入范围
+                     支持两种格式：
+                     1. 相对比例："start-end" 如 "0-1"表示全文，"0.5-1"表示后半部分
+                     2. 绝对位置："start-end" 如 "200000-240000"表示字节位置200000到240000
+                     支持多区间："start1-end1,start2-end2,..."
+                     支持指定数量："start-end:count" 如 "0-0.1:1,0.9-1:20" 或 "0-20000:10,100000-200000:20"
+        text_file: 文本文件路径（如果提供，将使用文件内容而不是生成文本）
+        random_offset_ratio: 插针位置随机偏移比例（None=不偏移，0.05=偏移间隔的5%）
+        seed: 随机种子（相同种子和参数生成完全相同的用例；None=不固定）
+
+    返回: dict
+        base_string: 基础文本
+        insertions: [(字符位置, 针值字符串), ...]（按位置升序）
+        standard_json_str: 标准答案JSON字符串
+        actual_num_insertions: 实际插入数量
+    """
+    rng = random.Random(seed)
+    base_string = load_base_string(target_length, base_pattern, text_file)
 
     # 解析多区间（支持逗号分隔的多个区间，支持 :count 指定数量）
     # 支持相对比例（0-1）和绝对位置（字节数）两种格式
@@ -456,172 +1278,618 @@ def generate_test_case(target_length, num_insertions, base_pattern=DEFAULT_BASE_
                 if i == 0:
                     base_pos = insert_start_pos
                     # 第一个针：只能向右偏移
-                    random_offset = random.randint(0, random_range) if random_range > 0 else 0
+                    random_offset = rng.randint(0, random_range) if random_range > 0 else 0
                 elif i == needles_for_range - 1:
                     base_pos = insert_end_pos
                     # 最后一个针：只能向左偏移
-                    random_offset = random.randint(-random_range, 0) if random_range > 0 else 0
+                    random_offset = rng.randint(-random_range, 0) if random_range > 0 else 0
                 else:
                     base_pos = insert_start_pos + i * interval
                     # 中间的针：可以双向偏移
-                    random_offset = random.randint(-random_range, random_range) if random_range > 0 else 0
+                    random_offset = rng.randint(-random_range, random_range) if random_range > 0 else 0
                 
                 actual_pos = max(insert_start_pos, min(insert_end_pos, base_pos + random_offset))
                 positions.append(actual_pos)
     
-    # 按位置排序（从大到小，便于插入）
+    # 按位置排序（从大到小，与旧版逐个插入时的随机数顺序保持一致）
     positions.sort(reverse=True)
 
-    # 生成随机4位数并插入
+    # 生成随机4位数（序号按出现顺序编号）
     numbers_list = []
-    result_string = list(base_string)
+    insertions = []
     for idx, pos in enumerate(positions):
-        random_num = random.randint(1000, 9999)
-        result_string.insert(pos, str(random_num))
-        numbers_list.append((actual_num_insertions - idx, random_num))
+        random_num = rng.randint(1000, 9999)
+        label = actual_num_insertions - idx
+        numbers_list.append((label, random_num))
+        insertions.append((pos, label, str(random_num)))
 
-    final_string = ''.join(result_string)
     numbers_list.sort(key=lambda x: x[0])
     inserted_numbers = {str(num): val for num, val in numbers_list}
+    # 同一位置的多根针按序号排列（与旧版从后往前逐个插入的结果一致）
+    insertions.sort(key=lambda x: (x[0], x[1]))
 
-    prompt_text = """Please give me an answer worth $200, think very carefully, and give me the best possible response.Extract all pure four-digit numbers (i.e., 1000–9999) interspersed within the text below, and output the numbers and their order of appearance in a JSON format following the example below:
-{
-"1": 123,
-"2": 234,
-"3": 345
-}
----
-"""
+    return {
+        'base_string': base_string,
+        'insertions': [(pos, needle) for pos, _, needle in insertions],
+        'standard_json_str': json.dumps(inserted_numbers, ensure_ascii=False),
+        'actual_num_insertions': actual_num_insertions,
+    }
 
-    prompt_content = prompt_text + final_string
-    standard_json_str = json.dumps(inserted_numbers, ensure_ascii=False)
-    byte_count = get_byte_count(prompt_content)
-    return prompt_content, standard_json_str, byte_count, actual_num_insertions
+def describe_case(plan, target_length, base_pattern, text_file, seed):
+    """
+    用例标识（配对回放用）
+    - case_id: 基础文本与插针内容（位置和针值）的哈希，与模型、提示词布局和种子无关，同一用例在各模型的数据库中相同
+    - case_spec: 重建提示词所需的参数（种子、基础文本参数、各针的字符位置；针值取自 standard_json）
 
-async def make_api_request(session, request_id, semaphore, db_manager,
-                          target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio, stats):
+    返回: (case_id, case_spec JSON字符串)
     """
-    发送单个API请求（每次生成独立的测试用例）
+    spec = {'seed': seed, 'positions': [position for position, _ in plan['insertions']]}
+    if text_file:
+        spec['text_file'] = os.path.basename(text_file)
+        source = ['file', spec['text_file']]
+    else:
+        spec['target_length'] = target_length
+        spec['base_pattern'] = base_pattern
+        source = ['pattern', target_length, base_pattern]
+    digest = hashlib.sha256(json.dumps([source, plan['insertions']], ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()[:16], json.dumps(spec, ensure_ascii=False)
+
+def rebuild_plan(case_spec, standard_json, text_file=None):
     """
-    async with semaphore:
-        print(f"→ 请求 #{request_id}: 开始发送...")
+    按 describe_case 记录的参数重建插针计划（与 plan_test_case 的返回格式相同）
 
-        prompt_content, standard_answers_json, byte_count, actual_num_insertions = generate_test_case(
-            target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio
-        )
+    参数:
+        case_spec: case_spec JSON字符串
+        standard_json: 标准答案JSON字符串（针值按序号对应各位置）
+        text_file: 本次运行的文本文件路径（用例基于文本文件时使用，文件名须与记录的一致）
+    """
+    spec = json.loads(case_spec)
+    answers = json.loads(standard_json)
+    needles = [str(answers[key]) for key in sorted(answers, key=int)]
+    if len(needles) != len(spec['positions']):
+        raise ValueError("case_spec 的针数与标准答案不一致")
+    if 'text_file' in spec:
+        if not text_file or os.path.basename(text_file) != spec['text_file']:
+            raise ValueError(f"用例基于文本文件 {spec['text_file']}，需要在命令行指定同名文件")
+        base_string = load_base_string(None, text_file=text_file)
+    else:
+        base_string = load_base_string(spec['target_length'], spec['base_pattern'])
+    return {
+        'base_string': base_string,
+        'insertions': list(zip(spec['positions'], needles)),
+        'standard_json_str': standard_json,
+        'actual_num_insertions': len(needles),
+    }
 
-        db_manager.create_table_if_not_exists(byte_count, text_file)
+def prompt_segments(layout, answer_format='json'):
+    """返回某种提示词布局和回答格式在基础文本前后的文本: (指令前缀, 结尾文本)"""
+    if layout == 'cache':
+        return "", CACHE_PROMPT_TRAILERS[answer_format]
+    return ANSWER_FORMAT_PROMPTS[answer_format], ""
 
-        payload = {
-            "model": API_MODEL,
-            "messages": [
-                {"role": "user", "content": prompt_content}
-            ],
-            "stream": True
-        }
+def assemble_prompt(plan, layout='standard', answer_format='json'):
+    """按插针计划拼接完整提示词（standard: 指令 + 插针后的基础文本；cache: 插针后的基础文本 + 指令）"""
+    instruction, trailer = prompt_segments(layout, answer_format)
+    base_string = plan['base_string']
+    parts = [instruction]
+    previous = 0
+    for position, needle in plan['insertions']:
+        parts.append(base_string[previous:position])
+        parts.append(needle)
+        previous = position
+    parts.append(base_string[previous:])
+    parts.append(trailer)
+    return ''.join(parts)
 
-        try:
-            start_time = time.time()
-            async with session.post(API_URL, headers=HEADERS, json=payload, timeout=900) as response:
+def generate_test_case(target_length, num_insertions, base_pattern=DEFAULT_BASE_PATTERN, needle_range=DEFAULT_NEEDLE_RANGE, text_file=None, random_offset_ratio=DEFAULT_RANDOM_OFFSET_RATIO, seed=None, layout='standard', answer_format='json'):
+    """
+    生成一次测试用例（不落盘），参数同 plan_test_case
+    layout: 提示词布局（见 PROMPT_LAYOUTS；同一种子在不同布局下的针值和位置相同）
+    answer_format: 回答格式（见 ANSWER_FORMATS；同一种子在不同格式下的针值、位置和提示词字节数相同）
+
+    返回: (prompt_content, standard_json_str, byte_count, actual_num_insertions)
+    """
+    plan = plan_test_case(target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio, seed)
+    prompt_content = assemble_prompt(plan, layout, answer_format)
+    byte_count = get_byte_count(prompt_content)
+    return prompt_content, plan['standard_json_str'], byte_count, plan['actual_num_insertions']
+
+def get_body_template(target_length, base_pattern, text_file, payload_fields, layout='standard', answer_format='json'):
+    """获取（并缓存）某个基础文本、提示词布局和回答格式对应的预编码请求体模板"""
+    key = (target_length, base_pattern, text_file, json.dumps(payload_fields, sort_keys=True), layout, answer_format)
+    template = _BODY_TEMPLATE_CACHE.get(key)
+    if template is None:
+        base_string = load_base_string(target_length, base_pattern, text_file)
+        instruction, trailer = prompt_segments(layout, answer_format)
+        template = RequestBodyTemplate(payload_fields, instruction, base_string, trailer)
+        _BODY_TEMPLATE_CACHE[key] = template
+    return template
+
+async def fetch_completion(session, body, stream, case_hash, byte_count, key_pool, cost_tracker, reservation, compressor=None,
+                           endpoints=None, timeout=DEFAULT_REQUEST_TIMEOUT, trace=NULL_TRACE, hedge=False):
+    """
+    发送一次API请求并读取完整回答（不入库）
+
+    参数:
+        body: 预编码的JSON请求体（bytes）
+        stream: 请求体中是否开启了流式输出
+        case_hash: 用例哈希（仅录制/回放会话使用，其他情况为None）
+        reservation: 已为本次请求预留的预算（结束时结算）
+        compressor: RequestCompressor（None=不压缩请求体）
+        endpoints: EndpointPool（None=直接发送到 API_URL，不熔断）
+        timeout: 本次请求的超时时间（秒）
+        trace: 本次请求的 RequestTrace（记录各阶段耗时，未启用时为 NULL_TRACE）
+        hedge: 是否为对冲请求（费用单独统计）
+
+    返回: 结果字典
+        ok: 是否拿到非空回答
+        content: 回答文本
+        usage: token用量（可能为None）
+        cost: 本次费用（美元）
+        elapsed_time: 耗时（秒）
+        error: 失败原因（成功时为None）
+        endpoint: 接口名称（未使用接口池时为None）
+        timed_out: 是否因超时失败
+    """
+    result = {'ok': False, 'content': "", 'usage': None, 'cost': 0.0, 'elapsed_time': None, 'error': None,
+              'endpoint': None, 'timed_out': False}
+
+    # 选择负载最低的健康接口；熔断器打开的接口不参与，全部不可用时在此等待（半开时只有一个探测请求能通过）
+    endpoint, is_probe = None, False
+    url = API_URL
+    if endpoints is not None:
+        with trace.span('breaker_wait'):
+            endpoint, is_probe = await endpoints.acquire()
+        url = endpoint.url
+        result['endpoint'] = endpoint.name
+
+    # 从密钥池获取当前可用且负载最低的密钥
+    estimated_tokens = byte_count // ESTIMATED_BYTES_PER_TOKEN
+    try:
+        with trace.span('key_wait'):
+            api_key = await key_pool.acquire(estimated_tokens)
+    except asyncio.CancelledError:
+        if endpoint is not None:
+            endpoints.release(endpoint, is_probe, cancelled=True)
+        raise
+    headers = dict(HEADERS)
+    headers['authorization'] = f"Bearer {api_key.key}"
+    response_status = None
+    retry_after = None
+    usage = None
+    cancelled = False
+    sent = False  # 请求是否已交给服务器（之后被取消或超时仍会按提示词计费）
+    timed_out = False
+
+    start_time = time.time()
+    try:
+        while True:
+            request_data = body
+            request_headers = headers
+            if compressor is not None and compressor.enabled:
+                with trace.span('compress'):
+                    request_data, encoding_headers = compressor.encode(body)
+                request_headers = {**headers, **encoding_headers}
+            post_kwargs = {'headers': request_headers, 'data': request_data, 'timeout': timeout}
+            if case_hash is not None:
+                # 录制/回放会话以用例哈希作为录制文件的键
+                post_kwargs['case_hash'] = case_hash
+            if trace.enabled:
+                # 连接池等待和新建连接由 TraceRecorder 的 TraceConfig 记录到本请求的轨道
+                post_kwargs['trace_request_ctx'] = trace
+            sent_at = trace.now()
+            sent = True
+            async with session.post(url, **post_kwargs) as response:
+                response_status = response.status
+                headers_at = trace.now()
+                trace.add('wait_headers', sent_at, headers_at, status=response.status, endpoint=result['endpoint'])
+                if response.status == 415 and request_headers is not headers:
+                    # 服务器不接受压缩的请求体：停用压缩后重发一次
+                    compressor.reject()
+                    continue
                 if response.status == 200:
-                    content = ""
-                    
-                    if payload["stream"]:
-                        # 流式响应处理
-                        async for line in response.content:
-                            line_text = line.decode('utf-8').strip()
-                            
-                            # 跳过空行
-                            if not line_text:
-                                continue
-                            
+                    if stream:
+                        # 流式响应处理：按原始字节块增量解析
+                        parser = SSEParser()
+                        first_chunk_at = None
+                        async for chunk in response.content.iter_chunked(SSE_CHUNK_SIZE):
+                            if first_chunk_at is None:
+                                first_chunk_at = trace.now()
+                            parser.feed(chunk)
                             # 处理完成标记
-                            if line_text == "data: [DONE]":
+                            if parser.done:
                                 break
-                            
-                            # 解析data:开头的JSON
-                            if line_text.startswith("data: "):
-                                json_str = line_text[6:]  # 移除"data: "前缀
-                                try:
-                                    chunk_data = json.loads(json_str)
-                                    if 'choices' in chunk_data and len(chunk_data['choices']) > 0:
-                                        delta = chunk_data['choices'][0].get('delta', {})
-                                        chunk_content = delta.get('content', '')
-                                        if chunk_content:
-                                            content += chunk_content
-                                except json.JSONDecodeError:
-                                    continue
-                        
+                        parser.finish()
+                        content = parser.text()
+                        usage = parse_usage(parser.usage)
+                        if trace.enabled:
+                            # 预填充（响应头到第一个字节块）与流式输出两段
+                            first_chunk_at = first_chunk_at or trace.now()
+                            trace.add('prefill', headers_at, first_chunk_at)
+                            trace.add('stream', first_chunk_at, trace.now(), chars=len(content))
+
                         elapsed_time = time.time() - start_time
                     else:
                         # 非流式响应处理
-                        data = await response.json()
+                        with trace.span('read_body'):
+                            data = await response.json()
                         elapsed_time = time.time() - start_time
-                        
+                        usage = parse_usage(data.get('usage'))
+
                         if 'choices' in data and len(data['choices']) > 0:
                             content = data['choices'][0]['message']['content']
                         else:
-                            stats['failed'] += 1
-                            print(f"✗ 请求 #{request_id}: 失败 - No content in response (不写入数据库)")
-                            return False
-                    
-                    # 统一处理内容（流式和非流式）
+                            result['error'] = "No content in response"
+                            return result
+
+                    result['elapsed_time'] = elapsed_time
+                    result['content'] = content
                     if content:
-                        clean_json = extract_and_clean_json(content)
-                        if clean_json:
-                            db_manager.insert_result(
-                                byte_count=byte_count,
-                                standard_json=standard_answers_json,
-                                model_response_json=clean_json,
-                                elapsed_time=elapsed_time,
-                                text_file=text_file
-                            )
-                            # 成功入库：计入"已回答"一次（不增加解析失败）
-                            db_manager.update_stats(byte_count, answered_delta=1, parse_fail_delta=0, text_file=text_file)
-                            stats['success'] += 1
-                            stream_mode = "流式" if payload["stream"] else "非流式"
-                            print(f"✓ 请求 #{request_id}: 成功 ({stream_mode}), 耗时 {elapsed_time:.2f}秒 - 已存入数据库 "
-                                  f"(成功: {stats['success']}/{stats['success'] + stats['failed']})")
-                            return True
-                        else:
-                            # 解析失败：计入"已回答"一次 + "解析失败"一次
-                            db_manager.update_stats(byte_count, answered_delta=1, parse_fail_delta=1, text_file=text_file)
-                            stats['failed'] += 1
-                            print(f"✗ 请求 #{request_id}: 失败 - 无法提取有效JSON (不写入数据库)")
-                            return False
+                        result['ok'] = True
                     else:
-                        stats['failed'] += 1
-                        print(f"✗ 请求 #{request_id}: 失败 - 空内容 (不写入数据库)")
-                        return False
+                        result['error'] = "空内容"
+                    return result
                 else:
-                    elapsed_time = time.time() - start_time
-                    error_text = await response.text()
-                    stats['failed'] += 1
-                    print(f"✗ 请求 #{request_id}: 失败 - HTTP {response.status}: {error_text[:100]} (不写入数据库)")
-                    return False
-        except asyncio.TimeoutError:
-            stats['failed'] += 1
-            print(f"✗ 请求 #{request_id}: 失败 - Request timeout (不写入数据库)")
-            return False
-        except Exception as e:
-            stats['failed'] += 1
-            print(f"✗ 请求 #{request_id}: 失败 - {str(e)} (不写入数据库)")
-            return False
+                    result['elapsed_time'] = time.time() - start_time
+                    with trace.span('read_error'):
+                        error_text = await response.text()
+                    if response.status == 429:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    result['error'] = f"HTTP {response.status}: {error_text[:100]}"
+                    return result
+    except asyncio.TimeoutError:
+        timed_out = True
+        result['timed_out'] = True
+        result['error'] = f"Request timeout ({timeout:.0f}s)"
+        return result
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+    finally:
+        if endpoint is not None:
+            endpoints.release(endpoint, is_probe, response_status, time.time() - start_time, result['ok'], cancelled)
+        key_pool.release(api_key, success=result['ok'], status=response_status, retry_after=retry_after,
+                         estimated_tokens=estimated_tokens, usage=usage)
+        # 结算预算（流中途断开但已收到usage时，仍按实际用量计费；已发出后被取消或超时的按预估输入token计费）
+        result['usage'] = usage
+        result['cost'] = cost_tracker.settle(reservation, byte_count, usage, sent and (cancelled or timed_out), hedge)
+
+def record_answer(db_manager, byte_count, text_file, standard_answers_json, content, elapsed_time, usage, cost,
+                  layout='standard', trace=NULL_TRACE, case=None, answer_format='json'):
+    """
+    提取模型回答中的JSON并入库，同时更新"已回答/解析失败"统计（实时请求和批量结果导入共用）
+    case: (case_id, case_spec)，随结果一起记录（None=不记录）
+    answer_format: 请求的回答格式（紧凑格式的回答转换为JSON对象入库）
+
+    返回: 提取出的JSON字符串；解析失败时返回None（不写入结果表）
+    """
+    with trace.span('extract'):
+        clean_json = extract_and_clean_json(content, answer_format)
+    with trace.span('db_commit', parsed=bool(clean_json)):
+        if clean_json:
+            db_manager.insert_result(
+                byte_count=byte_count,
+                standard_json=standard_answers_json,
+                model_response_json=clean_json,
+                elapsed_time=elapsed_time,
+                text_file=text_file,
+                usage=usage,
+                cost=cost,
+                layout=layout,
+                case=case,
+                answer_format=answer_format
+            )
+            # 成功入库：计入"已回答"一次（不增加解析失败）
+            db_manager.update_stats(byte_count, answered_delta=1, parse_fail_delta=0, text_file=text_file)
+        else:
+            # 解析失败：计入"已回答"一次 + "解析失败"一次
+            db_manager.update_stats(byte_count, answered_delta=1, parse_fail_delta=1, text_file=text_file)
+    return clean_json
+
+async def make_api_request(session, request_id, db_manager,
+                          target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio, stats,
+                          key_pool, base_seed, stopper=None, cost_tracker=None, hedge_policy=None, shutdown=None,
+                          compressor=None, endpoints=None, layout='standard', latency_model=None, trace=NULL_TRACE,
+                          stored_cases=None, answer_format='json'):
+    """
+    发送单个API请求（每次生成独立的测试用例）
+
+    trace: 本请求的 RequestTrace（--trace 时记录生成用例、等待、连接、预填充、流式输出、提取和入库各阶段的耗时）
+    stored_cases: 配对回放时 {请求ID: 源数据库中的用例}（见 DatabaseManager.get_cases），按其重建用例而不是按种子生成
+    answer_format: 回答格式（见 ANSWER_FORMATS）
+    """
+    # 优雅退出：收到中断信号后，尚未开始的请求不再发送
+    if shutdown is not None and shutdown.stopping:
+        shutdown.mark_left(request_id, 'not_started')
+        return False
+
+    # 序贯停止：置信区间已达到目标宽度时不再发送新请求
+    if stopper is not None and stopper.done:
+        stats['skipped'] += 1
+        return False
+
+    log_event(logging.INFO, 'request_start', "→ 请求 #{request_id}: 开始发送...", request_id=request_id)
+
+    with trace.span('generate'):
+        if stored_cases is not None:
+            # 配对回放：按源数据库记录的插针位置和针值重建同一用例，沿用其 case_id
+            stored = stored_cases[request_id]
+            plan = rebuild_plan(stored['case_spec'], stored['standard_json'], text_file)
+            case = (stored['case_id'], stored['case_spec'])
+        else:
+            seed = case_seed(base_seed, request_id)
+            plan = plan_test_case(
+                target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio, seed=seed
+            )
+            case = describe_case(plan, target_length, base_pattern, text_file, seed)
+        standard_answers_json = plan['standard_json_str']
+
+        # 请求体由预编码的模板按插针位置拼接字节片段，不再逐次构造提示词字符串并整体序列化
+        template = get_body_template(target_length, base_pattern, text_file, REQUEST_FIELDS, layout, answer_format)
+        body = template.build(plan['insertions'])
+        byte_count = template.prompt_byte_count(plan['insertions'])
+        stream = REQUEST_FIELDS["stream"]
+        # 只有录制/回放时才需要完整提示词来计算用例哈希
+        case_hash = (compute_case_hash(API_MODEL, assemble_prompt(plan, layout, answer_format))
+                     if isinstance(session, CassetteSession) else None)
+
+    needles = len(plan['insertions'])
+    timeout = DEFAULT_REQUEST_TIMEOUT
+    if latency_model is not None and LATENCY_TIMEOUT_FACTOR is not None:
+        timeout = latency_model.timeout_for(
+            byte_count, needles, DEFAULT_REQUEST_TIMEOUT, LATENCY_TIMEOUT_FACTOR, minimum=LATENCY_TIMEOUT_MIN
+        )
+
+    db_manager.create_table_if_not_exists(byte_count, text_file)
+
+    # 预算控制：预计费用会超出预算时不再发送
+    reservation = cost_tracker.reserve(byte_count)
+    if reservation is None:
+        stats['budget_skipped'] += 1
+        log_event(logging.INFO, 'request_budget_skip', "- 请求 #{request_id}: 跳过 - 预计超出预算 ({cost_summary})",
+                  request_id=request_id, cost_summary=cost_tracker.describe())
+        return False
+
+    async def attempt(attempt_trace, attempt_reservation, is_hedge=False):
+        with attempt_trace.span('fetch', byte_count=byte_count, timeout=timeout):
+            return await fetch_completion(
+                session, body, stream, case_hash, byte_count, key_pool, cost_tracker, attempt_reservation, compressor,
+                endpoints, timeout, attempt_trace, is_hedge
+            )
+
+    if hedge_policy is None:
+        result = await attempt(trace, reservation)
+        hedged_win = False
+    else:
+        def start_attempt(is_hedge):
+            attempt_reservation = reservation
+            if is_hedge:
+                # 对冲请求同样受预算限制
+                attempt_reservation = cost_tracker.reserve(byte_count)
+                if attempt_reservation is None:
+                    return None
+                log_event(logging.INFO, 'request_hedge', "↻ 请求 #{request_id}: 超过耗时分位数，发送对冲请求",
+                          request_id=request_id)
+            return attempt(trace.hedge() if is_hedge else trace, attempt_reservation, is_hedge)
+
+        result, hedged_win = await run_hedged(hedge_policy, byte_count, start_attempt)
+
+    if not result['ok']:
+        stats['failed'] += 1
+        if result['timed_out'] and latency_model is not None:
+            # 超时的请求按超时时间计入耗时模型（右删失），避免模型只见到较快的请求而不断缩短超时
+            latency_model.observe(byte_count, needles, timeout)
+        log_event(logging.WARNING, 'request_failed', "✗ 请求 #{request_id}: 失败 - {error} (不写入数据库)",
+                  request_id=request_id, byte_count=byte_count, error=result['error'], endpoint=result['endpoint'])
+        return False
+
+    # 统一处理内容（流式和非流式）
+    elapsed_time = result['elapsed_time']
+    usage = result['usage']
+    clean_json = record_answer(
+        db_manager, byte_count, text_file, standard_answers_json, result['content'], elapsed_time,
+        usage, result['cost'] if usage else None, layout, trace, case, answer_format
+    )
+    if clean_json:
+        stats['success'] += 1
+        stream_mode = "流式" if stream else "非流式"
+        if hedged_win:
+            stream_mode += "，对冲胜出"
+        if usage and usage.get('cached_tokens'):
+            stream_mode += f"，缓存命中 {usage['cached_tokens']} token"
+        progress = cost_tracker.describe()
+        eta = None
+        if latency_model is not None:
+            latency_model.observe(byte_count, needles, elapsed_time)
+            if stats.get('concurrency'):
+                remaining = stats['planned'] - stats['success'] - stats['failed']
+                eta = latency_model.eta(byte_count, needles, remaining, stats['concurrency'])
+                if eta is not None:
+                    progress += f", 预计剩余 {format_duration(eta)}"
+        log_event(logging.INFO, 'request_success',
+                  "✓ 请求 #{request_id}: 成功 ({mode}), 耗时 {elapsed_time:.2f}秒 - 已存入数据库 "
+                  "(成功: {success}/{attempted}, {progress})",
+                  request_id=request_id, byte_count=byte_count, mode=stream_mode, elapsed_time=elapsed_time,
+                  hedged=hedged_win, cached_tokens=usage.get('cached_tokens') if usage else None,
+                  success=stats['success'], attempted=stats['success'] + stats['failed'],
+                  cost_summary=cost_tracker.describe(), eta_seconds=eta, progress=progress,
+                  endpoint=result['endpoint'])
+        if hedge_policy is not None:
+            hedge_policy.observe(byte_count, elapsed_time)
+        if stopper is not None:
+            with trace.span('grade'):
+                grade = grade_answers(json.loads(clean_json), json.loads(standard_answers_json))
+            stopper.add(grade['accuracy'])
+            log_event(logging.INFO, 'ci_update', "  置信区间: {interval}", request_id=request_id,
+                      accuracy=grade['accuracy'], interval=stopper.describe())
+        return True
+    else:
+        stats['failed'] += 1
+        log_event(logging.WARNING, 'request_parse_fail', "✗ 请求 #{request_id}: 失败 - 无法提取有效JSON (不写入数据库)",
+                  request_id=request_id, byte_count=byte_count)
+        return False
+
+def export_batch(path, db_manager, total_requests, base_seed,
+                 target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio,
+                 layout='standard', answer_format='json'):
+    """
+    把计划的用例导出为批量请求文件（不发送请求），并在数据库中记录 custom_id 与用例的对应关系
+
+    返回: 导出的请求数
+    """
+    template = get_body_template(target_length, base_pattern, text_file, BATCH_REQUEST_FIELDS, layout, answer_format)
+    jobs = []
+
+    def requests():
+        for request_id in range(1, total_requests + 1):
+            seed = case_seed(base_seed, request_id)
+            plan = plan_test_case(
+                target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio, seed=seed
+            )
+            byte_count = template.prompt_byte_count(plan['insertions'])
+            table_name = db_manager.create_table_if_not_exists(byte_count, text_file)
+            custom_id = batch_custom_id(table_name, seed)
+            jobs.append((custom_id, table_name, byte_count, text_file, request_id, seed, plan['standard_json_str'],
+                         layout, answer_format))
+            yield custom_id, template.build(plan['insertions'])
+
+    count = write_batch_requests(path, requests())
+    db_manager.record_batch_export(jobs)
+    return count
+
+def import_batch(path, db_manager, cost_tracker):
+    """
+    导入批量结果文件：按 custom_id 找回导出时的标准答案，经与实时请求相同的提取和统计流程入库
+    已导入过回答的 custom_id 会被跳过（重复导入同一文件不会重复计数）；请求失败的可以从重跑的结果文件再次导入
+
+    参数:
+        cost_tracker: 按批量价格计费的 CostTracker
+
+    返回: 统计字典
+    """
+    counts = {'success': 0, 'parse_fail': 0, 'failed': 0, 'duplicate': 0, 'unknown': 0}
+    ready_stats_tables = set()
+    for item in read_batch_results(path):
+        custom_id = item['custom_id']
+        job = db_manager.get_batch_job(custom_id) if custom_id else None
+        if job is None:
+            counts['unknown'] += 1
+            if custom_id is not None:
+                reason = f"未找到导出记录 (custom_id: {custom_id})"
+            else:
+                # 无法解析的行带有解析错误；能解析但缺少 custom_id 的行没有
+                reason = item['error'] or "缺少 custom_id"
+            print(f"? 第{item['line']}行: {reason}")
+            continue
+        if job['import_status'] in ('success', 'parse_fail'):
+            counts['duplicate'] += 1
+            continue
+
+        byte_count, text_file = job['byte_count'], job['text_file']
+        if item['error']:
+            counts['failed'] += 1
+            db_manager.mark_batch_imported(custom_id, 'failed')
+            print(f"✗ {custom_id}: 失败 - {item['error']} (不写入数据库)")
+            continue
+
+        db_manager.create_table_if_not_exists(byte_count, text_file)
+        if text_file not in ready_stats_tables:
+            db_manager.create_stats_table(text_file)
+            ready_stats_tables.add(text_file)
+        usage = parse_usage(item['usage'])
+        cost = cost_tracker.settle(0.0, byte_count, usage) if usage else None
+        # 批量结果没有单次请求耗时
+        clean_json = record_answer(
+            db_manager, byte_count, text_file, job['standard_json'], item['content'], None, usage, cost,
+            job['prompt_layout'], answer_format=job['answer_format']
+        )
+        if clean_json:
+            counts['success'] += 1
+            db_manager.mark_batch_imported(custom_id, 'success')
+        else:
+            counts['parse_fail'] += 1
+            db_manager.mark_batch_imported(custom_id, 'parse_fail')
+            print(f"✗ {custom_id}: 失败 - 无法提取有效JSON (不写入数据库)")
+    return counts
+
+def merge_shards(db_manager):
+    """
+    把所有分片数据库合并到模型数据库（合并成功的分片文件随即删除），并逐表核对统计：
+    追加的记录数应等于"已回答"增量减去"解析失败"增量
+
+    返回: 合并的分片数
+    """
+    shard_filenames = db_manager.shard_filenames()
+    for shard_filename in shard_filenames:
+        merged = db_manager.merge_shard(shard_filename)
+        os.remove(shard_filename)
+        for table_name, counts in sorted(merged.items()):
+            if not any(counts.values()):
+                continue
+            expected = counts['rows'] + counts['parse_fail']
+            consistent = counts['answered'] == expected
+            check = "✓" if consistent else f"⚠ 统计不一致（记录数+解析失败={expected}）"
+            log_event(logging.INFO if consistent else logging.WARNING, 'shard_merged',
+                      "  {shard} → {table_name}: 记录 +{rows}, 已回答 +{answered}, 解析失败 +{parse_fail} {check}",
+                      shard=os.path.basename(shard_filename), table_name=table_name, check=check, **counts)
+    return len(shard_filenames)
+
+async def run_processes(processes, base_seed, db_model_id=MODEL_ID, request_logging=None):
+    """
+    多进程模式：以相同参数启动 processes 个子进程（--shard i/N，统一基础种子），各自写入分片数据库，
+    全部退出后合并到模型数据库（之前中断遗留的分片也一并合并）
+
+    参数:
+        db_model_id: 数据库对应的模型ID（回放时为 MODEL_ID + REPLAY_DB_SUFFIX）
+        request_logging: RequestLogging（合并各分片的日志经它输出；None=使用默认设置）
+    """
+    args = strip_option(strip_option(sys.argv[1:], '--processes'), '--seed') + ['--seed', str(base_seed)]
+    print("=" * 70)
+    print(f"多进程模式: {processes} 个进程，基础种子 {base_seed}")
+    print("=" * 70)
+    start_time = time.time()
+    exit_codes = await run_shards(os.path.abspath(__file__), args, processes)
+    total_time = time.time() - start_time
+
+    db_manager = DatabaseManager(db_model_id, SCRIPT_DIR)
+    db_manager.connect()
+    print("\n" + "=" * 70)
+    print("合并分片数据库:")
+    request_logging = request_logging or RequestLogging()
+    request_logging.start()
+    try:
+        merged_count = merge_shards(db_manager)
+    finally:
+        # 停止时写出队列中的记录，之后的 print 不会与之交错
+        request_logging.stop()
+    db_manager.close()
+    print(f"已合并 {merged_count} 个分片数据库到 {db_manager.db_filename}")
+    failed = [index for index, code in enumerate(exit_codes) if code != 0]
+    if failed:
+        print(f"⚠ 分片 {', '.join(map(str, failed))} 异常退出（已写入的结果同样已合并）")
+    print(f"总耗时: {total_time:.2f}秒")
+    print(f"\n请运行 'python 数据分析/analyze_database.py {db_manager.db_filename}' 进行分析")
+    print("=" * 70)
 
 async def main():
     """主函数"""
     # 默认参数：使用配置文件中的默认值
     total_requests = DEFAULT_TOTAL_REQUESTS
     max_concurrent = DEFAULT_MAX_CONCURRENT
+    argv, options = split_cli_options(sys.argv)
 
-    if len(sys.argv) > 1:
+    if len(argv) > 1:
         try:
-            total_requests = int(sys.argv[1])
+            total_requests = int(argv[1])
             if total_requests <= 0:
                 raise ValueError
         except ValueError:
             print("错误: 运行次数必须是大于0的整数")
             print("使用方法: python run_batch_test.py [运行次数] [并发数] [请求延迟] [上下文长度] [插入数量] [基础模式] [插针范围] [文本文件]")
+            print("可选项: --seed N  --record DIR  --replay DIR  --replay-speed real|fast")
             print("\n示例 - 使用base_pattern生成文本:")
             print("  相对比例模式（0-1之间的小数）:")
             print("    python run_batch_test.py 20 5 1 240000 40 a| 0-1                    # 全文插针")
@@ -638,9 +1906,9 @@ async def main():
             print("    python run_batch_test.py 20 5 1 0 40 - 0-10000,20000-30000 收集数据/30000.txt  # 使用30000.txt，绝对位置插针")
             sys.exit(1)
 
-    if len(sys.argv) > 2:
+    if len(argv) > 2:
         try:
-            max_concurrent = int(sys.argv[2])
+            max_concurrent = int(argv[2])
             if max_concurrent <= 0:
                 raise ValueError
         except ValueError:
@@ -648,9 +1916,9 @@ async def main():
             sys.exit(1)
 
     request_delay = DEFAULT_REQUEST_DELAY
-    if len(sys.argv) > 3:
+    if len(argv) > 3:
         try:
-            request_delay = float(sys.argv[3])
+            request_delay = float(argv[3])
             if request_delay < 0:
                 raise ValueError
         except ValueError:
@@ -658,9 +1926,9 @@ async def main():
             sys.exit(1)
 
     target_length = DEFAULT_TARGET_LENGTH
-    if len(sys.argv) > 4:
+    if len(argv) > 4:
         try:
-            target_length = int(sys.argv[4])
+            target_length = int(argv[4])
             if target_length <= 0:
                 raise ValueError
         except ValueError:
@@ -668,9 +1936,9 @@ async def main():
             sys.exit(1)
 
     num_insertions = DEFAULT_NUM_INSERTIONS
-    if len(sys.argv) > 5:
+    if len(argv) > 5:
         try:
-            num_insertions = int(sys.argv[5])
+            num_insertions = int(argv[5])
             if num_insertions <= 0:
                 raise ValueError
         except ValueError:
@@ -678,18 +1946,18 @@ async def main():
             sys.exit(1)
 
     base_pattern = DEFAULT_BASE_PATTERN
-    if len(sys.argv) > 6:
-        base_pattern = sys.argv[6]
+    if len(argv) > 6:
+        base_pattern = argv[6]
         if not base_pattern:
             base_pattern = DEFAULT_BASE_PATTERN
 
     needle_range = DEFAULT_NEEDLE_RANGE
-    if len(sys.argv) > 7:
-        needle_range = sys.argv[7]
+    if len(argv) > 7:
+        needle_range = argv[7]
 
     text_file = DEFAULT_TEXT_FILE
-    if len(sys.argv) > 8:
-        text_file = sys.argv[8]
+    if len(argv) > 8:
+        text_file = argv[8]
         # 验证文件是否存在
         if text_file and not os.path.exists(text_file):
             print(f"错误: 文本文件不存在: {text_file}")
@@ -706,9 +1974,9 @@ async def main():
                 print(f"提示: 文件名建议的长度为 {suggested_length} 字节")
     
     random_offset_ratio = DEFAULT_RANDOM_OFFSET_RATIO
-    if len(sys.argv) > 9:
+    if len(argv) > 9:
         try:
-            random_offset_ratio = float(sys.argv[9]) if sys.argv[9].lower() != 'none' else None
+            random_offset_ratio = float(argv[9]) if argv[9].lower() != 'none' else None
             if random_offset_ratio is not None and (random_offset_ratio < 0 or random_offset_ratio > 1):
                 raise ValueError
         except ValueError:
@@ -772,7 +2040,213 @@ async def main():
         print(f"详细错误: {e}")
         sys.exit(1)
 
-    db_manager = DatabaseManager(MODEL_ID, SCRIPT_DIR)
+    processes = options.get('--processes', 1)
+    if processes < 1:
+        print("错误: --processes 必须是大于0的整数")
+        sys.exit(1)
+    shard_index, shard_count = None, 1
+    if '--shard' in options:
+        try:
+            shard_index, shard_count = parse_shard(options['--shard'])
+        except ValueError:
+            print("错误: --shard 的格式为 I/N（0 <= I < N）")
+            sys.exit(1)
+    if processes > 1:
+        # 序贯停止需要所有进程的样本；开环负载、预估和批量导入导出不经过并发请求，无需分进程
+        incompatible = [name for name in ('--shard', '--ci-width', '--arrival-rate', '--dry-run',
+                                          '--export-batch', '--import-batch') if name in options]
+        if incompatible:
+            print(f"错误: --processes 不能与 {', '.join(incompatible)} 同时使用")
+            sys.exit(1)
+    paired_source = options.get('--paired-with')
+    if paired_source:
+        # 配对回放的用例全部来自源数据库
+        incompatible = [name for name in ('--arrival-rate', '--export-batch', '--import-batch') if name in options]
+        if incompatible:
+            print(f"错误: --paired-with 不能与 {', '.join(incompatible)} 同时使用")
+            sys.exit(1)
+    control_address = None
+    if '--control' in options:
+        # 开环模式没有工作池（不受并发数限制），无法暂停或调整并发数
+        if '--arrival-rate' in options:
+            print("错误: --control 不能与 --arrival-rate 同时使用")
+            sys.exit(1)
+        control_address = parse_control_address(options['--control'], shard_index)
+
+    replay_dir = options.get('--replay')
+    record_dir = options.get('--record')
+    if replay_dir and record_dir:
+        print("错误: --record 和 --replay 不能同时使用")
+        sys.exit(1)
+    replay_speed = options.get('--replay-speed', 'real')
+    if replay_speed not in ('real', 'fast'):
+        print("错误: --replay-speed 只能是 real 或 fast")
+        sys.exit(1)
+    cassette_store = None
+    if replay_dir:
+        if not os.path.isdir(replay_dir):
+            print(f"错误: 录制目录不存在: {replay_dir}")
+            sys.exit(1)
+        cassette_store = CassetteStore(replay_dir)
+    elif record_dir:
+        cassette_store = CassetteStore(record_dir)
+
+    # 基础随机种子：回放时默认沿用录制时的种子，否则随机生成
+    base_seed = options.get('--seed')
+    if base_seed is None and replay_dir:
+        base_seed = cassette_store.load_meta().get('seed')
+    if base_seed is None:
+        base_seed = random.randrange(1, 10 ** 9)
+    if record_dir and shard_index is None:
+        cassette_store.save_meta({'seed': base_seed, 'model': API_MODEL})
+    # 回放的耗时不是真实耗时（fast 模式下接近0），结果写入单独的数据库
+    db_model_id = MODEL_ID + REPLAY_DB_SUFFIX if replay_dir else MODEL_ID
+
+    stopper = None
+    if '--ci-width' in options:
+        try:
+            stopper = SequentialStopper(
+                options['--ci-width'],
+                confidence=options.get('--ci-level', 0.95),
+                min_samples=options.get('--min-samples', 20),
+            )
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+
+    budget = options.get('--budget')
+    if budget is not None and budget <= 0:
+        print("错误: --budget 必须大于0")
+        sys.exit(1)
+    price = MODEL_PRICES.get(API_MODEL)
+    if budget is not None and not price:
+        print(f"错误: 使用 --budget 需要在 MODEL_PRICES 中配置 {API_MODEL} 的价格")
+        sys.exit(1)
+    if budget is not None and shard_index is not None:
+        # 各分片平分费用上限
+        budget /= shard_count
+    cost_tracker = CostTracker(price, budget, ESTIMATED_BYTES_PER_TOKEN, ESTIMATED_COMPLETION_TOKENS)
+
+    if '--import-batch' in options:
+        # 导入批量结果：用例信息来自导出时记录的 batch_jobs 表，不需要位置参数
+        import_path = options['--import-batch']
+        if not os.path.exists(import_path):
+            print(f"错误: 批量结果文件不存在: {import_path}")
+            sys.exit(1)
+        db_manager = DatabaseManager(MODEL_ID, SCRIPT_DIR)
+        db_manager.connect()
+        batch_price = {name: value * BATCH_PRICE_FACTOR for name, value in price.items()} if price else None
+        batch_cost_tracker = CostTracker(batch_price, None, ESTIMATED_BYTES_PER_TOKEN, ESTIMATED_COMPLETION_TOKENS)
+        counts = import_batch(import_path, db_manager, batch_cost_tracker)
+        db_manager.close()
+        print("\n" + "=" * 70)
+        print("批量结果导入完成！")
+        print("=" * 70)
+        print(f"结果文件: {import_path}")
+        print(f"数据库文件: {db_manager.db_filename}")
+        print(f"成功写入: {counts['success']}")
+        print(f"解析失败(未写入): {counts['parse_fail']}")
+        print(f"请求失败(未写入): {counts['failed']}")
+        print(f"已导入过(跳过): {counts['duplicate']}")
+        print(f"未找到导出记录(跳过): {counts['unknown']}")
+        if price:
+            print(f"按批量价格计费（MODEL_PRICES x{BATCH_PRICE_FACTOR:g}）")
+        batch_cost_tracker.print_report()
+        print("=" * 70)
+        return
+
+    hedge_policy = None
+    if '--hedge-percentile' in options:
+        try:
+            hedge_policy = HedgePolicy(
+                options['--hedge-percentile'],
+                max_fraction=options.get('--hedge-max-fraction', 0.1),
+                min_samples=HEDGE_MIN_SAMPLES,
+            )
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+
+    arrival_rates = []
+    if '--arrival-rate' in options:
+        try:
+            arrival_rates = [float(rate) for rate in options['--arrival-rate'].split(',')]
+            if min(arrival_rates) <= 0:
+                raise ValueError
+        except ValueError:
+            print("错误: --arrival-rate 必须是大于0的数字（多档用逗号分隔）")
+            sys.exit(1)
+    arrival_process = options.get('--arrival', 'poisson')
+    if arrival_process not in ARRIVAL_PROCESSES:
+        print(f"错误: --arrival 只能是 {' 或 '.join(ARRIVAL_PROCESSES)}")
+        sys.exit(1)
+    layout = options.get('--layout', 'standard')
+    if layout not in PROMPT_LAYOUTS:
+        print(f"错误: --layout 只能是 {' 或 '.join(PROMPT_LAYOUTS)}")
+        sys.exit(1)
+    answer_format = options.get('--answer-format', 'json')
+    if answer_format not in ANSWER_FORMATS:
+        print(f"错误: --answer-format 只能是 {' / '.join(ANSWER_FORMATS)}")
+        sys.exit(1)
+    if '--api-url' in options:
+        try:
+            apply_api_url_option(options['--api-url'])
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+    # 开环模式下每档发送"运行次数"个请求；分片只运行自己负责的请求ID
+    planned_requests = total_requests * len(arrival_rates) if arrival_rates else total_requests
+    job_ids = range(1, total_requests + 1)
+    if shard_index is not None:
+        job_ids = shard_request_ids(total_requests, shard_index, shard_count)
+        planned_requests = len(job_ids)
+        # 各分片的派发间隔按进程数放大，保持总体请求速率不变
+        request_delay *= shard_count
+
+    compressor = None
+    if '--compress' in options:
+        encoding = options['--compress']
+        try:
+            compressor = RequestCompressor(encoding, COMPRESSION_LEVELS.get(encoding, []))
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+
+    log_file = options.get('--log-file')
+    if log_file and shard_index is not None:
+        # 各分片写入各自的日志文件（多个进程轮转同一文件会互相覆盖）
+        root, ext = os.path.splitext(log_file)
+        log_file = f"{root}.shard{shard_index}{ext}"
+    trace_file = options.get('--trace')
+    if trace_file and shard_index is not None:
+        root, ext = os.path.splitext(trace_file)
+        trace_file = f"{root}.shard{shard_index}{ext}"
+    sample_rate = options.get('--log-sample')
+    try:
+        request_logging = RequestLogging(
+            options.get('--log-level', 'INFO').upper(),
+            {event: sample_rate for event in LOG_SAMPLED_EVENTS} if sample_rate is not None else None,
+            log_file, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUP_COUNT
+        )
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    endpoints = build_endpoint_pool(shard_count)
+    key_pool = build_key_pool(shard_count)
+    # 配置了密钥池或多接口且未在命令行指定并发数时，总并发数取各密钥（各接口）并发上限之和（两者都有时取较小者）
+    capacity_limits = [pool.total_concurrency for configured, pool in ((API_KEYS, key_pool), (API_ENDPOINTS, endpoints))
+                       if configured and pool.total_concurrency]
+    if capacity_limits and len(argv) <= 2:
+        max_concurrent = min(capacity_limits)
+    elif shard_index is not None:
+        max_concurrent = math.ceil(max_concurrent / shard_count)
+
+    if processes > 1:
+        await run_processes(processes, base_seed, db_model_id, request_logging)
+        return
+
+    db_manager = DatabaseManager(db_model_id, SCRIPT_DIR, shard_index)
     db_manager.connect()
     # 确保统计表存在（用于记录"已回答/解析失败"计数）
     # 注意：仅在不使用文本文件时创建
@@ -780,18 +2254,31 @@ async def main():
 
     # 先生成一个测试用例以获取实际的插入数量和字节数
     sample_prompt, sample_standard_json, sample_byte_count, actual_num_insertions = generate_test_case(
-        target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio
+        target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio,
+        seed=case_seed(base_seed, 1), layout=layout, answer_format=answer_format
     )
 
     print("=" * 70)
     print("批量API数据收集脚本（SQLite版本 - 动态并发）")
     print("=" * 70)
-    print(f"API地址: {API_URL}")
-    print(f"模型ID（数据库）: {MODEL_ID}")
+    if replay_dir:
+        print(f"API地址: 回放 {replay_dir}（速度: {replay_speed}）")
+    else:
+        print(f"API地址: {describe_endpoints(endpoints)}")
+    if record_dir:
+        print(f"录制目录: {record_dir}")
+    print(f"模型ID（数据库）: {db_model_id}")
     print(f"API模型名称: {API_MODEL}")
-    print(f"最大并发数: {max_concurrent}")
-    print(f"请求延迟: {request_delay}秒")
-    print(f"总请求数: {total_requests}")
+    print(f"API密钥数: {len(key_pool.keys)}")
+    if shard_index is not None:
+        print(f"分片: {shard_index}/{shard_count}（请求ID {shard_index + 1}, {shard_index + 1 + shard_count}, ...）")
+    if arrival_rates:
+        print(f"开环负载: 到达率 {', '.join(f'{rate:g}' for rate in arrival_rates)} 请求/秒（{arrival_process}），"
+              f"每档 {total_requests} 个请求")
+    else:
+        print(f"最大并发数: {max_concurrent}")
+        print(f"请求延迟: {request_delay:g}秒")
+    print(f"总请求数: {planned_requests}")
     if text_file:
         print(f"文本来源: 文件 {text_file}")
         print(f"实际字节数: {sample_byte_count}")
@@ -809,58 +2296,281 @@ async def main():
         print(f"随机偏移: {random_offset_ratio*100:.1f}%")
     else:
         print(f"随机偏移: 无")
+    print(f"随机种子: {base_seed}")
+    print(f"提示词布局: {layout}")
+    print(f"回答格式: {answer_format}")
+    if budget is not None:
+        print(f"费用上限: ${budget:g}")
+    if compressor is not None:
+        print(f"请求体压缩: {compressor.encoding}")
+    # 连接池上限与并发数一致；对冲时每个主请求最多再占一个连接；开环模式不限制（不应被客户端连接池限速）；
+    # 启用控制接口时并发数可在运行中调大，连接池也不限制（并发由工作池限制）
+    if arrival_rates or control_address:
+        connection_limit = 0
+    else:
+        connection_limit = max_concurrent * 2 if hedge_policy is not None else max_concurrent
+    print(f"连接池: 上限 {connection_limit or '不限'}，keep-alive {CONNECTOR_KEEPALIVE_SECONDS}秒，"
+          f"事件循环: {'uvloop' if options.get('--uvloop') else 'asyncio'}")
     print("=" * 70)
+
+    if options.get('--dry-run'):
+        # 同一次运行中每个用例的提示词字节数相同，按样本用例预估整次运行
+        estimate = cost_tracker.estimate_usage(sample_byte_count)
+        print(f"\n[dry-run] 计划请求数: {planned_requests}，每次提示词 {sample_byte_count} 字节")
+        print(f"  预估每次输入token: {estimate['prompt_tokens']}，输出token: {estimate['completion_tokens']}")
+        print(f"  预估总输入token: {estimate['prompt_tokens'] * planned_requests}")
+        print(f"  预估总输出token: {estimate['completion_tokens'] * planned_requests}")
+        if price:
+            print(f"  预估总费用: ${cost_tracker.cost_of(estimate) * planned_requests:.4f}")
+        else:
+            print(f"  未在 MODEL_PRICES 中配置 {API_MODEL} 的价格，无法预估费用")
+        db_manager.close()
+        return
+
+    if '--export-batch' in options:
+        export_path = options['--export-batch']
+        count = export_batch(
+            export_path, db_manager, total_requests, base_seed,
+            target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio, layout,
+            answer_format
+        )
+        db_manager.close()
+        print(f"\n已导出 {count} 个请求到批量请求文件: {export_path}")
+        print("上传到批量接口完成后，运行以下命令导入结果:")
+        print(f"  python run_batch_test.py --import-batch <结果文件>")
+        return
+
     table_name = db_manager.create_table_if_not_exists(sample_byte_count, text_file)
 
     stats_before = db_manager.get_table_stats(sample_byte_count, text_file)
     print(f"\n字节数: {sample_byte_count} bytes")
     print(f"表 {table_name} 当前统计:")
     print(f"  已有记录数: {stats_before['total']}")
+    if stopper is not None:
+        for accuracy in db_manager.get_accuracies(sample_byte_count, text_file, layout, answer_format,
+                                                  actual_num_insertions):
+            stopper.add(accuracy)
+        print(f"序贯停止: 上限 {total_requests} 次，当前 {stopper.describe()}")
+    history_db = db_manager
+    if shard_index is not None:
+        # 分片数据库只有本次运行的记录，历史耗时从模型数据库读取
+        history_db = DatabaseManager(db_model_id, SCRIPT_DIR)
+        history_db.connect()
+    stored_cases = None
+    if paired_source:
+        source_db = DatabaseManager(paired_source, SCRIPT_DIR)
+        if paired_source.endswith('.db'):
+            source_db.db_filename = paired_source
+        if not os.path.exists(source_db.db_filename):
+            print(f"错误: 源数据库不存在: {source_db.db_filename}")
+            sys.exit(1)
+        if os.path.abspath(source_db.db_filename) == os.path.abspath(history_db.db_filename):
+            print("错误: --paired-with 的源数据库不能是本模型的数据库")
+            sys.exit(1)
+        source_db.connect()
+        cases, legacy = source_db.get_cases(table_name)
+        source_db.close()
+        # 只回放与本次运行参数相同的用例（请求体模板按本次的文本参数构建）
+        expected = ({'text_file': os.path.basename(text_file)} if text_file
+                    else {'target_length': target_length, 'base_pattern': base_pattern})
+        matching = [case for case in cases
+                    if all(json.loads(case['case_spec']).get(key) == value for key, value in expected.items())]
+        done = history_db.get_case_ids(table_name)
+        pending = [case for case in matching if case['case_id'] not in done]
+        selected = pending[:total_requests]
+        print(f"配对回放: 源数据库 {source_db.db_filename} 表 {table_name} 中 {len(matching)} 个用例，"
+              f"本模型已完成 {len(matching) - len(pending)} 个，本次回放 {len(selected)} 个")
+        if legacy:
+            print(f"  另有 {legacy} 条旧记录缺少 case_spec，无法回放")
+        if len(cases) > len(matching):
+            print(f"  另有 {len(cases) - len(matching)} 个用例的文本参数与本次运行不同，未回放")
+        # 各分片按相同顺序得到相同的用例列表，请求ID即列表序号
+        stored_cases = {request_id: case for request_id, case in enumerate(selected, 1)}
+        total_requests = len(selected)
+        job_ids = range(1, total_requests + 1)
+        if shard_index is not None:
+            job_ids = shard_request_ids(total_requests, shard_index, shard_count)
+        planned_requests = len(job_ids)
+    latency_model = LatencyModel(min_samples=LATENCY_MODEL_MIN_SAMPLES)
+    for byte_count, needles, elapsed in history_db.get_latency_samples(LATENCY_HISTORY_ROWS, layout, answer_format):
+        latency_model.observe(byte_count, needles, elapsed, refit=False)
+    if text_file:
+        # tokens_* 表按本次的字节数和针数计入
+        elapsed_times = history_db.get_elapsed_times(sample_byte_count, text_file, layout, answer_format)
+        for elapsed in elapsed_times[-LATENCY_HISTORY_ROWS:]:
+            latency_model.observe(sample_byte_count, actual_num_insertions, elapsed, refit=False)
+    latency_model.refit()
+    print(latency_model.describe(sample_byte_count, actual_num_insertions))
+    if latency_model.ready:
+        if LATENCY_TIMEOUT_FACTOR is not None:
+            request_timeout = latency_model.timeout_for(
+                sample_byte_count, actual_num_insertions, DEFAULT_REQUEST_TIMEOUT, LATENCY_TIMEOUT_FACTOR,
+                minimum=LATENCY_TIMEOUT_MIN
+            )
+            print(f"  单个请求超时: {request_timeout:.0f}秒（随新样本更新）")
+        if not arrival_rates:
+            eta = latency_model.eta(sample_byte_count, actual_num_insertions, planned_requests, max_concurrent)
+            print(f"  预计总耗时: 约 {format_duration(eta)}（{planned_requests} 个请求，并发 {max_concurrent}）")
+    if hedge_policy is not None:
+        hedge_policy.load(sample_byte_count,
+                          history_db.get_elapsed_times(sample_byte_count, text_file, layout, answer_format))
+    if history_db is not db_manager:
+        history_db.close()
+    if hedge_policy is not None:
+        delay = hedge_policy.delay_for(sample_byte_count)
+        if delay is None:
+            print(f"对冲请求: 历史耗时不足 {HEDGE_MIN_SAMPLES} 条，积累足够成功样本后启用")
+        else:
+            print(f"对冲请求: 耗时超过 {delay:.2f}秒（P{hedge_policy.percentile:g}）时对冲，"
+                  f"上限为主请求数的 {hedge_policy.max_fraction*100:.0f}%")
 
-    print("\n开始批量测试（动态并发模式）...\n")
+    if arrival_rates:
+        print("\n开始批量测试（开环负载模式）...\n")
+    else:
+        print("\n开始批量测试（动态并发模式）...\n")
 
-    semaphore = asyncio.Semaphore(max_concurrent)
-    stats = {'success': 0, 'failed': 0}
+    # planned / concurrency 用于估算剩余时间（开环模式不受并发数限制，不估算）
+    stats = {'success': 0, 'failed': 0, 'skipped': 0, 'budget_skipped': 0,
+             'planned': planned_requests, 'concurrency': None if arrival_rates else max_concurrent}
+    load_steps = []  # 开环模式各档统计
     start_time = time.time()
 
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for i in range(1, total_requests + 1):
-            task = asyncio.create_task(
-                make_api_request(
-                    session, i, semaphore, db_manager,
-                    target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio, stats
-                )
-            )
-            tasks.append(task)
-            # 在创建下一个任务前添加延迟（错开任务启动时间）
-            if request_delay > 0 and i < total_requests:
-                await asyncio.sleep(request_delay)
-        await asyncio.gather(*tasks)
+    connection_stats = ConnectionStats()
+    shutdown = ShutdownController()
+    shutdown.install()
+    request_logging.start()
+    tracer = TraceRecorder(trace_file) if trace_file else None
+    control = None
+    try:
+        connector = build_connector(connection_limit, CONNECTOR_LIMIT_PER_HOST, CONNECTOR_KEEPALIVE_SECONDS,
+                                    CONNECTOR_DNS_TTL)
+        trace_configs = [connection_stats.trace_config]
+        if tracer is not None:
+            trace_configs.append(tracer.trace_config)
+        async with aiohttp.ClientSession(connector=connector, trace_configs=trace_configs) as http_session:
+            session = http_session
+            if replay_dir:
+                session = ReplaySession(cassette_store, realtime=(replay_speed == 'real'))
+            elif record_dir:
+                session = RecordingSession(http_session, cassette_store)
+
+            async def run_job(request_id):
+                trace = tracer.request(request_id) if tracer is not None else NULL_TRACE
+                with trace.span('request'):
+                    return await make_api_request(
+                        session, request_id, db_manager,
+                        target_length, num_insertions, base_pattern, needle_range, text_file, random_offset_ratio,
+                        stats, key_pool, base_seed, stopper, cost_tracker, hedge_policy, shutdown, compressor, endpoints,
+                        layout, latency_model, trace, stored_cases, answer_format
+                    )
+
+            grace_period = options.get('--grace-period', DEFAULT_GRACE_PERIOD)
+            if arrival_rates:
+                # 开环负载：逐档按目标到达率发送，各档请求ID（用例种子）连续编号
+                for step, rate in enumerate(arrival_rates):
+                    first_id = step * total_requests + 1
+                    if shutdown.stopping:
+                        shutdown.mark_left(range(first_id, planned_requests + 1), 'not_dispatched')
+                        break
+                    print(f"\n--- 负载档位 {step + 1}/{len(arrival_rates)}: {rate:g} 请求/秒 ({arrival_process}) ---")
+                    runner = OpenLoopRunner(
+                        run_job, range(first_id, first_id + total_requests), rate, arrival_process,
+                        random.Random(case_seed(base_seed, first_id))
+                    )
+                    runner.start()
+                    await shutdown.drain(runner, grace_period)
+                    load_steps.append(runner.summary())
+            else:
+                # 固定数量的工作协程从有界队列取请求ID，相邻两次派发间隔 request_delay 秒
+                pool = WorkerPool(max_concurrent, run_job, job_ids, dispatch_delay=request_delay)
+                pool.start()
+                if control_address:
+                    control = ControlServer(pool, key_pool, shutdown, stats, cost_tracker, endpoints)
+                    try:
+                        print(f"控制接口: {await control.start(control_address)}\n")
+                    except OSError as e:
+                        print(f"⚠ 控制接口启动失败（{e}），继续运行\n")
+                        control = None
+                await shutdown.drain(pool, grace_period)
+    finally:
+        if control is not None:
+            await control.stop()
+        request_logging.stop()
+        shutdown.uninstall()
+        if tracer is not None:
+            tracer.close()
+
+    if shutdown.left_jobs:
+        db_manager.record_unfinished_jobs(
+            table_name,
+            [(ids, case_seed(base_seed, ids[0]), reason) for ids, reason in shutdown.left_jobs]
+        )
 
     total_time = time.time() - start_time
 
+    if load_steps:
+        db_manager.record_load_curve(table_name, arrival_process, load_steps)
+
     stats_after = db_manager.get_table_stats(sample_byte_count, text_file)
     stats_info = db_manager.get_stats(sample_byte_count, text_file)
     db_manager.close()
 
     print("\n" + "=" * 70)
-    print("数据收集完成！")
+    print("数据收集已中断！" if shutdown.stopping else "数据收集完成！")
     print("=" * 70)
     print(f"数据库文件: {db_manager.db_filename}")
     print(f"数据表: {table_name}")
     print(f"数据库总记录数: {stats_after['total']}")
-    print(f"本次尝试请求: {total_requests}")
+    # 优雅退出时未派发/未开始的请求不计入本次尝试
+    not_sent = sum(count for reason, count in shutdown.left_counts().items() if reason != 'cancelled')
+    attempted = planned_requests - stats['skipped'] - stats['budget_skipped'] - not_sent
+    print(f"本次尝试请求: {attempted}")
     print(f"本次成功写入: {stats['success']}")
     print(f"本次失败(未写入): {stats['failed']}")
-    print(f"成功率: {(stats['success']/total_requests*100):.2f}%")
+    if stopper is not None:
+        print(f"序贯停止跳过: {stats['skipped']} ({stopper.describe()})")
+    if budget is not None:
+        print(f"预算不足跳过: {stats['budget_skipped']}")
+    if hedge_policy is not None:
+        print(hedge_policy.describe())
+        if cost_tracker.price:
+            print(hedge_policy.describe_cost(cost_tracker.hedge_spent, cost_tracker.spent))
+    if shutdown.left_jobs:
+        detail = ", ".join(f"{reason} {count}" for reason, count in shutdown.left_counts().items())
+        print(f"未完成请求: {shutdown.left_count} ({detail})，已记录到 unfinished_jobs 表（基础种子 {base_seed}）")
+    print(f"成功率: {(stats['success']/max(attempted, 1)*100):.2f}%")
     print(f"总耗时: {total_time:.2f}秒")
-    print(f"平均耗时: {(total_time/total_requests):.2f}秒/请求")
+    print(f"平均耗时: {(total_time/max(attempted, 1)):.2f}秒/请求")
     # 统计汇总（含解析失败统计，仅统计HTTP 200且模型有回答的请求）
     print(f"已回答计数（成功+解析失败）: {stats_info.get('answered_count', 0)}")
     print(f"解析失败计数: {stats_info.get('parse_fail_count', 0)}")
+    key_pool.print_report()
+    cost_tracker.print_report()
+    if compressor is not None:
+        compressor.print_report()
+    endpoints.print_report()
+    connection_stats.print_report()
+    request_logging.print_report()
+    if tracer is not None:
+        tracer.print_report()
+    if control is not None:
+        control.print_report()
+    if load_steps:
+        print_load_curve(load_steps)
+    if replay_dir:
+        print(f"回放命中: {session.replayed}, 未找到录制: {session.missing}")
+    if shard_index is not None:
+        print("=" * 70)
+        return
     print(f"\n请运行 'python 数据分析/analyze_database.py {db_manager.db_filename}' 进行分析")
     print("=" * 70)
 
 if __name__ == "__main__":
+    # 事件循环需在 asyncio.run 之前选定
+    _, startup_options = split_cli_options(sys.argv)
+    if startup_options.get('--uvloop'):
+        if uvloop is None:
+            print("错误: 使用 --uvloop 需要安装 uvloop（pip install uvloop）")
+            sys.exit(1)
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     asyncio.run(main())
\ No newline at end of file
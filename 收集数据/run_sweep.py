@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import random
+import sys
+import time
+
+import aiohttp
+
+from connection_pool import build_connector
+from control_server import ControlServer, parse_control_address
+from cost_tracker import CostTracker
+from graceful_shutdown import ShutdownController
+from latency_model import LatencyModel
+from request_log import RequestLogging, log_event
+from run_batch_test import (
+    API_MODEL, CONNECTOR_DNS_TTL, CONNECTOR_KEEPALIVE_SECONDS, CONNECTOR_LIMIT_PER_HOST, DEFAULT_BASE_PATTERN,
+    DEFAULT_GRACE_PERIOD, DEFAULT_MAX_CONCURRENT, DEFAULT_NEEDLE_RANGE, DEFAULT_RANDOM_OFFSET_RATIO,
+    ESTIMATED_BYTES_PER_TOKEN, ESTIMATED_COMPLETION_TOKENS, LATENCY_HISTORY_ROWS, LATENCY_MODEL_MIN_SAMPLES,
+    MODEL_ID, MODEL_PRICES, SCRIPT_DIR, DatabaseManager, apply_api_url_option, build_endpoint_pool, build_key_pool,
+    case_seed, describe_endpoints, format_duration, generate_test_case, make_api_request, split_cli_options,
+)
+from sweep_allocation import SweepAllocator, build_cells
+from worker_pool import WorkerPool
+
+DEFAULT_SWEEP_MIN_SAMPLES = 5       # 每个单元格至少需要的样本数（之后才按置信区间收益分配）
+DEFAULT_SWEEP_MAX_REQUESTS = 1000   # 默认请求上限
+
+# 命令行选项（含义与 run_batch_test.py 相同）
+#   --seed N             基础随机种子（第i个请求的用例种子为 N*1000000+i）
+#   --ci-level P         置信水平（默认0.95）
+#   --min-samples N      每个单元格至少需要的样本数（默认 DEFAULT_SWEEP_MIN_SAMPLES）
+#   --budget USD         费用上限
+#   --grace-period S     Ctrl-C 后等待在途请求完成的宽限期（秒）
+#   --api-url URL        覆盖 API_URL（如本地替身服务；逗号分隔的多个地址覆盖 API_ENDPOINTS）
+#   --control ADDR       运行中的控制接口（端口、主机:端口或 Unix 套接字路径；/status 额外返回各单元格的样本数和区间宽度）
+SWEEP_OPTIONS = {
+    '--seed': int,
+    '--ci-level': float,
+    '--min-samples': int,
+    '--budget': float,
+    '--grace-period': float,
+    '--api-url': str,
+    '--control': str,
+}
+
+
+def parse_int_list(text):
+    values = [int(x) for x in text.split(',') if x.strip()]
+    if not values or min(values) <= 0:
+        raise ValueError
+    return values
+
+
+def print_grid(cells, lengths, needle_counts, target_width):
+    """按 长度 × 针数 输出各单元格的样本数和置信区间宽度（* 表示已达到目标精度）"""
+    by_key = {(cell.length, cell.needles): cell for cell in cells}
+    header = "长度 \\ 针数"
+    print(f"{header:<14}" + "".join(f"{needles:>18}" for needles in needle_counts))
+    for length in lengths:
+        row = f"{length:<14}"
+        for needles in needle_counts:
+            cell = by_key[(length, needles)]
+            width = cell.stopper.width
+            if width is None:
+                text = f"n={cell.n}"
+            else:
+                mark = "*" if cell.n >= cell.stopper.min_samples and width < target_width else " "
+                text = f"n={cell.n} 宽{width:.1f}{mark}"
+            row += f"{text:>18}"
+        print(row)
+
+
+def cell_status(cells):
+    """各单元格的样本数、在途请求数、平均准确率和置信区间宽度（供控制接口 /status 返回）"""
+    return [{'length': cell.length, 'needles': cell.needles, 'n': cell.n, 'in_flight': cell.in_flight,
+             'mean': cell.stopper.accuracy.mean if cell.n else None, 'width': cell.stopper.width,
+             'done': cell.stopper.done} for cell in cells]
+
+
+async def run_sweep(lengths, needle_counts, target_width, max_requests, max_concurrent, options):
+    base_seed = options.get('--seed')
+    if base_seed is None:
+        base_seed = random.randrange(1, 10 ** 9)
+    confidence = options.get('--ci-level', 0.95)
+    min_samples = options.get('--min-samples', DEFAULT_SWEEP_MIN_SAMPLES)
+
+    db_manager = DatabaseManager(MODEL_ID, SCRIPT_DIR)
+    db_manager.connect()
+    db_manager.create_stats_table(None)
+
+    # 各单元格的提示词字节数（即数据表）由上下文长度和针数决定，与种子无关
+    grid = []
+    for length in lengths:
+        for needles in needle_counts:
+            _, _, byte_count, actual_needles = generate_test_case(
+                length, needles, DEFAULT_BASE_PATTERN, DEFAULT_NEEDLE_RANGE, None, DEFAULT_RANDOM_OFFSET_RATIO,
+                seed=case_seed(base_seed, 1)
+            )
+            grid.append((length, actual_needles, byte_count))
+    try:
+        cells = build_cells(grid, target_width, confidence, min_samples)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    # 数据表只由字节数决定，其中可能有其他针数的记录（如 run_batch_test.py 的运行，或字节数相同的另一单元格），
+    # 因此历史记录按 (字节数, 针数) 取用
+    history = {}
+    for cell in cells:
+        db_manager.create_table_if_not_exists(cell.byte_count)
+        key = (cell.byte_count, cell.needles)
+        if key not in history:
+            # 扫描只发送 standard 布局、json 格式的请求，历史准确率和耗时只取同布局同格式的记录
+            history[key] = db_manager.get_accuracies(cell.byte_count, layout='standard', answer_format='json',
+                                                     needles=cell.needles)
+        for accuracy in history[key]:
+            cell.stopper.add(accuracy)
+
+    latency_model = LatencyModel(min_samples=LATENCY_MODEL_MIN_SAMPLES)
+    for byte_count, needles, elapsed in db_manager.get_latency_samples(LATENCY_HISTORY_ROWS, layout='standard',
+                                                                     answer_format='json'):
+        latency_model.observe(byte_count, needles, elapsed, refit=False)
+    latency_model.refit()
+
+    def expected_cost(cell):
+        # 耗时模型就绪时按预测耗时（占用并发槽位的时间），否则按提示词字节数
+        predicted = latency_model.predict(cell.byte_count, cell.needles)
+        return predicted if predicted is not None else cell.byte_count
+
+    allocator = SweepAllocator(cells, target_width, min_samples, expected_cost)
+
+    price = MODEL_PRICES.get(API_MODEL)
+    budget = options.get('--budget')
+    if budget is not None and not price:
+        print(f"错误: 使用 --budget 需要在 MODEL_PRICES 中配置 {API_MODEL} 的价格")
+        sys.exit(1)
+    cost_tracker = CostTracker(price, budget, ESTIMATED_BYTES_PER_TOKEN, ESTIMATED_COMPLETION_TOKENS)
+    key_pool = build_key_pool()
+    endpoints = build_endpoint_pool()
+
+    print("=" * 70)
+    print("网格扫描（主动分配样本）")
+    print("=" * 70)
+    print(f"API地址: {describe_endpoints(endpoints)}")
+    print(f"模型ID（数据库）: {MODEL_ID}")
+    print(f"单元格: {len(lengths)} 个长度 × {len(needle_counts)} 种针数 = {len(cells)}")
+    print(f"目标精度: 每个单元格的 {confidence * 100:.0f}% 置信区间宽度 < {target_width:g} 个百分点"
+          f"（每格至少 {min_samples} 个样本）")
+    print(f"请求上限: {max_requests}, 并发数: {max_concurrent}, 随机种子: {base_seed}")
+    print(latency_model.describe(cells[0].byte_count, cells[0].needles))
+    print("\n当前各单元格（含数据库中已有记录）:")
+    print_grid(cells, lengths, needle_counts, target_width)
+    print("=" * 70)
+
+    stats = {'success': 0, 'failed': 0, 'skipped': 0, 'budget_skipped': 0, 'planned': max_requests,
+             'concurrency': None}
+    request_logging = RequestLogging()
+    shutdown = ShutdownController()
+    shutdown.install()
+    request_logging.start()
+    start_time = time.time()
+    pool = None
+    control = None
+    control_address = parse_control_address(options['--control']) if '--control' in options else None
+    try:
+        # 启用控制接口时并发数可在运行中调大，连接池不限制（并发由工作池限制）
+        connector = build_connector(0 if control_address else max_concurrent, CONNECTOR_LIMIT_PER_HOST, CONNECTOR_KEEPALIVE_SECONDS,
+                                    CONNECTOR_DNS_TTL)
+        async with aiohttp.ClientSession(connector=connector) as session:
+
+            async def run_job(request_id):
+                # 在真正开始发送时才选择单元格，以便用上最新的评分和在途请求数
+                while True:
+                    if shutdown.stopping:
+                        return False
+                    cell = allocator.choose()
+                    if cell is not None:
+                        break
+                    if allocator.in_flight == 0:
+                        # 所有单元格都已达到目标精度
+                        pool.stop()
+                        return False
+                    # 计入在途请求后已预计达到目标精度：等在途请求结束再决定（可能失败或评分偏离预期）
+                    await allocator.wait_for_change()
+                allocator.start(cell)
+                log_event(logging.INFO, 'sweep_assign', "  请求 #{request_id} → 单元格 {cell}（已有 {samples} 个样本）",
+                          request_id=request_id, cell=cell.label(), byte_count=cell.byte_count, samples=cell.n)
+                try:
+                    return await make_api_request(
+                        session, request_id, db_manager,
+                        cell.length, cell.needles, DEFAULT_BASE_PATTERN, DEFAULT_NEEDLE_RANGE, None,
+                        DEFAULT_RANDOM_OFFSET_RATIO, stats, key_pool, base_seed, cell.stopper, cost_tracker,
+                        shutdown=shutdown, endpoints=endpoints, latency_model=latency_model
+                    )
+                finally:
+                    allocator.finish(cell)
+
+            pool = WorkerPool(max_concurrent, run_job, range(1, max_requests + 1), queue_size=1)
+            pool.start()
+            if control_address:
+                control = ControlServer(pool, key_pool, shutdown, stats, cost_tracker, endpoints,
+                                        extra_status=lambda: {'cells': cell_status(cells)})
+                try:
+                    print(f"控制接口: {await control.start(control_address)}\n")
+                except OSError as e:
+                    print(f"⚠ 控制接口启动失败（{e}），继续运行\n")
+                    control = None
+            await shutdown.drain(pool, options.get('--grace-period', DEFAULT_GRACE_PERIOD))
+    finally:
+        if control is not None:
+            await control.stop()
+        request_logging.stop()
+        shutdown.uninstall()
+    total_time = time.time() - start_time
+    db_manager.close()
+
+    done = sum(1 for cell in cells if cell.stopper.done)
+    sent = stats['success'] + stats['failed']
+    print("\n" + "=" * 70)
+    print("网格扫描已中断！" if shutdown.stopping else "网格扫描完成！")
+    print("=" * 70)
+    print_grid(cells, lengths, needle_counts, target_width)
+    print(f"\n达到目标精度的单元格: {done}/{len(cells)}")
+    print(f"本次请求: {sent}（成功 {stats['success']}, 失败 {stats['failed']}, 预算不足跳过 {stats['budget_skipped']}）")
+    print("本次分配: " + ", ".join(f"{cell.label()} {cell.sent}" for cell in cells if cell.sent))
+    total_samples = sum(cell.n for cell in cells)
+    print(f"总样本数: {total_samples}（按当前方差估算，均匀分配达到同样精度约需 {allocator.uniform_estimate()} 个）")
+    print(f"总耗时: {format_duration(total_time)}")
+    key_pool.print_report()
+    cost_tracker.print_report()
+    endpoints.print_report()
+    if control is not None:
+        control.print_report()
+    print(f"\n请运行 'python 数据分析/analyze_summary.py {db_manager.db_filename}' 查看各长度的统计")
+    print("=" * 70)
+
+
+def main():
+    """
+    使用方法: python run_sweep.py <长度1,长度2,...> <针数1,针数2,...> <目标区间宽度> [最大请求数] [并发数] [选项]
+    在 长度 × 针数 网格上采样（基础文本为 DEFAULT_BASE_PATTERN，全文均匀插针），每个请求分给
+    "单位预期成本下置信区间收窄最多"的单元格，直到所有单元格的置信区间宽度都小于目标宽度或达到请求上限
+    """
+    positional, options = split_cli_options(sys.argv, SWEEP_OPTIONS)
+    args = positional[1:]
+    if len(args) < 3:
+        print(main.__doc__)
+        sys.exit(1)
+    try:
+        lengths = parse_int_list(args[0])
+        needle_counts = parse_int_list(args[1])
+        target_width = float(args[2])
+        max_requests = int(args[3]) if len(args) > 3 else DEFAULT_SWEEP_MAX_REQUESTS
+        max_concurrent = int(args[4]) if len(args) > 4 else DEFAULT_MAX_CONCURRENT
+        if target_width <= 0 or max_requests <= 0 or max_concurrent <= 0:
+            raise ValueError
+    except ValueError:
+        print("错误: 长度和针数必须是逗号分隔的正整数，目标区间宽度、最大请求数和并发数必须大于0")
+        sys.exit(1)
+    if '--api-url' in options:
+        try:
+            apply_api_url_option(options['--api-url'])
+        except ValueError as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+    asyncio.run(run_sweep(lengths, needle_counts, target_width, max_requests, max_concurrent, options))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import math
+from statistics import NormalDist
+
+
+class RunningAccuracy:
+    """增量计算准确率的均值和方差（Welford算法），无需保存全部样本"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """样本方差（n<2 时返回None）"""
+        if self.n < 2:
+            return None
+        return self._m2 / (self.n - 1)
+
+    def half_width(self, z):
+        """均值置信区间的半宽（n<2 时返回None）"""
+        variance = self.variance
+        if variance is None:
+            return None
+        return z * math.sqrt(variance / self.n)
+
+
+class SequentialStopper:
+    """
+    按置信区间宽度决定是否停止采样：
+    当平均准确率的置信区间宽度小于目标宽度（且样本数不少于 min_samples）时停止
+
+    参数:
+        target_width: 目标区间宽度（准确率百分点，例如 5 表示 ±2.5）
+        confidence: 置信水平（默认0.95）
+        min_samples: 判断停止前至少需要的样本数（避免早期方差估计不稳定）
+    """
+
+    def __init__(self, target_width, confidence=0.95, min_samples=20):
+        if target_width <= 0:
+            raise ValueError("目标区间宽度必须大于0")
+        if not 0 < confidence < 1:
+            raise ValueError("置信水平必须在0-1之间")
+        self.target_width = target_width
+        self.confidence = confidence
+        self.min_samples = min_samples
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.accuracy = RunningAccuracy()
+
+    def add(self, accuracy):
+        """加入一个已入库样本的准确率（0-100）"""
+        self.accuracy.add(accuracy)
+
+    @property
+    def width(self):
+        """当前置信区间宽度（样本不足时返回None）"""
+        half = self.accuracy.half_width(self.z)
+        return None if half is None else 2 * half
+
+    @property
+    def done(self):
+        if self.accuracy.n < self.min_samples:
+            return False
+        width = self.width
+        return width is not None and width < self.target_width
+
+    def describe(self):
+        """返回当前状态的简短描述"""
+        width = self.width
+        if width is None:
+            return f"n={self.accuracy.n}"
+        return (f"n={self.accuracy.n}, 均值 {self.accuracy.mean:.2f}%, "
+                f"{self.confidence * 100:.0f}%区间宽度 {width:.2f} (目标 <{self.target_width})")
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import signal
+import sys
+
+
+def parse_shard(value):
+    """
+    解析 --shard 的值 "i/N"（第 i 个分片，从0开始，共 N 个）
+
+    返回: (i, N)；格式无效时抛出 ValueError
+    """
+    index, _, count = value.partition('/')
+    index, count = int(index), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"无效的分片: {value}")
+    return index, count
+
+
+def shard_request_ids(total_requests, index, count):
+    """分片 index 负责的请求ID（按ID取模交错分配，各分片的用例长度和请求数相近）"""
+    return range(index + 1, total_requests + 1, count)
+
+
+def strip_option(args, name):
+    """从参数列表中去掉需要参数值的选项 name（支持 "--name 值" 和 "--name=值" 两种写法）"""
+    result = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg == name:
+            skip = True
+        elif not arg.startswith(name + '='):
+            result.append(arg)
+    return result
+
+
+async def _pipe_output(stream, prefix):
+    """逐行转发子进程输出（加分片前缀）"""
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        print(prefix + line.decode('utf-8', errors='replace').rstrip('\n'))
+
+
+async def run_shards(script, args, count):
+    """
+    启动 count 个子进程运行 script（参数为 args 加上 --shard i/count），转发其输出并等待全部退出
+    每个子进程有独立的事件循环、连接池和分片数据库
+
+    Ctrl-C 由各子进程自行优雅退出（与单进程相同），主进程只等待它们结束
+
+    返回: 各子进程的退出码列表
+    """
+    loop = asyncio.get_running_loop()
+    interrupted = False
+
+    def on_signal():
+        nonlocal interrupted
+        if not interrupted:
+            print("\n收到中断信号：等待各分片完成在途请求并退出...")
+            interrupted = True
+
+    try:
+        loop.add_signal_handler(signal.SIGINT, on_signal)
+        installed = True
+    except (NotImplementedError, RuntimeError):
+        previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: loop.call_soon_threadsafe(on_signal))
+        installed = False
+
+    env = dict(os.environ, PYTHONUNBUFFERED='1', PYTHONIOENCODING='utf-8')
+    try:
+        processes = []
+        for index in range(count):
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, script, *args, '--shard', f"{index}/{count}",
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, env=env
+            )
+            processes.append(process)
+        await asyncio.gather(*(_pipe_output(process.stdout, f"[分片{index}] ")
+                               for index, process in enumerate(processes)))
+        return [await process.wait() for process in processes]
+    finally:
+        if installed:
+            loop.remove_signal_handler(signal.SIGINT)
+        else:
+            signal.signal(signal.SIGINT, previous_handler)
@@ -0,0 +1,77 @@
+import json
+
+# 只有包含这些字段的数据块才需要完整解析JSON
+_CONTENT_MARKER = b'"content"'
+_USAGE_MARKER = b'"usage"'
+
+
+class SSEParser:
+    """
+    增量SSE解析器（直接处理 iter_chunked 得到的原始字节块）
+
+    - 在字节层面按换行切分，不对每一行单独解码/strip
+    - 快速扫描数据块：不含 "content" / "usage" 字段的块（如纯推理内容、心跳）不做JSON解析
+    - 回答片段先收集到列表，最后一次性拼接，避免长输出时字符串反复拼接的O(n²)开销
+    """
+
+    def __init__(self):
+        self._pending = b""  # 上一个字节块末尾未结束的半行
+        self._parts = []
+        self.usage = None
+        self.done = False
+        self.events = 0      # 收到的 data 行数
+        self.parsed = 0      # 实际做了JSON解析的行数
+
+    def feed(self, chunk):
+        """输入一个原始字节块；遇到 [DONE] 后忽略后续内容"""
+        if self.done:
+            return
+        if self._pending:
+            chunk = self._pending + chunk
+        lines = chunk.split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            if line:
+                self._handle_line(line)
+                if self.done:
+                    return
+
+    def finish(self):
+        """流结束：处理最后一行（没有换行结尾时）"""
+        if self._pending and not self.done:
+            self._handle_line(self._pending)
+        self._pending = b""
+
+    def _handle_line(self, line):
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        if not line.startswith(b"data:"):
+            return
+        data = line[5:]
+        if data.startswith(b" "):
+            data = data[1:]
+        self.events += 1
+        if data == b"[DONE]":
+            self.done = True
+            return
+        if _CONTENT_MARKER not in data and _USAGE_MARKER not in data:
+            return
+        self.parsed += 1
+        try:
+            chunk_data = json.loads(data.decode('utf-8'))
+        except ValueError:
+            return
+        if not isinstance(chunk_data, dict):
+            return
+        # usage 块通常在最后一个数据块中（choices 为空）
+        if chunk_data.get('usage'):
+            self.usage = chunk_data['usage']
+        choices = chunk_data.get('choices')
+        if choices:
+            content = (choices[0].get('delta') or {}).get('content')
+            if content:
+                self._parts.append(content)
+
+    def text(self):
+        """返回拼接后的完整回答"""
+        return "".join(self._parts)
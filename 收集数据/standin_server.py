@@ -0,0 +1,363 @@
+import asyncio
+import gzip
+import json
+import math
+import random
+import re
+import sys
+import time
+
+from aiohttp import web
+
+from request_compression import zstandard
+from run_batch_test import ANSWER_FORMATS, ESTIMATED_BYTES_PER_TOKEN, prompt_segments
+
+DEFAULT_PORT = 8000
+DEFAULT_PROFILE = 'realistic'
+READ_CHUNK_SIZE = 64 * 1024   # 按带宽限速读取请求体时每块的字节数
+MAX_STREAM_CHUNKS = 50        # 每个回答最多分成多少个SSE块
+STALL_POLL_SECONDS = 1        # 停顿的流检查客户端是否已断开的间隔（秒）
+
+# 行为配置：
+#   recall_curve: 召回率-深度曲线 [(深度0-1, 召回率), ...]，之间线性插值
+#   length_halflife: 召回率随提示词字节数衰减的半衰期（字节，None=不衰减）
+#   hallucination_rate: 每根针之后额外输出一个不存在的四位数的概率
+#   misorder_rate: 相邻两个回答互换顺序的概率
+#   ttft_median / ttft_per_kb / ttft_sigma: 首token耗时的中位数（秒）= ttft_median + ttft_per_kb x 提示词KB数，
+#                                           按对数正态分布抖动（sigma 为 ln 的标准差）
+#   tokens_per_second: 输出速度
+#   error_429_rate / error_5xx_rate: 返回 429（带 Retry-After）/ 5xx 的概率
+#   stall_rate / stall_seconds: 流输出到一半后停止发送的概率和停顿时长（None=一直停顿直到客户端断开）
+#   upload_mbps: 模拟的上行带宽（按此速度读取请求体，None=不限速）
+STANDIN_PROFILES = {
+    'perfect': {
+        'recall_curve': [(0.0, 1.0), (1.0, 1.0)],
+        'length_halflife': None,
+        'hallucination_rate': 0.0,
+        'misorder_rate': 0.0,
+        'ttft_median': 0.0,
+        'ttft_per_kb': 0.0,
+        'ttft_sigma': 0.0,
+        'tokens_per_second': None,
+        'error_429_rate': 0.0,
+        'error_5xx_rate': 0.0,
+        'stall_rate': 0.0,
+        'stall_seconds': None,
+        'retry_after': 1,
+        'upload_mbps': None,
+    },
+    # 中间深度召回较低（lost in the middle），长上下文整体衰减
+    'realistic': {
+        'recall_curve': [(0.0, 0.98), (0.25, 0.9), (0.5, 0.82), (0.75, 0.88), (1.0, 0.97)],
+        'length_halflife': 4000000,
+        'hallucination_rate': 0.01,
+        'misorder_rate': 0.02,
+        'ttft_median': 1.0,
+        'ttft_per_kb': 0.005,
+        'ttft_sigma': 0.3,
+        'tokens_per_second': 80,
+        'error_429_rate': 0.02,
+        'error_5xx_rate': 0.01,
+        'stall_rate': 0.005,
+        'stall_seconds': None,
+        'retry_after': 5,
+        'upload_mbps': None,
+    },
+    'flaky': {
+        'recall_curve': [(0.0, 0.95), (0.5, 0.7), (1.0, 0.9)],
+        'length_halflife': 2000000,
+        'hallucination_rate': 0.05,
+        'misorder_rate': 0.05,
+        'ttft_median': 2.0,
+        'ttft_per_kb': 0.01,
+        'ttft_sigma': 0.6,
+        'tokens_per_second': 40,
+        'error_429_rate': 0.15,
+        'error_5xx_rate': 0.1,
+        'stall_rate': 0.05,
+        'stall_seconds': None,
+        'retry_after': 10,
+        'upload_mbps': None,
+    },
+}
+
+_NEEDLE_PATTERN = re.compile(r'(?<!\d)[1-9]\d{3}(?!\d)')
+
+
+def strip_instructions(prompt):
+    """
+    去掉提示词中的指令部分（standard / cache 两种布局，各种回答格式），只留插针的文本
+
+    返回: (插针的文本, 回答格式)
+    """
+    for answer_format in ANSWER_FORMATS:
+        instruction, _ = prompt_segments('standard', answer_format)
+        if prompt.startswith(instruction):
+            return prompt[len(instruction):], answer_format
+        _, trailer = prompt_segments('cache', answer_format)
+        if prompt.endswith(trailer):
+            return prompt[:-len(trailer)], answer_format
+    return prompt, 'json'
+
+
+def format_answer(numbers, answer_format):
+    """按提示词要求的回答格式输出数字列表"""
+    if answer_format == 'array':
+        return json.dumps(numbers)
+    if answer_format == 'csv':
+        return ",".join(str(n) for n in numbers)
+    return "```json\n" + json.dumps({str(i): n for i, n in enumerate(numbers, 1)}) + "\n```"
+
+
+def find_needles(text):
+    """返回: [(深度0-1, 四位数), ...]，按出现顺序"""
+    length = max(len(text), 1)
+    return [(match.start() / length, int(match.group())) for match in _NEEDLE_PATTERN.finditer(text)]
+
+
+def interpolate(curve, x):
+    """分段线性插值（curve 按横坐标升序）"""
+    if x <= curve[0][0]:
+        return curve[0][1]
+    for (x0, y0), (x1, y1) in zip(curve, curve[1:]):
+        if x <= x1:
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0) if x1 > x0 else y1
+    return curve[-1][1]
+
+
+class StandInServer:
+    """
+    本地 OpenAI 兼容替身服务（/v1/chat/completions，SSE 格式与 API_URL 相同），用于离线压测和验证数据流程：
+    从提示词中找出四位数针，按配置的召回率-深度曲线、幻觉和乱序概率生成回答，
+    按配置的首token耗时和输出速度流式返回，并按概率注入 429 / 5xx 和停顿的流
+
+    请求体支持 Content-Encoding: gzip / zstd（zstd 需安装 zstandard，否则返回415）
+
+    参数:
+        profile: 行为配置（STANDIN_PROFILES 中的名称或配置字典）
+        seed: 随机种子（None=随机）
+    """
+
+    def __init__(self, profile=DEFAULT_PROFILE, seed=None):
+        if isinstance(profile, str):
+            if profile not in STANDIN_PROFILES:
+                raise ValueError(f"行为配置必须是 {' / '.join(STANDIN_PROFILES)} 之一")
+            profile = STANDIN_PROFILES[profile]
+        self.profile = dict(profile)
+        self.rng = random.Random(seed)
+        self.runner = None
+        self.url = None
+        self.peers = set()  # 服务端看到的TCP连接（对端地址）
+        self.stats = {'requests': 0, 'ok': 0, '429': 0, '5xx': 0, '415': 0, 'stalled': 0, 'disconnected': 0,
+                      'needles': 0, 'recalled': 0, 'wire_bytes': 0, 'body_bytes': 0}
+
+    async def start(self, host='127.0.0.1', port=0):
+        """启动服务，返回接口URL"""
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post('/v1/chat/completions', self.handle)
+        # 请求体由 handle 自行解压（记录压缩前后的字节数，并对不支持的编码返回415）
+        self.runner = web.AppRunner(app, access_log=None, auto_decompress=False)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}/v1/chat/completions"
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def _read_body(self, request):
+        """按模拟带宽读取请求体"""
+        upload_mbps = self.profile.get('upload_mbps')
+        if not upload_mbps:
+            return await request.read()
+        bytes_per_second = upload_mbps * 1000000 / 8
+        chunks = []
+        start = time.monotonic()
+        received = 0
+        async for chunk in request.content.iter_chunked(READ_CHUNK_SIZE):
+            chunks.append(chunk)
+            received += len(chunk)
+            delay = received / bytes_per_second - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return b"".join(chunks)
+
+    @staticmethod
+    def _error(status, message, headers=None):
+        body = {"error": {"message": message, "type": "standin_error", "code": status}}
+        return web.json_response(body, status=status, headers=headers)
+
+    def _answer(self, text, prompt_bytes):
+        """按配置生成回答中的数字列表"""
+        profile = self.profile
+        decay = 1.0
+        if profile.get('length_halflife'):
+            decay = 0.5 ** (prompt_bytes / profile['length_halflife'])
+        needles = find_needles(text)
+        answer = []
+        for depth, number in needles:
+            if self.rng.random() < interpolate(profile['recall_curve'], depth) * decay:
+                answer.append(number)
+            if self.rng.random() < profile.get('hallucination_rate', 0.0):
+                answer.append(self.rng.randint(1000, 9999))
+        misorder_rate = profile.get('misorder_rate', 0.0)
+        for i in range(len(answer) - 1):
+            if self.rng.random() < misorder_rate:
+                answer[i], answer[i + 1] = answer[i + 1], answer[i]
+        self.stats['needles'] += len(needles)
+        self.stats['recalled'] += len(answer)
+        return answer
+
+    def _ttft(self, prompt_bytes):
+        profile = self.profile
+        median = profile.get('ttft_median', 0.0) + profile.get('ttft_per_kb', 0.0) * prompt_bytes / 1024
+        return median * math.exp(profile.get('ttft_sigma', 0.0) * self.rng.gauss(0, 1))
+
+    async def handle(self, request):
+        self.stats['requests'] += 1
+        self.peers.add(request.transport.get_extra_info('peername') if request.transport else None)
+        wire = await self._read_body(request)
+        self.stats['wire_bytes'] += len(wire)
+        encoding = request.headers.get('Content-Encoding', '').lower()
+        if encoding == 'gzip':
+            raw = gzip.decompress(wire)
+        elif encoding == 'zstd' and zstandard is not None:
+            raw = zstandard.ZstdDecompressor().decompressobj().decompress(wire)
+        elif encoding in ('', 'identity'):
+            raw = wire
+        else:
+            self.stats['415'] += 1
+            return self._error(415, f"unsupported content-encoding: {encoding}")
+        self.stats['body_bytes'] += len(raw)
+
+        try:
+            payload = json.loads(raw)
+            prompt = payload['messages'][-1]['content']
+        except (ValueError, KeyError, IndexError, TypeError):
+            return self._error(400, "invalid request body")
+
+        profile = self.profile
+        roll = self.rng.random()
+        if roll < profile.get('error_429_rate', 0.0):
+            self.stats['429'] += 1
+            return self._error(429, "rate limit exceeded", headers={'Retry-After': str(profile.get('retry_after', 1))})
+        if roll < profile.get('error_429_rate', 0.0) + profile.get('error_5xx_rate', 0.0):
+            self.stats['5xx'] += 1
+            return self._error(self.rng.choice([500, 502, 503]), "upstream error")
+
+        prompt_bytes = len(prompt.encode('utf-8'))
+        text, answer_format = strip_instructions(prompt)
+        content = format_answer(self._answer(text, prompt_bytes), answer_format)
+        usage = {
+            "prompt_tokens": prompt_bytes // ESTIMATED_BYTES_PER_TOKEN,
+            "completion_tokens": len(content) // 3 + 1,
+            "total_tokens": prompt_bytes // ESTIMATED_BYTES_PER_TOKEN + len(content) // 3 + 1,
+        }
+        completion_id = f"chatcmpl-standin-{self.stats['requests']}"
+        model = payload.get('model', 'standin')
+        ttft = self._ttft(prompt_bytes)
+        tokens_per_second = profile.get('tokens_per_second')
+        generation_time = usage['completion_tokens'] / tokens_per_second if tokens_per_second else 0.0
+
+        if not payload.get('stream'):
+            await asyncio.sleep(ttft + generation_time)
+            self.stats['ok'] += 1
+            return web.json_response({
+                "id": completion_id, "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        try:
+            await asyncio.sleep(ttft)
+            chunk_count = min(MAX_STREAM_CHUNKS, len(content))
+            chunk_size = math.ceil(len(content) / chunk_count)
+            stall_at = None
+            if self.rng.random() < profile.get('stall_rate', 0.0):
+                stall_at = self.rng.randrange(chunk_count)
+            for index in range(chunk_count):
+                if index == stall_at:
+                    self.stats['stalled'] += 1
+                    stall_seconds = profile.get('stall_seconds')
+                    if stall_seconds is None:
+                        # 一直停顿，直到客户端超时断开（aiohttp 默认不会因客户端断开而取消处理函数）
+                        while request.transport is not None and not request.transport.is_closing():
+                            await asyncio.sleep(STALL_POLL_SECONDS)
+                        raise ConnectionResetError
+                    await asyncio.sleep(stall_seconds)
+                delta = content[index * chunk_size:(index + 1) * chunk_size]
+                event = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+                await response.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                if generation_time:
+                    await asyncio.sleep(generation_time / chunk_count)
+            final = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            await response.write(f"data: {json.dumps(final)}\n\n".encode('utf-8'))
+            if (payload.get('stream_options') or {}).get('include_usage'):
+                usage_event = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                               "choices": [], "usage": usage}
+                await response.write(f"data: {json.dumps(usage_event)}\n\n".encode('utf-8'))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            self.stats['ok'] += 1
+        except ConnectionResetError:
+            # 客户端超时或取消（如对冲落败）
+            self.stats['disconnected'] += 1
+        return response
+
+    def print_report(self):
+        stats = self.stats
+        print("替身服务统计:")
+        print(f"  请求: {stats['requests']}, 成功: {stats['ok']}, 429: {stats['429']}, 5xx: {stats['5xx']}, "
+              f"415: {stats['415']}, 停顿: {stats['stalled']}, 客户端断开: {stats['disconnected']}")
+        if stats['needles']:
+            print(f"  针数: {stats['needles']}, 回答数字: {stats['recalled']}")
+        if stats['wire_bytes'] != stats['body_bytes']:
+            print(f"  请求体: 接收 {stats['wire_bytes']} 字节，解压后 {stats['body_bytes']} 字节")
+        print(f"  TCP连接: {len(self.peers)}")
+
+
+async def serve(profile, host, port, seed):
+    server = StandInServer(profile, seed)
+    url = await server.start(host, port)
+    print(f"替身服务已启动: {url}（行为配置: {profile}）")
+    print(f"使用方法: python run_batch_test.py ... --api-url {url}")
+    print("按 Ctrl-C 停止")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        server.print_report()
+
+
+def main():
+    """
+    使用方法: python standin_server.py [端口] [行为配置] [随机种子]
+    行为配置: STANDIN_PROFILES 中的名称（perfect / realistic / flaky）
+    """
+    try:
+        port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+        profile = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PROFILE
+        seed = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    except ValueError:
+        print("错误: 端口和随机种子必须是整数")
+        sys.exit(1)
+    if profile not in STANDIN_PROFILES:
+        print(f"错误: 行为配置必须是 {' / '.join(STANDIN_PROFILES)} 之一")
+        sys.exit(1)
+    try:
+        asyncio.run(serve(profile, '127.0.0.1', port, seed))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import asyncio
+import math
+
+from sequential_stopping import SequentialStopper
+
+DEFAULT_PRIOR_SD = 20.0  # 还没有任何单元格能估计方差时假定的准确率标准差（百分点）
+
+
+class SweepCell:
+    """
+    网格中的一个单元格（上下文长度 × 针数）
+
+    stopper 为该单元格的 SequentialStopper（直接作为 make_api_request 的 stopper 参数，入库后的评分由它累计）
+    """
+
+    def __init__(self, length, needles, byte_count, stopper):
+        self.length = length
+        self.needles = needles
+        self.byte_count = byte_count
+        self.stopper = stopper
+        self.in_flight = 0
+        self.sent = 0  # 本次运行分配给该单元格的请求数
+
+    @property
+    def n(self):
+        return self.stopper.accuracy.n
+
+    def label(self):
+        return f"{self.length}×{self.needles}"
+
+
+class SweepAllocator:
+    """
+    主动分配样本：每个新请求分给"单位预期成本下置信区间收窄最多"的单元格，
+    使整张热力图以最少的请求数达到目标精度（各单元格的置信区间宽度都小于 target_width）
+
+    - 样本数（含在途请求）不足 min_samples 的单元格优先，先补齐样本数最少的
+    - 之后按 收益/成本 选择：收益 = 区间宽度 w(m) - w(m+1)，w(m) = 2·z·s/√m，
+      m 为已入库样本数加在途请求数（在途请求视为即将到达的样本，避免并发时一窝蜂涌向同一单元格）
+    - s 为该单元格的样本标准差；样本不足2个时用其他单元格的合并标准差（都没有时为 DEFAULT_PRIOR_SD）
+    - 成本由 cost_fn(cell) 给出（如耗时模型预测的耗时），未提供时按提示词字节数
+
+    参数:
+        cells: [SweepCell, ...]
+        target_width: 目标置信区间宽度（百分点）
+        min_samples: 每个单元格至少需要的样本数
+        cost_fn: 函数 cost_fn(cell) -> 预期成本（None=按字节数）
+    """
+
+    def __init__(self, cells, target_width, min_samples=5, cost_fn=None):
+        self.cells = cells
+        self.target_width = target_width
+        self.min_samples = min_samples
+        self.cost_fn = cost_fn or (lambda cell: cell.byte_count)
+        self._changed = asyncio.Event()
+
+    @property
+    def in_flight(self):
+        return sum(cell.in_flight for cell in self.cells)
+
+    def _pooled_sd(self):
+        variances = [cell.stopper.accuracy.variance for cell in self.cells if cell.n >= 2]
+        if not variances:
+            return DEFAULT_PRIOR_SD
+        return math.sqrt(sum(variances) / len(variances))
+
+    def _width(self, cell, samples, sd):
+        return 2 * cell.stopper.z * sd / math.sqrt(samples)
+
+    def _sd(self, cell, pooled):
+        return math.sqrt(cell.stopper.accuracy.variance) if cell.n >= 2 else pooled
+
+    def satisfied(self, cell, pooled=None):
+        """该单元格（计入在途请求后）是否预计已达到目标精度"""
+        samples = cell.n + cell.in_flight
+        if samples < self.min_samples:
+            return False
+        sd = self._sd(cell, self._pooled_sd() if pooled is None else pooled)
+        return self._width(cell, samples, sd) < self.target_width
+
+    def choose(self):
+        """返回下一个请求应分配的单元格；所有单元格都已（预计）达到目标精度时返回None"""
+        pooled = self._pooled_sd()
+        warmup = [cell for cell in self.cells if cell.n + cell.in_flight < self.min_samples]
+        if warmup:
+            return min(warmup, key=lambda cell: (cell.n + cell.in_flight, self.cost_fn(cell)))
+        best, best_score = None, 0.0
+        for cell in self.cells:
+            if self.satisfied(cell, pooled):
+                continue
+            samples = cell.n + cell.in_flight
+            sd = self._sd(cell, pooled)
+            gain = self._width(cell, samples, sd) - self._width(cell, samples + 1, sd)
+            score = gain / max(self.cost_fn(cell), 1e-9)
+            if best is None or score > best_score:
+                best, best_score = cell, score
+        return best
+
+    def start(self, cell):
+        cell.in_flight += 1
+        cell.sent += 1
+
+    def finish(self, cell):
+        cell.in_flight -= 1
+        self._changed.set()
+
+    async def wait_for_change(self):
+        """等待任一在途请求结束（之后再重新选择单元格）"""
+        self._changed.clear()
+        await self._changed.wait()
+
+    def uniform_estimate(self):
+        """
+        估算均匀分配（每个单元格相同样本数）达到目标精度所需的总样本数：
+        最难的单元格需要的样本数 × 单元格数（用当前的标准差估计）
+        """
+        pooled = self._pooled_sd()
+        needed = []
+        for cell in self.cells:
+            sd = self._sd(cell, pooled)
+            needed.append(max(self.min_samples, math.ceil((2 * cell.stopper.z * sd / self.target_width) ** 2)))
+        return max(needed) * len(self.cells)
+
+
+def build_cells(grid, target_width, confidence, min_samples):
+    """
+    参数:
+        grid: [(上下文长度, 针数, 提示词字节数), ...]
+
+    返回: [SweepCell, ...]
+    """
+    return [SweepCell(length, needles, byte_count, SequentialStopper(target_width, confidence, min_samples))
+            for length, needles, byte_count in grid]
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试直接导入 收集数据/ 下的模块（与脚本在该目录下运行时相同）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+import run_batch_test
+from batch_file import read_batch_results
+from cost_tracker import CostTracker
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'batch')
+RESULTS = os.path.join(FIXTURES, 'results.jsonl')
+RERUN = os.path.join(FIXTURES, 'results_rerun.jsonl')
+TABLE = 'bytes_2358'
+# 导出参数：3个请求，上下文长度2000，8根针，种子35（结果文件中的 custom_id 与之对应）
+EXPORT_ARGS = ['3', '1', '0', '2000', '8', '--seed', '35']
+
+
+def custom_id(request_id):
+    return f"{TABLE}-seed-{run_batch_test.case_seed(35, request_id)}"
+
+
+@pytest.fixture
+def db_manager(monkeypatch, tmp_path):
+    """在临时目录下导出批量请求文件，返回已连接的模型数据库"""
+    monkeypatch.setattr(run_batch_test, 'SCRIPT_DIR', str(tmp_path))
+    monkeypatch.setattr(sys, 'argv', ['run_batch_test.py', *EXPORT_ARGS,
+                                      '--export-batch', str(tmp_path / 'requests.jsonl')])
+    asyncio.run(run_batch_test.main())
+
+    manager = run_batch_test.DatabaseManager(run_batch_test.MODEL_ID, str(tmp_path))
+    manager.connect()
+    yield manager
+    manager.close()
+
+
+def import_file(db_manager, path):
+    tracker = CostTracker(None, None, run_batch_test.ESTIMATED_BYTES_PER_TOKEN,
+                          run_batch_test.ESTIMATED_COMPLETION_TOKENS)
+    return run_batch_test.import_batch(path, db_manager, tracker)
+
+
+def rows(db_manager):
+    return db_manager.conn.execute(
+        f"SELECT standard_json, model_response_json, completion_tokens, elapsed_time FROM {TABLE} ORDER BY id"
+    ).fetchall()
+
+
+def import_statuses(db_manager):
+    return dict(db_manager.conn.execute("SELECT custom_id, import_status FROM batch_jobs").fetchall())
+
+
+def answered_stats(db_manager):
+    return db_manager.conn.execute(
+        "SELECT answered_count, parse_fail_count FROM bytes_stats WHERE byte_count = 2358"
+    ).fetchone()
+
+
+def test_read_batch_results_classifies_lines():
+    items = list(read_batch_results(RESULTS))
+
+    assert [item['line'] for item in items] == [1, 2, 3, 4, 5]
+    assert [item['custom_id'] for item in items] == [custom_id(1), custom_id(2), custom_id(3), f"{TABLE}-seed-99", None]
+    assert items[0]['error'] is None and items[0]['usage']['completion_tokens'] == 40
+    assert items[1]['error'].startswith("HTTP 500: The server had an error")
+    assert items[2]['error'] is None and 'could not find' in items[2]['content']
+    assert items[4]['error'] == "无法解析的行"
+
+
+def test_import_batch(db_manager):
+    counts = import_file(db_manager, RESULTS)
+
+    assert counts == {'success': 1, 'parse_fail': 1, 'failed': 1, 'duplicate': 0, 'unknown': 2}
+    standard_json, response_json, completion_tokens, elapsed_time = rows(db_manager)[0]
+    assert len(rows(db_manager)) == 1
+    assert json.loads(response_json) == {"1": 4470, "2": 9911, "3": 4719, "4": 3424, "5": 8641, "6": 5461, "7": 5432}
+    assert json.loads(standard_json)["8"] == 7232
+    assert completion_tokens == 40
+    # 批量结果没有单次请求耗时
+    assert elapsed_time is None
+    assert import_statuses(db_manager) == {custom_id(1): 'success', custom_id(2): 'failed', custom_id(3): 'parse_fail'}
+    # 已回答 = 成功 + 解析失败；HTTP 错误不计入
+    assert answered_stats(db_manager) == (2, 1)
+
+
+def test_repeated_import_is_idempotent(db_manager):
+    import_file(db_manager, RESULTS)
+    counts = import_file(db_manager, RESULTS)
+
+    assert counts == {'success': 0, 'parse_fail': 0, 'failed': 1, 'duplicate': 2, 'unknown': 2}
+    assert len(rows(db_manager)) == 1
+    assert answered_stats(db_manager) == (2, 1)
+
+
+def test_failed_jobs_can_be_imported_from_rerun(db_manager):
+    import_file(db_manager, RESULTS)
+    counts = import_file(db_manager, RERUN)
+
+    # 之前 HTTP 错误的用例从重跑结果导入；已成功导入的用例不会被覆盖
+    assert counts == {'success': 1, 'parse_fail': 0, 'failed': 0, 'duplicate': 1, 'unknown': 0}
+    responses = [json.loads(response_json) for _, response_json, _, _ in rows(db_manager)]
+    assert responses[1] == json.loads(rows(db_manager)[1][0])
+    assert len(responses) == 2
+    assert import_statuses(db_manager)[custom_id(2)] == 'success'
+    assert answered_stats(db_manager) == (3, 1)
+
+
+def test_line_without_custom_id(db_manager, tmp_path, capsys):
+    path = tmp_path / 'no_custom_id.jsonl'
+    body = {"choices": [{"message": {"role": "assistant", "content": "{\"1\": 1}"}}]}
+    path.write_text(json.dumps({"id": "batch_req_07", "response": {"status_code": 200, "body": body}}) + "\n",
+                    encoding='utf-8')
+    counts = import_file(db_manager, str(path))
+
+    assert counts['unknown'] == 1
+    assert "? 第1行: 缺少 custom_id" in capsys.readouterr().out
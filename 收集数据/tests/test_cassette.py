@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from cassette import CassetteSession, CassetteStore, ReplaySession
+
+
+async def replay(store, case_hash):
+    session = ReplaySession(store, realtime=False)
+    async with session.post("http://unused", case_hash=case_hash) as response:
+        return response.status, response.headers, await response.read()
+
+
+def test_replay_headers_are_case_insensitive(tmp_path):
+    store = CassetteStore(str(tmp_path))
+    store.save('case', 429, {'retry-after': '3', 'Content-Type': 'application/json'}, 0.0, [(0.0, b'{}')])
+
+    status, headers, body = asyncio.run(replay(store, 'case'))
+
+    assert status == 429
+    assert headers.get('Retry-After') == '3'
+    assert headers['content-type'] == 'application/json'
+    assert body == b'{}'
+
+
+def test_replay_missing_cassette_returns_404(tmp_path):
+    status, headers, body = asyncio.run(replay(CassetteStore(str(tmp_path)), 'absent'))
+
+    assert status == 404
+    assert headers.get('Retry-After') is None
+    assert b'absent' in body
+
+
+def test_cassette_session_is_abstract():
+    with pytest.raises(TypeError):
+        CassetteSession()
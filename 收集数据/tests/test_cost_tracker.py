@@ -0,0 +1,38 @@
+import pytest
+
+from cost_tracker import CostTracker
+from hedging import HedgePolicy
+
+PRICE = {'input': 1.0, 'output': 10.0}  # 美元/百万token
+
+
+def test_sent_without_usage_is_billed_for_prompt():
+    """已发出但被取消或超时的请求按预估输入token计费（不含输出token）"""
+    tracker = CostTracker(PRICE, budget=None, bytes_per_token=4, estimated_completion_tokens=2000)
+    reservation = tracker.reserve(4_000_000)
+    assert reservation == pytest.approx(1.0 + 0.02)
+    cost = tracker.settle(reservation, 4_000_000, None, prompt_billed=True, hedge=True)
+    assert cost == pytest.approx(1.0)
+    assert tracker.spent == pytest.approx(1.0)
+    assert tracker.estimated_spent == pytest.approx(1.0)
+    assert tracker.hedge_spent == pytest.approx(1.0)
+    assert tracker.reserved == 0.0
+    assert tracker.requests_with_usage == 0
+
+
+def test_not_sent_is_free():
+    tracker = CostTracker(PRICE, budget=None)
+    reservation = tracker.reserve(4000)
+    assert tracker.settle(reservation, 4000, None) == 0.0
+    assert tracker.spent == 0.0
+
+
+def test_hedge_cost_report():
+    tracker = CostTracker(PRICE, budget=None)
+    usage = {'prompt_tokens': 1_000_000, 'completion_tokens': 0, 'reasoning_tokens': 0, 'cached_tokens': 0}
+    for _ in range(10):
+        tracker.settle(0.0, 4_000_000, usage)
+    tracker.settle(0.0, 4_000_000, None, prompt_billed=True, hedge=True)
+    assert tracker.hedge_spent == pytest.approx(1.0)
+    text = HedgePolicy(95, max_fraction=0.1).describe_cost(tracker.hedge_spent, tracker.spent)
+    assert "为主请求费用的 10.0%" in text
@@ -0,0 +1,50 @@
+import asyncio
+
+from graceful_shutdown import ShutdownController
+from worker_pool import WorkerPool
+
+
+def test_mark_left_merges_consecutive_ids():
+    shutdown = ShutdownController()
+    for request_id in (3, 5, 7):
+        shutdown.mark_left(request_id, 'not_started')
+    shutdown.mark_left(range(9, 10 ** 9, 2), 'not_started')
+    shutdown.mark_left(range(10, 20), 'not_dispatched')
+    shutdown.mark_left(4, 'cancelled')
+
+    assert shutdown.left_jobs == [
+        (range(3, 10 ** 9, 2), 'not_started'),
+        (range(10, 20), 'not_dispatched'),
+        (range(4, 5), 'cancelled'),
+    ]
+    assert shutdown.left_counts() == {'not_started': len(range(3, 10 ** 9, 2)), 'not_dispatched': 10, 'cancelled': 1}
+
+
+def test_drain_keeps_unsent_jobs_as_ranges():
+    """提前停止时，十亿个未派发的请求只记录为少数几段"""
+    total = 10 ** 9
+
+    async def scenario():
+        shutdown = ShutdownController()
+        done = []
+
+        async def handler(request_id):
+            done.append(request_id)
+            if len(done) == 5:
+                shutdown.request_stop()
+            await asyncio.sleep(0)
+
+        pool = WorkerPool(2, handler, range(1, total + 1))
+        pool.start()
+        await shutdown.drain(pool, grace_period=1)
+        return shutdown, done
+
+    shutdown, done = asyncio.run(scenario())
+
+    assert len(shutdown.left_jobs) <= 3
+    handled = set(done)
+    for run, _ in shutdown.left_jobs:
+        assert run.step == 1
+    assert shutdown.left_count + len(handled) == total
+    # 各段与已执行的请求互不重叠，且覆盖其余全部请求
+    assert all(request_id not in run for run, _ in shutdown.left_jobs for request_id in handled)
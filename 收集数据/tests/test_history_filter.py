@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from run_batch_test import DatabaseManager
+
+BYTE_COUNT = 2000
+ANSWER = json.dumps({"1": "a", "2": "b"})
+WRONG = json.dumps({"1": "x", "2": "y"})
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = DatabaseManager('test/model', str(tmp_path))
+    manager.connect()
+    manager.create_table_if_not_exists(BYTE_COUNT)
+    yield manager
+    manager.conn.close()
+
+
+def test_layout_filter(db_manager):
+    """旧记录（NULL）按 standard 计，cache 布局的记录单独统计"""
+    db_manager.insert_result(BYTE_COUNT, ANSWER, ANSWER, 1.0)
+    db_manager.insert_result(BYTE_COUNT, ANSWER, ANSWER, 2.0, layout='standard')
+    db_manager.insert_result(BYTE_COUNT, ANSWER, WRONG, 9.0, layout='cache')
+
+    assert db_manager.get_accuracies(BYTE_COUNT, layout='standard') == [100.0, 100.0]
+    assert db_manager.get_accuracies(BYTE_COUNT, layout='cache') == [0.0]
+    assert len(db_manager.get_accuracies(BYTE_COUNT)) == 3
+    assert db_manager.get_elapsed_times(BYTE_COUNT, layout='standard') == [1.0, 2.0]
+    assert db_manager.get_elapsed_times(BYTE_COUNT, layout='cache') == [9.0]
+    samples = db_manager.get_latency_samples(layout='cache')
+    assert [(byte_count, elapsed) for byte_count, _, elapsed in samples] == [(BYTE_COUNT, 9.0)]
+
+
+def test_old_table_without_variant_columns(db_manager):
+    """缺少 prompt_layout / answer_format 列的旧表全部按 standard / json 计"""
+    db_manager.cursor.execute("""
+        CREATE TABLE bytes_3000 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                 standard_json TEXT, model_response_json TEXT, elapsed_time REAL)
+    """)
+    db_manager.cursor.execute("INSERT INTO bytes_3000 (standard_json, model_response_json, elapsed_time) "
+                              "VALUES (?, ?, ?)", (ANSWER, ANSWER, 3.0))
+    db_manager.conn.commit()
+
+    assert db_manager.get_accuracies(3000, layout='standard') == [100.0]
+    assert db_manager.get_accuracies(3000, layout='cache') == []
+    assert db_manager.get_elapsed_times(3000, layout='standard') == [3.0]
+    assert db_manager.get_elapsed_times(3000, layout='cache') == []
+    assert db_manager.get_elapsed_times(3000, answer_format='json') == [3.0]
+    assert db_manager.get_accuracies(3000, answer_format='array') == []
+
+
+def test_answer_format_filter(db_manager):
+    """旧记录（NULL）按 json 计；布局和格式同时筛选"""
+    db_manager.insert_result(BYTE_COUNT, ANSWER, ANSWER, 1.0)
+    db_manager.insert_result(BYTE_COUNT, ANSWER, WRONG, 2.0, answer_format='csv')
+    db_manager.insert_result(BYTE_COUNT, ANSWER, ANSWER, 3.0, layout='cache', answer_format='csv')
+
+    assert db_manager.get_accuracies(BYTE_COUNT, answer_format='json') == [100.0]
+    assert db_manager.get_elapsed_times(BYTE_COUNT, answer_format='csv') == [2.0, 3.0]
+    assert db_manager.get_elapsed_times(BYTE_COUNT, layout='standard', answer_format='csv') == [2.0]
+    assert db_manager.get_accuracies(BYTE_COUNT, layout='cache', answer_format='json') == []
+    samples = db_manager.get_latency_samples(layout='standard', answer_format='json')
+    assert [elapsed for _, _, elapsed in samples] == [1.0]
+
+
+def test_needles_filter(db_manager):
+    """同一数据表中不同针数的记录分开统计（针数取标准答案的条目数）"""
+    three = json.dumps({"1": "a", "2": "b", "3": "c"})
+    db_manager.insert_result(BYTE_COUNT, ANSWER, ANSWER, 1.0)
+    db_manager.insert_result(BYTE_COUNT, three, json.dumps({"1": "a", "2": "x", "3": "y"}), 2.0)
+
+    assert db_manager.get_accuracies(BYTE_COUNT, needles=2) == [100.0]
+    assert len(db_manager.get_accuracies(BYTE_COUNT, needles=3)) == 1
+    assert db_manager.get_accuracies(BYTE_COUNT, needles=5) == []
@@ -0,0 +1,44 @@
+import asyncio
+
+from key_pool import ApiKey, KeyPool
+
+USAGE = {'prompt_tokens': 300, 'completion_tokens': 200, 'reasoning_tokens': 0, 'cached_tokens': 0}
+
+
+def test_release_survives_cancellation_while_lock_is_held():
+    """归还密钥时锁被占用、随后又被取消，在途计数仍然减少"""
+    async def scenario():
+        pool = KeyPool([ApiKey('k', 'sk', max_concurrent=1)])
+        key = await pool.acquire()
+
+        async def finish_request():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                pool.release(key)
+                await asyncio.sleep(0)
+
+        async with pool._condition:
+            task = asyncio.ensure_future(finish_request())
+            await asyncio.sleep(0)
+            task.cancel()
+            await asyncio.sleep(0)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        assert key.in_flight == 0
+        # 等待中的 acquire 被唤醒后能拿到密钥
+        assert await asyncio.wait_for(pool.acquire(), 1) is key
+
+    asyncio.run(scenario())
+
+
+def test_tpm_bucket_corrected_from_usage():
+    async def scenario():
+        pool = KeyPool([ApiKey('k', 'sk', tpm=1000)])
+        key = await pool.acquire(100)
+        assert round(key.tpm_bucket.level) == 900
+        pool.release(key, success=True, estimated_tokens=100, usage=USAGE)
+        assert round(key.tpm_bucket.level) == 500
+        assert key.usage['actual_tokens'] == 500
+
+    asyncio.run(scenario())
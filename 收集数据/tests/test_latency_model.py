@@ -0,0 +1,25 @@
+import pytest
+
+from latency_model import LatencyModel
+
+
+def fitted_model():
+    model = LatencyModel(min_samples=20, refit_every=1)
+    for i in range(40):
+        model.observe(10000, 8, 10.0 + (i % 5))
+    return model
+
+
+def test_timeouts_raise_predicted_tail():
+    """超时的请求按超时时间计入后，P99 和超时时间不再只由较快的成功请求决定"""
+    model = fitted_model()
+    p99_before = model.predict(10000, 8, 99)
+    for _ in range(4):
+        model.observe(10000, 8, 60.0)
+    assert model.predict(10000, 8, 99) > p99_before
+
+
+def test_timeout_not_below_longest_observed():
+    model = fitted_model()
+    model.observe(10000, 8, 200.0)
+    assert model.timeout_for(10000, 8, default=900, factor=1.0, minimum=1) == pytest.approx(200.0)
@@ -0,0 +1,48 @@
+from run_batch_test import DatabaseManager
+
+MODEL = 'test/model'
+
+
+def test_merge_new_shard_into_old_main(tmp_path):
+    """本数据库的记录表是旧版本创建的（缺少后来新增的列）时，合并分片不丢失这些列的数据"""
+    main_db = DatabaseManager(MODEL, str(tmp_path))
+    main_db.connect()
+    main_db.cursor.execute("""
+        CREATE TABLE unfinished_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            table_name TEXT NOT NULL,
+            request_id INTEGER NOT NULL,
+            case_seed INTEGER,
+            reason TEXT NOT NULL
+        )
+    """)
+    main_db.cursor.execute("""
+        CREATE TABLE batch_jobs (
+            custom_id TEXT PRIMARY KEY,
+            exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            table_name TEXT NOT NULL,
+            byte_count INTEGER NOT NULL,
+            text_file TEXT,
+            request_id INTEGER NOT NULL,
+            case_seed INTEGER NOT NULL,
+            standard_json TEXT NOT NULL,
+            imported_at TIMESTAMP,
+            import_status TEXT
+        )
+    """)
+    main_db.conn.commit()
+
+    shard_db = DatabaseManager(MODEL, str(tmp_path), shard=0)
+    shard_db.connect()
+    shard_db.record_unfinished_jobs('bytes_2000', [(range(5, 96, 10), 5, 'not_dispatched')])
+    shard_db.record_batch_export([('bytes_2000-seed-1', 'bytes_2000', 2000, None, 1, 1, '{}', 'cache', 'csv')])
+    shard_db.close()
+
+    main_db.merge_shard(shard_db.db_filename)
+
+    main_db.cursor.execute("SELECT request_id, last_request_id, request_id_step, reason FROM unfinished_jobs")
+    assert main_db.cursor.fetchall() == [(5, 95, 10, 'not_dispatched')]
+    main_db.cursor.execute("SELECT custom_id, prompt_layout, answer_format FROM batch_jobs")
+    assert main_db.cursor.fetchall() == [('bytes_2000-seed-1', 'cache', 'csv')]
+    main_db.close()
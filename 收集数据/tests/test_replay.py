@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+
+import run_batch_test
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+CASSETTE_DIR = os.path.join(FIXTURES, 'cassette')
+
+# fixtures/cassette 由替身服务录制（4个请求，上下文长度2000，8根针，种子27），以下为录制时入库的结果
+EXPECTED_ROWS = [
+    ('a5da134f9fa6625e',
+     {"1": 8401, "2": 7145, "3": 8762, "4": 4380, "5": 9970, "6": 4660, "7": 2241, "8": 6071},
+     {"1": 8401, "2": 7145, "3": 8762, "4": 4380, "5": 8687, "6": 2241, "7": 6071}, 30),
+    ('fb573ec953484231',
+     {"1": 6988, "2": 1510, "3": 2770, "4": 1992, "5": 3345, "6": 7256, "7": 5783, "8": 4207},
+     {"1": 6988, "2": 1510, "3": 2770, "4": 1992, "5": 3227, "6": 7256, "7": 5783, "8": 4207}, 34),
+    ('170c6db8d1e30656',
+     {"1": 1044, "2": 1775, "3": 8750, "4": 3445, "5": 9852, "6": 1868, "7": 7023, "8": 1358},
+     {"1": 1775, "2": 1044, "3": 3445, "4": 8750, "5": 1868, "6": 7023, "7": 1358}, 30),
+    ('d170af913adea33d',
+     {"1": 9192, "2": 9106, "3": 2582, "4": 2467, "5": 4498, "6": 7024, "7": 3898, "8": 4302},
+     {"1": 9192, "2": 9106, "3": 2582, "4": 2771, "5": 4233, "6": 7024, "7": 4302}, 30),
+]
+EXPECTED_TABLE = 'bytes_2358'
+
+
+def run_main(monkeypatch, script_dir, *args):
+    """在临时目录下运行 run_batch_test.main()（数据库写入 script_dir/数据库/）"""
+    monkeypatch.setattr(run_batch_test, 'SCRIPT_DIR', str(script_dir))
+    monkeypatch.setattr(sys, 'argv', ['run_batch_test.py', *args])
+    asyncio.run(run_batch_test.main())
+
+
+def test_replay_ingests_recorded_answers(monkeypatch, tmp_path):
+    run_main(monkeypatch, tmp_path, '4', '1', '0', '2000', '8', '--replay', CASSETTE_DIR, '--replay-speed', 'fast')
+
+    db_dir = tmp_path / '数据库'
+    # 回放结果只写入单独的回放数据库
+    assert sorted(os.listdir(db_dir)) == ['moonshotai_kimi_k2_5_replay.db']
+    conn = sqlite3.connect(db_dir / 'moonshotai_kimi_k2_5_replay.db')
+    rows = conn.execute(f"""
+        SELECT case_id, standard_json, model_response_json, completion_tokens, prompt_layout, answer_format,
+               elapsed_time
+        FROM {EXPECTED_TABLE} ORDER BY id
+    """).fetchall()
+    stats = conn.execute("SELECT answered_count, parse_fail_count FROM bytes_stats WHERE byte_count = 2358").fetchone()
+    conn.close()
+
+    # 单并发回放，入库顺序与录制时相同
+    assert [(case_id, json.loads(standard), json.loads(response), tokens)
+            for case_id, standard, response, tokens, _, _, _ in rows] == EXPECTED_ROWS
+    assert all(layout == 'standard' and answer_format == 'json' for _, _, _, _, layout, answer_format, _ in rows)
+    assert all(elapsed is not None for *_, elapsed in rows)
+    assert stats == (4, 0)
+
+
+def test_replay_is_repeatable(monkeypatch, tmp_path):
+    """再次回放同一录制追加相同的记录（用例由录制时的种子重新生成，哈希一致）"""
+    for _ in range(2):
+        run_main(monkeypatch, tmp_path, '4', '1', '0', '2000', '8', '--replay', CASSETTE_DIR, '--replay-speed', 'fast')
+
+    conn = sqlite3.connect(tmp_path / '数据库' / 'moonshotai_kimi_k2_5_replay.db')
+    responses = [row[0] for row in conn.execute(f"SELECT model_response_json FROM {EXPECTED_TABLE} ORDER BY id")]
+    conn.close()
+    assert len(responses) == 8
+    assert responses[:4] == responses[4:]
@@ -0,0 +1,29 @@
+import asyncio
+import json
+
+from circuit_breaker import CircuitBreaker
+from control_server import ControlServer
+from request_compression import RequestCompressor
+from request_log import RequestLogging
+
+
+def test_runtime_messages_go_through_the_logger(tmp_path):
+    """熔断器、压缩回退和控制命令的消息经日志队列输出，遵循 --log-level 并写入 --log-file"""
+    log_file = tmp_path / 'run.jsonl'
+    logging_ = RequestLogging('WARNING', log_file=str(log_file), console=False)
+    logging_.start()
+
+    async def scenario():
+        breaker = CircuitBreaker('api', min_requests=2)
+        breaker.record(False, True)
+        breaker.record(False, True)
+
+    asyncio.run(scenario())
+    RequestCompressor('gzip', [(None, 6)]).reject()
+    ControlServer(None, None, None, {})._log("并发数 4 -> 8")  # INFO，低于日志级别
+    logging_.stop()
+
+    entries = [json.loads(line) for line in log_file.read_text(encoding='utf-8').splitlines()]
+    assert [(entry['event'], entry['level']) for entry in entries] == [
+        ('breaker_open', 'WARNING'), ('compression_rejected', 'WARNING')]
+    assert entries[0]['name'] == 'api' and '暂停发送 30 秒' in entries[0]['message']
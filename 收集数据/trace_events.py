@@ -0,0 +1,183 @@
+import json
+import os
+import time
+
+import aiohttp
+
+FLUSH_EVENTS = 1000  # 缓冲多少个事件后写入文件
+HEDGE_TRACK_OFFSET = 1000000000  # 对冲请求的轨道编号 = 请求ID + 此偏移（与主请求分开显示，避免同一轨道上的区间交叠）
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class RequestTrace:
+    """
+    单个请求的时间线（Perfetto 中的一条轨道）；未启用时使用 NULL_TRACE，所有方法都是空操作
+
+    用法:
+        with trace.span('extract'):
+            ...
+        trace.add('prefill', start, trace.now())
+    """
+
+    enabled = False
+
+    def now(self):
+        return 0
+
+    def span(self, name, **args):
+        return _NULL_SPAN
+
+    def add(self, name, start, end, **args):
+        pass
+
+    def hedge(self):
+        """同一请求的对冲请求使用的时间线"""
+        return self
+
+
+NULL_TRACE = RequestTrace()
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'args', 'start')
+
+    def __init__(self, trace, name, args):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        args = self.args
+        if exc_type is not None:
+            args = {**args, 'error': exc_type.__name__}
+        self.trace.add(self.name, self.start, time.perf_counter_ns(), **args)
+        return False
+
+
+class _RecordingTrace(RequestTrace):
+    enabled = True
+
+    def __init__(self, recorder, request_id, track):
+        self.recorder = recorder
+        self.request_id = request_id
+        self.track = track
+
+    def now(self):
+        return time.perf_counter_ns()
+
+    def span(self, name, **args):
+        return _Span(self, name, args)
+
+    def add(self, name, start, end, **args):
+        self.recorder.record(self.track, name, start, end, args)
+
+    def hedge(self):
+        return self.recorder.request(self.request_id, hedge=True)
+
+
+class TraceRecorder:
+    """
+    把每个请求各阶段的耗时写成 Chrome trace-event 格式的 JSON 文件（可用 Perfetto / chrome://tracing 打开）
+    - 每个请求一条轨道（tid=请求ID），阶段为完整事件（ph=X），时间单位微秒
+    - 事件先缓冲在内存中，每 FLUSH_EVENTS 个写一次文件；JSON 数组的结尾 ] 在 close 时写入
+      （trace-event 格式允许缺少结尾，运行中断时已写入的部分仍可打开）
+    - 连接池等待和新建连接通过 aiohttp TraceConfig 记录（trace_request_ctx 为该请求的 RequestTrace）
+
+    参数:
+        path: 输出文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.events = 0
+        self._origin = time.perf_counter_ns()
+        self._buffer = []
+        self._tracks = set()
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write('[\n')
+        self._first = True
+        self._write({'ph': 'M', 'name': 'process_name', 'pid': self.pid, 'tid': 0,
+                     'args': {'name': f"run_batch_test ({self.pid})"}})
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_connection_queued_start.append(self._on_queued_start)
+        self.trace_config.on_connection_queued_end.append(self._on_queued_end)
+        self.trace_config.on_connection_create_start.append(self._on_create_start)
+        self.trace_config.on_connection_create_end.append(self._on_create_end)
+
+    def request(self, request_id, hedge=False):
+        """返回请求 request_id 的 RequestTrace（hedge=True 时为其对冲请求单独的轨道）"""
+        track = request_id + HEDGE_TRACK_OFFSET if hedge else request_id
+        if track not in self._tracks:
+            self._tracks.add(track)
+            label = f"请求 #{request_id}" + ("（对冲）" if hedge else "")
+            self._buffer.append({'ph': 'M', 'name': 'thread_name', 'pid': self.pid, 'tid': track,
+                                 'args': {'name': label}})
+            self._buffer.append({'ph': 'M', 'name': 'thread_sort_index', 'pid': self.pid, 'tid': track,
+                                 'args': {'sort_index': track}})
+        return _RecordingTrace(self, request_id, track)
+
+    def record(self, track, name, start, end, args):
+        event = {'ph': 'X', 'name': name, 'pid': self.pid, 'tid': track,
+                 'ts': (start - self._origin) / 1000, 'dur': (end - start) / 1000}
+        if args:
+            event['args'] = args
+        self._buffer.append(event)
+        self.events += 1
+        if len(self._buffer) >= FLUSH_EVENTS:
+            self.flush()
+
+    def _write(self, event):
+        if not self._first:
+            self._file.write(',\n')
+        self._first = False
+        self._file.write(json.dumps(event, ensure_ascii=False))
+
+    def flush(self):
+        for event in self._buffer:
+            self._write(event)
+        self._buffer.clear()
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.write('\n]\n')
+        self._file.close()
+
+    @staticmethod
+    async def _on_queued_start(session, context, params):
+        context.queued_at = time.perf_counter_ns()
+
+    @staticmethod
+    async def _on_queued_end(session, context, params):
+        trace = context.trace_request_ctx
+        if trace is not None:
+            trace.add('pool_wait', context.queued_at, time.perf_counter_ns())
+
+    @staticmethod
+    async def _on_create_start(session, context, params):
+        context.connect_at = time.perf_counter_ns()
+
+    @staticmethod
+    async def _on_create_end(session, context, params):
+        trace = context.trace_request_ctx
+        if trace is not None:
+            trace.add('connect', context.connect_at, time.perf_counter_ns())
+
+    def print_report(self):
+        print("时间线:")
+        print(f"  {self.events} 个事件已写入 {self.path}（用 https://ui.perfetto.dev 打开）")
@@ -0,0 +1,213 @@
+import asyncio
+import itertools
+from collections import deque
+
+
+def remaining_jobs(source, jobs, taken):
+    """
+    任务来源中尚未派发的部分
+
+    参数:
+        source: 构造时传入的任务来源
+        jobs: 由 source 得到的迭代器（已取出 taken 个任务）
+        taken: 已派发的任务数
+
+    返回: source 为 range 时直接切片（不逐个展开，剩余任务再多也是 O(1)），否则为迭代器中剩余任务的列表
+    """
+    if isinstance(source, range):
+        return source[taken:]
+    return list(jobs)
+
+
+class WorkerPool:
+    """
+    固定数量的工作协程从有界任务队列中取任务执行（替代每个请求一个 Task）：
+    - 派发协程从（可为惰性的）任务迭代器逐个放入有界队列，队列满时等待，内存占用与总请求数无关
+    - 相邻两次派发之间至少间隔 dispatch_delay 秒（错开请求启动时间）
+    - add_job 可在运行中追加任务（如重试），追加的任务优先于队列中的任务执行
+    - stop 后不再派发新任务，工作协程完成手头任务后退出
+    - pause / resume 暂停和恢复取新任务（正在执行的任务不受影响）；resize 在运行中调整工作协程数，
+      减少时多出的工作协程完成手头任务后退出
+
+    参数:
+        worker_count: 工作协程数（即最大并发数）
+        handler: 异步函数 handler(job)
+        jobs: 任务迭代器（如 range(1, N + 1)）
+        dispatch_delay: 相邻两次派发的最小间隔（秒）
+        queue_size: 队列容量（默认等于工作协程数）
+    """
+
+    def __init__(self, worker_count, handler, jobs, dispatch_delay=0.0, queue_size=None):
+        self.worker_count = worker_count
+        self._handler = handler
+        self._source = jobs
+        self._jobs = iter(jobs)
+        self._dispatched = 0  # 已放入队列的任务数
+        self._dispatch_delay = dispatch_delay
+        self._queue = asyncio.Queue(maxsize=queue_size or worker_count)
+        self._extra = deque()
+        self._changed = asyncio.Event()
+        self._stopped = False
+        self._producer_done = False
+        self._producer = None
+        self._dispatching = None  # 已从迭代器取出、正在等待放入队列的任务
+        self._paused = False
+        self._workers = []
+        self._live = 0  # 尚未退出的工作协程数
+        self._finished = asyncio.Event()
+        self.running = {}  # 工作协程 -> 正在执行的任务
+        self.busy = 0
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    @property
+    def paused(self):
+        return self._paused
+
+    @property
+    def queued(self):
+        """已派发但尚未被工作协程取走的任务数"""
+        return self._queue.qsize() + len(self._extra)
+
+    def start(self):
+        self._producer = asyncio.ensure_future(self._produce())
+        self._spawn(self.worker_count)
+
+    def _spawn(self, count):
+        self._live += count
+        self._workers.extend(asyncio.ensure_future(self._work()) for _ in range(count))
+
+    def pause(self):
+        """暂停：工作协程完成手头任务后不再取新任务"""
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+        self._changed.set()
+
+    def resize(self, worker_count):
+        """
+        调整工作协程数（即最大并发数）
+
+        参数:
+            worker_count: 新的工作协程数（>=1）；减少时多出的工作协程完成手头任务后退出，不中断在途任务
+        """
+        if worker_count < 1:
+            raise ValueError("工作协程数至少为1")
+        self.worker_count = worker_count
+        if self._workers and not self._stopped and self._live < worker_count:
+            self._spawn(worker_count - self._live)
+        self._changed.set()
+
+    def add_job(self, job):
+        """运行中追加任务（已停止时忽略）"""
+        if self._stopped:
+            return
+        self._extra.append(job)
+        self._changed.set()
+
+    def stop(self):
+        """停止派发：队列中和尚未派发的任务不再执行（可通过 left_jobs 取回）"""
+        self._stopped = True
+        if self._producer is not None:
+            self._producer.cancel()
+        self._changed.set()
+
+    async def _produce(self):
+        try:
+            first = True
+            for job in self._jobs:
+                self._dispatching = job
+                if not first and self._dispatch_delay > 0:
+                    await asyncio.sleep(self._dispatch_delay)
+                first = False
+                await self._queue.put(job)
+                self._dispatching = None
+                self._dispatched += 1
+                self._changed.set()
+        finally:
+            self._producer_done = True
+            self._changed.set()
+
+    async def _next_job(self):
+        """取下一个任务；没有任务且不会再有任务时返回None"""
+        while not self._stopped:
+            if self._live > self.worker_count:
+                # 已调小工作协程数：多出的工作协程退出
+                return None
+            if not self._paused:
+                if self._extra:
+                    return self._extra.popleft()
+                if not self._queue.empty():
+                    return self._queue.get_nowait()
+            # 派发结束且没有正在执行的任务（不会再有追加任务）时退出
+            if self._producer_done and self.busy == 0 and not self._extra and self._queue.empty():
+                return None
+            self._changed.clear()
+            await self._changed.wait()
+        return None
+
+    async def _work(self):
+        worker = asyncio.current_task()
+        while True:
+            job = await self._next_job()
+            if job is None:
+                self._live -= 1
+                if self._live == 0:
+                    self._finished.set()
+                self._changed.set()
+                return
+            self.busy += 1
+            self.running[worker] = job
+            try:
+                await self._handler(job)
+            except Exception as e:
+                # 单个任务出错不影响工作协程继续取任务
+                print(f"任务 {job} 执行出错: {e}")
+            finally:
+                self.busy -= 1
+                del self.running[worker]
+                self._changed.set()
+
+    async def wait(self, timeout=None):
+        """等待所有工作协程退出；超时返回False"""
+        if not self._workers:
+            return True
+        # resize 可能在等待期间新建工作协程，因此等待"存活数归零"而不是固定的协程列表
+        try:
+            await asyncio.wait_for(self._finished.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def cancel(self):
+        """
+        取消所有工作协程（中断正在执行的任务）
+
+        返回: 被中断的任务列表
+        """
+        self.stop()
+        interrupted = list(self.running.values())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, self._producer, return_exceptions=True)
+        return interrupted
+
+    def left_jobs(self):
+        """
+        停止后尚未执行的任务
+
+        返回: (已进入队列或追加的任务列表, 尚未派发的任务（见 remaining_jobs）)
+        """
+        queued = list(self._extra)
+        self._extra.clear()
+        while not self._queue.empty():
+            queued.append(self._queue.get_nowait())
+        jobs = self._jobs
+        if self._dispatching is not None:
+            # 已从迭代器取出但还没放入队列
+            jobs = itertools.chain([self._dispatching], jobs)
+            self._dispatching = None
+        return queued, remaining_jobs(self._source, jobs, self._dispatched)
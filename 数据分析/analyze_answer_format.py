@@ -0,0 +1,115 @@
+import sqlite3
+import json
+import sys
+import statistics
+from grading_utils import grade_answers
+
+BASELINE_FORMAT = 'json'  # 作为对比基准的回答格式（旧记录没有 answer_format 列，按 json 计）
+
+def get_result_tables(db_path):
+    """返回数据库中的结果表名（bytes_* / tokens_*，不含统计表）"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type='table' AND (name GLOB 'bytes_[0-9]*' OR (name LIKE 'tokens_%' AND name != 'tokens_stats'))
+        ORDER BY name
+    """)
+    tables = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return tables
+
+def load_format_records(db_path, table_name):
+    """
+    按回答格式读取表中的记录
+
+    返回: {回答格式: [(准确率, 输出token数或None, 耗时或None), ...]}（旧表没有 answer_format 列时全部按 json 计）
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    columns = {row[1] for row in cursor.fetchall()}
+    format_column = "answer_format" if 'answer_format' in columns else "NULL"
+    tokens_column = "completion_tokens" if 'completion_tokens' in columns else "NULL"
+    cursor.execute(f"""
+        SELECT {format_column}, standard_json, model_response_json, {tokens_column}, elapsed_time
+        FROM {table_name}
+    """)
+    records = cursor.fetchall()
+    conn.close()
+
+    groups = {}
+    for answer_format, standard_json, model_response_json, completion_tokens, elapsed_time in records:
+        try:
+            grade_result = grade_answers(json.loads(model_response_json), json.loads(standard_json))
+        except Exception:
+            # 跳过解析失败的记录
+            continue
+        groups.setdefault(answer_format or BASELINE_FORMAT, []).append(
+            (grade_result['accuracy'], completion_tokens, elapsed_time))
+    return groups
+
+def summarize(records):
+    """返回一组记录的样本数、平均准确率、平均输出token数、平均和中位耗时（没有数据的项为None）"""
+    tokens = [t for _, t, _ in records if t is not None]
+    elapsed = [e for _, _, e in records if e is not None]
+    return {
+        'count': len(records),
+        'accuracy': statistics.mean(a for a, _, _ in records),
+        'tokens': statistics.mean(tokens) if tokens else None,
+        'elapsed_mean': statistics.mean(elapsed) if elapsed else None,
+        'elapsed_p50': statistics.median(elapsed) if elapsed else None,
+    }
+
+def format_ratio(value, baseline):
+    if value is None or not baseline:
+        return ""
+    return f" ({value / baseline:.2f}x)"
+
+def analyze_answer_format(db_path):
+    """逐表对比不同回答格式（--answer-format）的准确率、输出token数和耗时"""
+    print("=" * 70)
+    print("回答格式对比（按 answer_format 列分组）")
+    print("=" * 70)
+    print(f"数据库: {db_path}")
+    print(f"基准格式: {BASELINE_FORMAT}\n")
+
+    found = False
+    for table_name in get_result_tables(db_path):
+        groups = load_format_records(db_path, table_name)
+        if len(groups) < 2:
+            continue
+        found = True
+        summaries = {answer_format: summarize(records) for answer_format, records in groups.items()}
+        baseline = summaries.get(BASELINE_FORMAT)
+        print(f"表 {table_name}:")
+        for answer_format in sorted(summaries, key=lambda f: (f != BASELINE_FORMAT, f)):
+            s = summaries[answer_format]
+            line = f"  {answer_format:<6} {s['count']:>5} 条, 平均准确率 {s['accuracy']:.2f}%"
+            if s['tokens'] is not None:
+                line += f", 输出token {s['tokens']:.1f}"
+                if baseline is not None and answer_format != BASELINE_FORMAT:
+                    line += format_ratio(s['tokens'], baseline['tokens'])
+            if s['elapsed_mean'] is not None:
+                line += f", 耗时 平均 {s['elapsed_mean']:.2f}秒 / P50 {s['elapsed_p50']:.2f}秒"
+                if baseline is not None and answer_format != BASELINE_FORMAT:
+                    line += format_ratio(s['elapsed_p50'], baseline['elapsed_p50'])
+            print(line)
+            if baseline is not None and answer_format != BASELINE_FORMAT:
+                print(f"         准确率差值 {s['accuracy'] - baseline['accuracy']:+.2f} 个百分点")
+
+    if not found:
+        print("(没有同时包含多种回答格式的表：请用 run_batch_test.py --answer-format 在同样的参数下收集紧凑格式的结果)")
+    print("\n" + "=" * 70)
+
+def main():
+    if len(sys.argv) < 2:
+        print("使用方法:")
+        print("  python analyze_answer_format.py <数据库路径>")
+        print("\n示例:")
+        print("  python analyze_answer_format.py 收集数据/数据库/moonshotai_kimi_k2_5.db")
+        return
+    analyze_answer_format(sys.argv[1])
+
+if __name__ == "__main__":
+    main()
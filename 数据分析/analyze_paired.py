@@ -0,0 +1,129 @@
+import sqlite3
+import json
+import math
+import sys
+import statistics
+from statistics import NormalDist
+from grading_utils import grade_answers
+
+CONFIDENCE = 0.95  # 置信区间的置信水平
+
+def get_result_tables(db_path):
+    """返回数据库中的结果表名（bytes_* / tokens_*，不含统计表）"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type='table' AND (name GLOB 'bytes_[0-9]*' OR (name LIKE 'tokens_%' AND name != 'tokens_stats'))
+    """)
+    tables = {row[0] for row in cursor.fetchall()}
+    conn.close()
+    return tables
+
+def load_case_accuracies(db_path, table_name):
+    """
+    读取表中每个用例（case_id）的准确率；同一用例有多条记录时取平均
+
+    返回: {case_id: 准确率(0-100)}（旧表没有 case_id 列时返回空字典）
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT case_id, standard_json, model_response_json
+            FROM {table_name}
+            WHERE case_id IS NOT NULL
+        """)
+    except sqlite3.OperationalError:
+        conn.close()
+        return {}
+    records = cursor.fetchall()
+    conn.close()
+
+    accuracies = {}
+    for case_id, standard_json, model_response_json in records:
+        try:
+            grade_result = grade_answers(json.loads(model_response_json), json.loads(standard_json))
+        except Exception:
+            # 跳过解析失败的记录
+            continue
+        accuracies.setdefault(case_id, []).append(grade_result['accuracy'])
+    return {case_id: statistics.mean(values) for case_id, values in accuracies.items()}
+
+def paired_summary(baseline, candidate):
+    """
+    对两个模型在相同用例上的准确率做配对比较
+
+    参数:
+        baseline / candidate: {case_id: 准确率}
+
+    返回: dict（配对数不足2时返回None）
+        pairs: 配对用例数
+        baseline_mean / candidate_mean: 两个模型在配对用例上的平均准确率
+        diff_mean: 平均差值（新 - 基准，百分点）
+        paired_half_width: 配对差值的置信区间半宽
+        unpaired_half_width: 同样样本数下按独立样本计算的置信区间半宽（用于对比）
+        wins / ties / losses: 新模型更好 / 相同 / 更差的用例数
+    """
+    case_ids = sorted(set(baseline) & set(candidate))
+    if len(case_ids) < 2:
+        return None
+    a = [baseline[case_id] for case_id in case_ids]
+    b = [candidate[case_id] for case_id in case_ids]
+    diffs = [y - x for x, y in zip(a, b)]
+    n = len(case_ids)
+    z = NormalDist().inv_cdf((1 + CONFIDENCE) / 2)
+    return {
+        'pairs': n,
+        'baseline_mean': statistics.mean(a),
+        'candidate_mean': statistics.mean(b),
+        'diff_mean': statistics.mean(diffs),
+        'paired_half_width': z * statistics.stdev(diffs) / math.sqrt(n),
+        'unpaired_half_width': z * math.sqrt((statistics.variance(a) + statistics.variance(b)) / n),
+        'wins': sum(1 for d in diffs if d > 0),
+        'ties': sum(1 for d in diffs if d == 0),
+        'losses': sum(1 for d in diffs if d < 0),
+    }
+
+def analyze_paired(baseline_db, candidate_db):
+    """逐表输出两个模型数据库在相同用例（按 case_id 关联）上的配对比较"""
+    tables = sorted(get_result_tables(baseline_db) & get_result_tables(candidate_db))
+
+    print("=" * 70)
+    print("配对比较（按 case_id 关联相同用例）")
+    print("=" * 70)
+    print(f"基准: {baseline_db}")
+    print(f"新模型: {candidate_db}")
+    print(f"置信水平: {CONFIDENCE:.0%}\n")
+
+    found = False
+    for table_name in tables:
+        result = paired_summary(load_case_accuracies(baseline_db, table_name),
+                                load_case_accuracies(candidate_db, table_name))
+        if result is None:
+            continue
+        found = True
+        print(f"表 {table_name}: {result['pairs']} 个配对用例")
+        print(f"  平均准确率: 基准 {result['baseline_mean']:.2f}%, 新模型 {result['candidate_mean']:.2f}%")
+        print(f"  差值: {result['diff_mean']:+.2f} ± {result['paired_half_width']:.2f} 个百分点 "
+              f"(独立样本时为 ± {result['unpaired_half_width']:.2f})")
+        if result['paired_half_width'] > 0:
+            ratio = (result['unpaired_half_width'] / result['paired_half_width']) ** 2
+            print(f"  配对的方差缩减: 相当于独立样本的 {ratio:.1f} 倍样本量")
+        print(f"  逐用例: 新模型更好 {result['wins']}, 相同 {result['ties']}, 更差 {result['losses']}")
+
+    if not found:
+        print("(没有可配对的用例：请先用 run_batch_test.py --paired-with 在新模型上回放基准模型的用例)")
+    print("\n" + "=" * 70)
+
+def main():
+    if len(sys.argv) < 3:
+        print("使用方法:")
+        print("  python analyze_paired.py <基准模型数据库路径> <新模型数据库路径>")
+        print("\n示例:")
+        print("  python analyze_paired.py 收集数据/数据库/moonshotai_kimi_k2.db 收集数据/数据库/moonshotai_kimi_k2_5.db")
+        return
+    analyze_paired(sys.argv[1], sys.argv[2])
+
+if __name__ == "__main__":
+    main()
@@ -61,6 +61,10 @@ def extract_json_from_response(response_text):
         print(f"提取JSON失败: {e}")
         return None
 
+def answers_from_sequence(values):
+    """把按出现顺序排列的答案列表（紧凑回答格式）转换为 {"1": 值, "2": 值, ...} 的字典"""
+    return {str(i): value for i, value in enumerate(values, 1)}
+
 def grade_answers(student_answers, standard_answers, allow_transposition=True, order_by_key=True):
     """
     基于编辑距离的评分函数（Edit Distance Scoring, 支持相邻换位）
@@ -70,8 +74,8 @@ def grade_answers(student_answers, standard_answers, allow_transposition=True, o
     - 编辑距离加入相邻换位（Damerau–Levenshtein）
 
     参数:
-        student_answers: 学生答案（dict: 题号 -> 值）
-        standard_answers: 标准答案（dict: 题号 -> 值）
+        student_answers: 学生答案（dict: 题号 -> 值；也可以是按顺序排列的值列表）
+        standard_answers: 标准答案（dict: 题号 -> 值；也可以是按顺序排列的值列表）
         allow_transposition: 是否允许相邻换位，默认 True
         order_by_key: 值序列的生成是否按题号排序（True）；
                       如果想按输入顺序比较，设为 False（依赖JSON加载的插入顺序）
@@ -79,6 +83,12 @@ def grade_answers(student_answers, standard_answers, allow_transposition=True, o
     返回:
         统计字典
     """
+    # 紧凑回答格式（JSON数组 / 逗号分隔）的列表按出现顺序编号
+    if isinstance(student_answers, list):
+        student_answers = answers_from_sequence(student_answers)
+    if isinstance(standard_answers, list):
+        standard_answers = answers_from_sequence(standard_answers)
+
     if not standard_answers:
         return {
             'correct_count': 0,